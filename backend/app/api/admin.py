@@ -0,0 +1,194 @@
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status, Header, UploadFile, File, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from datetime import datetime
+from typing import Optional
+import codecs
+import hmac
+import os
+
+from ..database.config import get_db
+from ..database.catalog import CatalogError, DEFAULT_BATCH_SIZE, detect_format, import_catalog
+from ..database.export import DEFAULT_CHUNK_SIZE, EXPORT_FORMATS, MAX_CHUNK_SIZE, stream_progress
+from ..models import Course
+from ..services import content_versions, course_generation, search
+from ..services.page_cache import course_pages
+from .ai import require_ai_service
+
+router = APIRouter(prefix="/api/admin", tags=["admin"])
+
+ADMIN_API_KEY = os.getenv("ADMIN_API_KEY")
+
+def require_admin(x_admin_key: Optional[str] = Header(None)):
+    """
+    Dependency that only lets requests with the configured X-Admin-Key through
+    """
+    if not ADMIN_API_KEY:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Admin API is disabled. Set ADMIN_API_KEY to enable it."
+        )
+    if not x_admin_key or not hmac.compare_digest(x_admin_key, ADMIN_API_KEY):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid admin key"
+        )
+
+@router.post("/catalog/import", dependencies=[Depends(require_admin)])
+def import_catalog_upload(
+    file: UploadFile = File(...),
+    format: Optional[str] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    db: Session = Depends(get_db)
+):
+    """
+    Import a course/lesson catalog file (JSON, NDJSON or YAML)
+    """
+    try:
+        fmt = format or detect_format(file.filename or "")
+        stream = codecs.getreader("utf-8")(file.file)
+        stats = import_catalog(stream, fmt, db, batch_size)
+        search.invalidate()
+        course_pages.clear()
+
+        return {
+            "success": True,
+            "filename": file.filename,
+            "stats": stats
+        }
+
+    except CatalogError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid catalog: {str(e)}"
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error importing catalog: {str(e)}"
+        )
+
+@router.get("/export/progress", dependencies=[Depends(require_admin)])
+def export_progress(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    course_id: Optional[int] = None,
+    user_id: Optional[str] = None,
+    since: Optional[datetime] = Query(None, description="Last accessed at or after"),
+    until: Optional[datetime] = Query(None, description="Last accessed before"),
+    after_id: Optional[int] = Query(None, description="Resume after this progress id"),
+    chunk_size: int = Query(DEFAULT_CHUNK_SIZE, ge=1, le=MAX_CHUNK_SIZE)
+):
+    """
+    Stream user progress as NDJSON or CSV, ordered by id. The rows are read
+    through a server-side cursor and sent chunk by chunk.
+    """
+    chunks = stream_progress(
+        format, chunk_size, course_id=course_id, user_id=user_id,
+        since=since, until=until, after_id=after_id
+    )
+    filename = f"user_progress.{format}"
+    return StreamingResponse(
+        chunks,
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@router.get("/lessons/{lesson_id}/content/versions", dependencies=[Depends(require_admin)])
+def get_lesson_content_versions(lesson_id: int, db: Session = Depends(get_db)):
+    """
+    List a lesson's current and archived content versions, newest first
+    """
+    try:
+        return {
+            "success": True,
+            "lesson_id": lesson_id,
+            "versions": content_versions.list_versions(db, lesson_id)
+        }
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error listing content versions: {str(e)}"
+        )
+
+@router.post("/lessons/{lesson_id}/content/rollback", dependencies=[Depends(require_admin)])
+def rollback_lesson_content(lesson_id: int, version: int, db: Session = Depends(get_db)):
+    """
+    Restore an archived content version and pin it against automatic regeneration
+    """
+    try:
+        content = content_versions.rollback(db, lesson_id, version)
+        return {
+            "success": True,
+            "lesson_id": lesson_id,
+            "version": content.version,
+            "pinned": content.pinned
+        }
+
+    except LookupError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error rolling back lesson content: {str(e)}"
+        )
+
+@router.post("/lessons/{lesson_id}/content/regenerate", dependencies=[Depends(require_admin)])
+def regenerate_lesson_content(lesson_id: int, background_tasks: BackgroundTasks):
+    """
+    Regenerate a lesson's content in the background, replacing a pinned version too
+    """
+    queued = content_versions.regenerator.schedule(background_tasks, lesson_id, "manual")
+    return {
+        "success": True,
+        "lesson_id": lesson_id,
+        "queued": queued
+    }
+
+@router.post(
+    "/courses/{course_id}/generate",
+    status_code=status.HTTP_202_ACCEPTED,
+    dependencies=[Depends(require_admin), Depends(require_ai_service)]
+)
+def generate_course_content(
+    course_id: int,
+    background_tasks: BackgroundTasks,
+    regenerate: bool = False,
+    db: Session = Depends(get_db)
+):
+    """
+    Start generating every lesson of a course that has no content yet (all of
+    them with ``regenerate``) in batched model calls. A course that is already
+    being generated returns its running run instead of starting another.
+    """
+    if db.query(Course.id).filter(Course.id == course_id).first() is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Course not found"
+        )
+    run, queued = course_generation.course_runs.start(background_tasks, course_id, regenerate)
+    return {
+        "success": True,
+        "queued": queued,
+        "run": run
+    }
+
+@router.get("/courses/generate/{run_id}", dependencies=[Depends(require_admin)])
+def get_course_generation_run(run_id: str):
+    """
+    Status of a course generation run, with its report once it has completed
+    """
+    run = course_generation.course_runs.get(run_id)
+    if run is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Course generation run not found"
+        )
+    return {
+        "success": True,
+        "run": run
+    }
@@ -1,20 +1,53 @@
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status, BackgroundTasks, Response, WebSocket
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
 from typing import Optional, Dict, Any
-import json
 from datetime import datetime
 
-from ..database.config import get_db
+from ..database.config import SessionLocal, get_db
+from ..database.replicas import CONSISTENCY_HEADER, get_read_db, record_write
+from ..database import rollups
 from ..models import Course, Lesson, LessonContent, UserProgress
-from ..services.ai_service import AIService
+from ..services.ai_service import AIService, get_ai_service
+from ..services import metrics
+from ..services.content_versions import cache_lesson_content, lesson_inputs, parse_lesson_content, revalidate
+from ..services.page_cache import course_pages
+from ..services.prefetch import prefetcher
+from ..services.progress_channel import add_time_spent, lesson_course, progress_channel
+from ..services.quotas import QuotaCharge, QuotaExceeded, client_ip, quota_ledger
+from ..services.tracing import traced
 
 router = APIRouter(prefix="/api/ai", tags=["ai"])
-ai_service = AIService()
+
+def require_ai_service() -> AIService:
+    """
+    Dependency returning the lazily built AIService, or 503 when it is not configured
+    """
+    try:
+        return get_ai_service()
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"AI service unavailable: {str(e)}"
+        )
 
 class GenerateLessonRequest(BaseModel):
     user_id: Optional[str] = "anonymous"
 
+async def admit_generation(user_id: Optional[str], http_request: Request) -> QuotaCharge:
+    """
+    Charge a model call to the caller's generation quotas, or 429 when one has run out
+    """
+    try:
+        return await quota_ledger.admit(user_id, client_ip(http_request))
+    except QuotaExceeded as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
 class UpdateProgressRequest(BaseModel):
     user_id: str
     completion_percentage: int = 0
@@ -25,7 +58,9 @@ class UpdateProgressRequest(BaseModel):
 async def generate_lesson_overview(
     lesson_id: int, 
     request: GenerateLessonRequest,
-    db: Session = Depends(get_db)
+    http_request: Request,
+    db: Session = Depends(get_db),
+    ai_service: AIService = Depends(require_ai_service)
 ):
     """
     Generate AI-powered lesson overview and introduction
@@ -44,24 +79,30 @@ async def generate_lesson_overview(
             )
         
         course = lesson.course
+        lesson_data = {
+            "id": lesson.id,
+            "title": lesson.title,
+            "description": lesson.description,
+            "course_title": course.title,
+            "estimated_duration": lesson.estimated_duration,
+            "learning_objectives": lesson.objectives
+        }
+        
+        # Return the connection to the pool while waiting on the model
+        db.close()
         
         # Generate overview using AI
+        charge = await admit_generation(request.user_id, http_request)
         result = await ai_service.generate_lesson_overview(
-            course_title=course.title,
-            lesson_title=lesson.title,
-            lesson_description=lesson.description
+            course_title=lesson_data["course_title"],
+            lesson_title=lesson_data["title"],
+            lesson_description=lesson_data["description"]
         )
+        await charge.add_tokens(result.get("usage"))
         
         return {
             "success": True,
-            "lesson": {
-                "id": lesson.id,
-                "title": lesson.title,
-                "description": lesson.description,
-                "course_title": course.title,
-                "estimated_duration": lesson.estimated_duration,
-                "learning_objectives": json.loads(lesson.learning_objectives) if lesson.learning_objectives else []
-            },
+            "lesson": lesson_data,
             "overview": result["overview"],
             "ai_generated": result["success"]
         }
@@ -78,8 +119,10 @@ async def generate_lesson_overview(
 async def generate_lesson_content(
     lesson_id: int,
     request: GenerateLessonRequest,
+    http_request: Request,
     background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    ai_service: AIService = Depends(require_ai_service)
 ):
     """
     Generate full AI-powered lesson content
@@ -102,19 +145,15 @@ async def generate_lesson_content(
             LessonContent.lesson_id == lesson_id
         ).first()
         
+        metrics.record_cache_lookup(hit=existing_content is not None)
+        prefetcher.schedule(background_tasks, lesson_id)
+        
         if existing_content:
             # Return existing content
-            try:
-                parsed_content = json.loads(existing_content.ai_generated_content)
-            except (json.JSONDecodeError, TypeError):
-                # If parsing fails, treat as raw content
-                parsed_content = {
-                    "introduction": existing_content.content_summary or "Lesson content",
-                    "main_content": [{"section_title": "Content", "content": existing_content.ai_generated_content}],
-                    "code_examples": json.loads(existing_content.code_examples) if existing_content.code_examples else [],
-                    "key_takeaways": json.loads(existing_content.key_concepts) if existing_content.key_concepts else [],
-                    "practice_exercises": json.loads(existing_content.exercises) if existing_content.exercises else []
-                }
+            prefetcher.record_use(lesson_id)
+            parsed_content = parse_lesson_content(existing_content)
+            # Serve it even if out of date; a background regeneration replaces it
+            stale_reason = revalidate(background_tasks, lesson, existing_content)
             
             return {
                 "success": True,
@@ -125,53 +164,60 @@ async def generate_lesson_content(
                 },
                 "content": parsed_content,
                 "cached": True,
+                "version": existing_content.version,
+                "stale": stale_reason is not None,
                 "generated_at": existing_content.generated_at
             }
         
         course = lesson.course
-        learning_objectives = json.loads(lesson.learning_objectives) if lesson.learning_objectives else []
-        
-        # Generate content using AI
-        result = await ai_service.generate_lesson_content(
-            course_title=course.title,
-            lesson_title=lesson.title,
-            lesson_description=lesson.description,
-            learning_objectives=learning_objectives,
-            estimated_duration=lesson.estimated_duration
-        )
+        course_id = course.id
+        lesson_data = {
+            "id": lesson.id,
+            "title": lesson.title,
+            "course_title": course.title
+        }
+        inputs = lesson_inputs(lesson)
         
-        if not result["success"]:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"AI content generation failed: {result.get('error', 'Unknown error')}"
-            )
+        # Return the connection to the pool while waiting on the model
+        db.close()
         
-        # Cache the generated content in database
-        background_tasks.add_task(
-            cache_lesson_content, 
-            db, 
-            lesson_id, 
-            result["content"], 
-            result["raw_content"]
-        )
+        # A running prefetch of this lesson already caches its result
+        result = await prefetcher.join(lesson_id)
+        if result is None:
+            # Generate content using AI
+            charge = await admit_generation(request.user_id, http_request)
+            result = await ai_service.generate_lesson_content(**inputs)
+            await charge.add_tokens(result.get("usage"))
+            
+            if not result["success"]:
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail=f"AI content generation failed: {result.get('error', 'Unknown error')}"
+                )
+            
+            # Cache the generated content in database
+            background_tasks.add_task(
+                cache_lesson_content, 
+                lesson_id, 
+                result["content"], 
+                result["raw_content"],
+                ai_service.lesson_content_fingerprint(**inputs),
+                ai_service.model
+            )
         
         # Initialize user progress if user_id provided
         if request.user_id and request.user_id != "anonymous":
+            record_write(request.user_id)
             background_tasks.add_task(
                 initialize_user_progress,
-                db,
                 request.user_id,
                 lesson_id,
-                course.id
+                course_id
             )
         
         return {
             "success": True,
-            "lesson": {
-                "id": lesson.id,
-                "title": lesson.title,
-                "course_title": course.title
-            },
+            "lesson": lesson_data,
             "content": result["content"],
             "cached": False,
             "generated_at": datetime.now()
@@ -186,9 +232,14 @@ async def generate_lesson_content(
         )
 
 @router.get("/lessons/{lesson_id}/content")
-async def get_cached_lesson_content(lesson_id: int, db: Session = Depends(get_db)):
+async def get_cached_lesson_content(
+    lesson_id: int,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_read_db)
+):
     """
-    Retrieve cached lesson content if available
+    Retrieve cached lesson content if available. Out-of-date content is still
+    returned (``stale: true``) while a background regeneration replaces it.
     """
     try:
         lesson = db.query(Lesson).filter(
@@ -206,6 +257,8 @@ async def get_cached_lesson_content(lesson_id: int, db: Session = Depends(get_db
             LessonContent.lesson_id == lesson_id
         ).first()
         
+        metrics.record_cache_lookup(hit=content is not None)
+        
         if not content:
             return {
                 "success": False,
@@ -213,16 +266,9 @@ async def get_cached_lesson_content(lesson_id: int, db: Session = Depends(get_db
                 "has_content": False
             }
         
-        try:
-            parsed_content = json.loads(content.ai_generated_content)
-        except (json.JSONDecodeError, TypeError):
-            parsed_content = {
-                "introduction": content.content_summary or "Lesson content",
-                "main_content": [{"section_title": "Content", "content": content.ai_generated_content}],
-                "code_examples": json.loads(content.code_examples) if content.code_examples else [],
-                "key_takeaways": json.loads(content.key_concepts) if content.key_concepts else [],
-                "practice_exercises": json.loads(content.exercises) if content.exercises else []
-            }
+        prefetcher.record_use(lesson_id)
+        parsed_content = parse_lesson_content(content)
+        stale_reason = revalidate(background_tasks, lesson, content)
         
         return {
             "success": True,
@@ -233,6 +279,8 @@ async def get_cached_lesson_content(lesson_id: int, db: Session = Depends(get_db
             },
             "content": parsed_content,
             "has_content": True,
+            "version": content.version,
+            "stale": stale_reason is not None,
             "generated_at": content.generated_at
         }
         
@@ -248,6 +296,7 @@ async def get_cached_lesson_content(lesson_id: int, db: Session = Depends(get_db
 async def update_lesson_progress(
     lesson_id: int,
     request: UpdateProgressRequest,
+    response: Response,
     db: Session = Depends(get_db)
 ):
     """
@@ -271,24 +320,33 @@ async def update_lesson_progress(
             UserProgress.lesson_id == lesson_id
         ).first()
         
+        before = rollups.snapshot(progress)
         if not progress:
             progress = UserProgress(
                 user_id=request.user_id,
                 lesson_id=lesson_id,
-                course_id=lesson.course_id
+                course_id=lesson.course_id,
+                completion_percentage=0,
+                time_spent_minutes=0,
+                time_spent_seconds=0
             )
             db.add(progress)
         
         # Update progress
         progress.completion_percentage = min(100, max(0, request.completion_percentage))
-        progress.time_spent_minutes += request.time_spent_minutes
+        add_time_spent(progress, request.time_spent_minutes * 60)
         progress.is_completed = request.is_completed
         progress.last_accessed = datetime.now()
         
         if request.is_completed and not progress.completed_at:
             progress.completed_at = datetime.now()
         
+        rollups.record_progress_change(db, progress.course_id, lesson_id, before, rollups.snapshot(progress))
         db.commit()
+        course_pages.invalidate(lesson.course_id, request.user_id)
+        
+        # Serve this user's next reads from the primary until replicas catch up
+        response.headers[CONSISTENCY_HEADER] = record_write(request.user_id)
         
         return {
             "success": True,
@@ -297,6 +355,7 @@ async def update_lesson_progress(
                 "lesson_id": lesson_id,
                 "completion_percentage": progress.completion_percentage,
                 "time_spent_minutes": progress.time_spent_minutes,
+                "time_spent_seconds": progress.time_spent_seconds,
                 "is_completed": progress.is_completed
             }
         }
@@ -310,49 +369,32 @@ async def update_lesson_progress(
             detail=f"Error updating progress: {str(e)}"
         )
 
-# Background task functions
-def cache_lesson_content(db: Session, lesson_id: int, content: Dict[Any, Any], raw_content: str):
+@router.websocket("/lessons/{lesson_id}/progress/ws")
+async def lesson_progress_channel(
+    websocket: WebSocket,
+    lesson_id: int,
+    user_id: str = Query(..., min_length=1, max_length=255)
+):
     """
-    Cache generated lesson content in database
+    Track time on a lesson from heartbeats over one connection; progress is
+    written in batches (see services.progress_channel)
     """
-    try:
-        # Check if content already exists
-        existing_content = db.query(LessonContent).filter(
-            LessonContent.lesson_id == lesson_id
-        ).first()
-        
-        if existing_content:
-            # Update existing content
-            existing_content.ai_generated_content = raw_content
-            existing_content.content_summary = content.get("introduction", "")[:500]
-            existing_content.key_concepts = json.dumps(content.get("key_takeaways", []))
-            existing_content.code_examples = json.dumps(content.get("code_examples", []))
-            existing_content.exercises = json.dumps(content.get("practice_exercises", []))
-            existing_content.updated_at = datetime.now()
-        else:
-            # Create new content record
-            lesson_content = LessonContent(
-                lesson_id=lesson_id,
-                ai_generated_content=raw_content,
-                content_summary=content.get("introduction", "")[:500],
-                key_concepts=json.dumps(content.get("key_takeaways", [])),
-                code_examples=json.dumps(content.get("code_examples", [])),
-                exercises=json.dumps(content.get("practice_exercises", []))
-            )
-            db.add(lesson_content)
-        
-        db.commit()
-        
-    except Exception as e:
-        print(f"Error caching lesson content: {e}")
-        db.rollback()
-    finally:
-        db.close()
+    await websocket.accept()
+    course_id = await run_in_threadpool(lesson_course, lesson_id)
+    if course_id is None:
+        await websocket.close(code=4404, reason="Lesson not found")
+        return
+    await progress_channel.serve(websocket, user_id, lesson_id, course_id)
 
-def initialize_user_progress(db: Session, user_id: str, lesson_id: int, course_id: int):
+# Background task functions
+# These run after the response is sent and the request session is closed, so
+# each one opens (and closes) its own session.
+@traced("initialize_user_progress")
+def initialize_user_progress(user_id: str, lesson_id: int, course_id: int):
     """
     Initialize user progress tracking for a lesson
     """
+    db = SessionLocal()
     try:
         # Check if progress already exists
         existing_progress = db.query(UserProgress).filter(
@@ -365,10 +407,14 @@ def initialize_user_progress(db: Session, user_id: str, lesson_id: int, course_i
                 user_id=user_id,
                 lesson_id=lesson_id,
                 course_id=course_id,
-                completion_percentage=0
+                completion_percentage=0,
+                time_spent_minutes=0,
+                time_spent_seconds=0
             )
             db.add(progress)
+            rollups.record_progress_change(db, course_id, lesson_id, None, rollups.snapshot(progress))
             db.commit()
+            course_pages.invalidate(course_id, user_id)
         
     except Exception as e:
         print(f"Error initializing user progress: {e}")
@@ -0,0 +1,98 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+
+from ..database.replicas import get_read_db
+from ..models import Course, Lesson, LessonProgressDaily, LessonProgressRollup
+from .admin import require_admin
+
+router = APIRouter(prefix="/api/analytics", tags=["analytics"], dependencies=[Depends(require_admin)])
+
+@router.get("/courses/{course_id}")
+async def get_course_analytics(
+    course_id: int,
+    days: int = Query(30, ge=1, le=365),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Per-lesson funnel (learners, completions, drop-off, average time) and the
+    daily activity of a course, read from the precomputed rollups
+    """
+    try:
+        course = db.query(Course.id, Course.title).filter(Course.id == course_id).first()
+        if not course:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Course not found"
+            )
+
+        rows = db.query(
+            Lesson.id,
+            Lesson.title,
+            Lesson.lesson_number,
+            LessonProgressRollup.learners,
+            LessonProgressRollup.completed,
+            LessonProgressRollup.completion_percentage_sum,
+            LessonProgressRollup.time_spent_minutes_sum
+        ).outerjoin(
+            LessonProgressRollup,
+            (LessonProgressRollup.course_id == Lesson.course_id) & (LessonProgressRollup.lesson_id == Lesson.id)
+        ).filter(
+            Lesson.course_id == course_id,
+            Lesson.is_active == True
+        ).order_by(Lesson.lesson_number, Lesson.id).all()
+
+        funnel = []
+        for index, row in enumerate(rows):
+            learners = row.learners or 0
+            next_learners = (rows[index + 1].learners or 0) if index + 1 < len(rows) else None
+            funnel.append({
+                "lesson_id": row.id,
+                "title": row.title,
+                "lesson_number": row.lesson_number,
+                "learners": learners,
+                "completed": row.completed or 0,
+                "completion_rate": round((row.completed or 0) / learners, 4) if learners else 0.0,
+                "avg_completion_percentage": round((row.completion_percentage_sum or 0) / learners, 1) if learners else 0.0,
+                "avg_time_spent_minutes": round((row.time_spent_minutes_sum or 0) / learners, 1) if learners else 0.0,
+                # Share of this lesson's learners who never started the next one
+                "drop_off_rate": round(max(0.0, 1 - next_learners / learners), 4) if learners and next_learners is not None else None
+            })
+
+        since = datetime.now().date() - timedelta(days=days - 1)
+        daily = db.query(
+            LessonProgressDaily.day,
+            LessonProgressDaily.started,
+            LessonProgressDaily.completed,
+            LessonProgressDaily.time_spent_minutes
+        ).filter(
+            LessonProgressDaily.course_id == course_id,
+            LessonProgressDaily.day >= since
+        ).all()
+
+        by_day = {}
+        for row in daily:
+            totals = by_day.setdefault(row.day, {"started": 0, "completed": 0, "time_spent_minutes": 0})
+            totals["started"] += row.started
+            totals["completed"] += row.completed
+            totals["time_spent_minutes"] += row.time_spent_minutes
+
+        return {
+            "success": True,
+            "course": {"id": course.id, "title": course.title},
+            "totals": {
+                "learners": max((lesson["learners"] for lesson in funnel), default=0),
+                "completions": sum(lesson["completed"] for lesson in funnel),
+                "time_spent_minutes": sum(row.time_spent_minutes_sum or 0 for row in rows)
+            },
+            "funnel": funnel,
+            "daily": [{"day": day.isoformat(), **totals} for day, totals in sorted(by_day.items())]
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error retrieving course analytics: {str(e)}"
+        )
@@ -1,44 +1,81 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import exists, func, select
 from sqlalchemy.orm import Session
-from typing import List, Optional
-import json
-from ..database.config import get_db
+from typing import Any, Dict, Optional
+from ..database.pagination import (
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, InvalidPageRequest, SortKey, keyset_page, parse_fields
+)
+from ..database.json_fields import exercise_difficulty_counts
+from ..database.replicas import CONSISTENCY_HEADER, get_read_db
 from ..models import Course, Lesson, LessonContent, UserProgress
+from ..services import offline_bundle
+from ..services.page_cache import course_pages
+from ..services.prefetch import prefetcher
 
 router = APIRouter(prefix="/api", tags=["courses"])
 
+def serialize_lesson(lesson: Lesson) -> Dict[str, Any]:
+    """Fields shared by every lesson listing"""
+    return {
+        "id": lesson.id,
+        "title": lesson.title,
+        "description": lesson.description,
+        "lesson_number": lesson.lesson_number,
+        "estimated_duration": lesson.estimated_duration,
+        "learning_objectives": lesson.objectives
+    }
+
+COURSE_LIST_FIELDS = (
+    "id", "title", "description", "difficulty_level", "estimated_duration", "image_url", "lesson_count", "created_at"
+)
+LESSON_LIST_FIELDS = (
+    "id", "title", "description", "lesson_number", "estimated_duration", "learning_objectives", "created_at", "has_content"
+)
+PROGRESS_LESSON_FIELDS = (
+    "lesson_id", "lesson_title", "is_completed", "completion_percentage", "time_spent_minutes", "time_spent_seconds",
+    "last_accessed"
+)
+
+def invalid_page_request(e: InvalidPageRequest) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
 @router.get("/courses")
-async def get_all_courses(db: Session = Depends(get_db)):
+async def get_all_courses(
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    fields: Optional[str] = None,
+    db: Session = Depends(get_read_db)
+):
     """
-    Retrieve all active courses with basic information
+    Retrieve active courses ordered by id, one keyset page at a time.
+    ``fields=title,lesson_count`` limits the selected columns (id is always included).
     """
     try:
-        courses = db.query(Course).filter(Course.is_active == True).all()
+        selected = parse_fields(fields, COURSE_LIST_FIELDS, required=("id",))
+        columns = [getattr(Course, name) for name in COURSE_LIST_FIELDS if name in selected and name != "lesson_count"]
+        if "lesson_count" in selected:
+            # Correlated count per row of the page instead of one query per course
+            columns.append(
+                select(func.count(Lesson.id))
+                .where(Lesson.course_id == Course.id, Lesson.is_active == True)
+                .correlate(Course)
+                .scalar_subquery()
+                .label("lesson_count")
+            )
         
-        result = []
-        for course in courses:
-            # Count total lessons for each course
-            lesson_count = db.query(Lesson).filter(
-                Lesson.course_id == course.id,
-                Lesson.is_active == True
-            ).count()
-            
-            result.append({
-                "id": course.id,
-                "title": course.title,
-                "description": course.description,
-                "difficulty_level": course.difficulty_level,
-                "estimated_duration": course.estimated_duration,
-                "image_url": course.image_url,
-                "lesson_count": lesson_count,
-                "created_at": course.created_at
-            })
+        query = db.query(*columns).filter(Course.is_active == True)
+        rows, next_cursor = keyset_page(query, [SortKey(Course.id)], cursor, limit)
         
         return {
             "success": True,
-            "courses": result
+            "courses": [dict(row._mapping) for row in rows],
+            "next_cursor": next_cursor,
+            "has_more": next_cursor is not None
         }
         
+    except InvalidPageRequest as e:
+        raise invalid_page_request(e)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -46,7 +83,7 @@ async def get_all_courses(db: Session = Depends(get_db)):
         )
 
 @router.get("/courses/{course_id}")
-async def get_course_details(course_id: int, db: Session = Depends(get_db)):
+async def get_course_details(course_id: int, db: Session = Depends(get_read_db)):
     """
     Get detailed information about a specific course including overview
     """
@@ -62,23 +99,19 @@ async def get_course_details(course_id: int, db: Session = Depends(get_db)):
                 detail="Course not found"
             )
         
-        # Get lessons for this course
-        lessons = db.query(Lesson).filter(
+        # Get lessons for this course, with whether each has cached content
+        lessons = db.query(
+            Lesson, exists().where(LessonContent.lesson_id == Lesson.id).label("has_content")
+        ).filter(
             Lesson.course_id == course_id,
             Lesson.is_active == True
         ).order_by(Lesson.lesson_number).all()
         
         lesson_list = []
-        for lesson in lessons:
-            lesson_list.append({
-                "id": lesson.id,
-                "title": lesson.title,
-                "description": lesson.description,
-                "lesson_number": lesson.lesson_number,
-                "estimated_duration": lesson.estimated_duration,
-                "learning_objectives": json.loads(lesson.learning_objectives) if lesson.learning_objectives else [],
-                "has_content": bool(lesson.lesson_content)
-            })
+        for lesson, has_content in lessons:
+            lesson_data = serialize_lesson(lesson)
+            lesson_data["has_content"] = bool(has_content)
+            lesson_list.append(lesson_data)
         
         return {
             "success": True,
@@ -104,47 +137,65 @@ async def get_course_details(course_id: int, db: Session = Depends(get_db)):
         )
 
 @router.get("/courses/{course_id}/lessons")
-async def get_course_lessons(course_id: int, db: Session = Depends(get_db)):
+async def get_course_lessons(
+    course_id: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    fields: Optional[str] = None,
+    db: Session = Depends(get_read_db)
+):
     """
-    Get all lessons for a specific course
+    Get the lessons of a course in lesson order, one keyset page at a time.
+    ``fields=`` limits the selected columns (id is always included).
     """
     try:
+        selected = parse_fields(fields, LESSON_LIST_FIELDS, required=("id",))
+        
         # Verify course exists
-        course = db.query(Course).filter(
+        course_title = db.query(Course.title).filter(
             Course.id == course_id,
             Course.is_active == True
-        ).first()
+        ).scalar()
         
-        if not course:
+        if course_title is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Course not found"
             )
         
-        lessons = db.query(Lesson).filter(
+        keys = [SortKey(Lesson.lesson_number), SortKey(Lesson.id)]
+        columns = [Lesson.id, Lesson.lesson_number] + [
+            getattr(Lesson, name) for name in LESSON_LIST_FIELDS
+            if name in selected and name not in ("id", "lesson_number", "has_content")
+        ]
+        if "has_content" in selected:
+            columns.append(exists().where(LessonContent.lesson_id == Lesson.id).label("has_content"))
+        
+        query = db.query(*columns).filter(
             Lesson.course_id == course_id,
             Lesson.is_active == True
-        ).order_by(Lesson.lesson_number).all()
+        )
+        rows, next_cursor = keyset_page(query, keys, cursor, limit)
         
         result = []
-        for lesson in lessons:
-            result.append({
-                "id": lesson.id,
-                "title": lesson.title,
-                "description": lesson.description,
-                "lesson_number": lesson.lesson_number,
-                "estimated_duration": lesson.estimated_duration,
-                "learning_objectives": json.loads(lesson.learning_objectives) if lesson.learning_objectives else [],
-                "created_at": lesson.created_at,
-                "has_content": bool(lesson.lesson_content)
-            })
+        for row in rows:
+            lesson_data = {name: value for name, value in row._mapping.items() if name in selected}
+            if "learning_objectives" in lesson_data:
+                lesson_data["learning_objectives"] = lesson_data["learning_objectives"] or []
+            if "has_content" in lesson_data:
+                lesson_data["has_content"] = bool(lesson_data["has_content"])
+            result.append(lesson_data)
         
         return {
             "success": True,
-            "course_title": course.title,
-            "lessons": result
+            "course_title": course_title,
+            "lessons": result,
+            "next_cursor": next_cursor,
+            "has_more": next_cursor is not None
         }
         
+    except InvalidPageRequest as e:
+        raise invalid_page_request(e)
     except HTTPException:
         raise
     except Exception as e:
@@ -153,10 +204,231 @@ async def get_course_lessons(course_id: int, db: Session = Depends(get_db)):
             detail=f"Error retrieving lessons: {str(e)}"
         )
 
+@router.get("/courses/{course_id}/exercises/difficulty")
+async def get_exercise_difficulty(course_id: int, db: Session = Depends(get_read_db)):
+    """Count the course's generated practice exercises by difficulty, computed inside the database"""
+    try:
+        if db.query(Course.id).filter(Course.id == course_id, Course.is_active == True).scalar() is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Course not found"
+            )
+        
+        counts = exercise_difficulty_counts(db, course_id)
+        return {
+            "success": True,
+            "course_id": course_id,
+            "total_exercises": sum(counts.values()),
+            "by_difficulty": dict(sorted(counts.items()))
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error counting exercises: {str(e)}"
+        )
+
+def build_course_bundle(db: Session, course_id: int, user_id: Optional[str]) -> Optional[Dict[str, Any]]:
+    """
+    Course metadata, ordered lessons with content summaries and the user's
+    per-lesson progress in three queries (two without a user). None when the
+    course does not exist.
+    """
+    course = db.query(Course).filter(
+        Course.id == course_id,
+        Course.is_active == True
+    ).first()
+    if not course:
+        return None
+    
+    lessons = db.query(
+        Lesson.id,
+        Lesson.title,
+        Lesson.description,
+        Lesson.lesson_number,
+        Lesson.estimated_duration,
+        Lesson.learning_objectives,
+        LessonContent.id.label("content_id"),
+        LessonContent.content_summary
+    ).outerjoin(
+        LessonContent, LessonContent.lesson_id == Lesson.id
+    ).filter(
+        Lesson.course_id == course_id,
+        Lesson.is_active == True
+    ).order_by(Lesson.lesson_number, Lesson.id).all()
+    
+    progress_by_lesson = {}
+    if user_id:
+        progress_by_lesson = {
+            row.lesson_id: row for row in db.query(
+                UserProgress.lesson_id,
+                UserProgress.is_completed,
+                UserProgress.completion_percentage,
+                UserProgress.time_spent_minutes,
+                UserProgress.time_spent_seconds,
+                UserProgress.last_accessed
+            ).filter(
+                UserProgress.user_id == user_id,
+                UserProgress.course_id == course_id
+            )
+        }
+    
+    lesson_list = []
+    for lesson in lessons:
+        progress = progress_by_lesson.get(lesson.id)
+        lesson_list.append({
+            "id": lesson.id,
+            "title": lesson.title,
+            "description": lesson.description,
+            "lesson_number": lesson.lesson_number,
+            "estimated_duration": lesson.estimated_duration,
+            "learning_objectives": lesson.learning_objectives or [],
+            "has_content": lesson.content_id is not None,
+            "content_summary": lesson.content_summary,
+            "progress": {
+                "is_completed": bool(progress.is_completed),
+                "completion_percentage": progress.completion_percentage or 0,
+                "time_spent_minutes": progress.time_spent_minutes or 0,
+                "time_spent_seconds": progress.time_spent_seconds or 0,
+                "last_accessed": progress.last_accessed
+            } if progress else None
+        })
+    
+    tracked = [lesson["progress"] for lesson in lesson_list if lesson["progress"]]
+    return {
+        "success": True,
+        "course": {
+            "id": course.id,
+            "title": course.title,
+            "description": course.description,
+            "overview": course.overview,
+            "difficulty_level": course.difficulty_level,
+            "estimated_duration": course.estimated_duration,
+            "image_url": course.image_url,
+            "created_at": course.created_at,
+            "lesson_count": len(lesson_list),
+            "lessons": lesson_list
+        },
+        "progress": {
+            "user_id": user_id,
+            "completed_lessons": sum(1 for progress in tracked if progress["is_completed"]),
+            "total_lessons": len(lesson_list),
+            "completion_percentage": round(
+                sum(progress["completion_percentage"] for progress in tracked) / len(lesson_list), 1
+            ) if lesson_list else 0,
+            "time_spent_minutes": sum(progress["time_spent_minutes"] for progress in tracked),
+            "time_spent_seconds": sum(progress["time_spent_seconds"] for progress in tracked)
+        } if user_id else None
+    }
+
+@router.get("/courses/{course_id}/bundle")
+async def get_course_bundle(
+    course_id: int,
+    request: Request,
+    user_id: Optional[str] = None,
+    db: Session = Depends(get_read_db)
+):
+    """
+    Everything the course page needs in one request: the course, its lessons
+    with content summaries and, with ``user_id``, the user's progress. Cached
+    per user for a short time and revalidated with ETag / If-None-Match.
+    """
+    try:
+        try:
+            newer_than = float(request.headers.get(CONSISTENCY_HEADER) or 0) or None
+        except ValueError:
+            newer_than = None
+        
+        page = course_pages.get(course_id, user_id or "", newer_than)
+        if page is None:
+            generation = course_pages.generation(course_id, user_id or "")
+            bundle = build_course_bundle(db, course_id, user_id)
+            if bundle is None:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Course not found"
+                )
+            page = course_pages.put(course_id, user_id or "", bundle, generation)
+        
+        headers = {"ETag": page.etag, "Cache-Control": "private, no-cache"}
+        if request.headers.get("if-none-match") == page.etag:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(content=page.body, media_type="application/json", headers=headers)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error retrieving course bundle: {str(e)}"
+        )
+
+@router.get("/courses/{course_id}/offline")
+def download_course_offline(
+    course_id: int,
+    request: Request,
+    format: str = Query("zip", pattern="^(zip|ndjson)$")
+):
+    """
+    Stream a course and all of its stored lesson content for offline use, as
+    a ZIP archive or NDJSON. The bundle is deterministic, so an interrupted
+    download resumes with Range (and If-Range set to the ETag).
+    """
+    try:
+        manifest = offline_bundle.get_manifest(course_id, format)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error preparing course download: {str(e)}"
+        )
+    if manifest is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Course not found"
+        )
+    
+    headers = {
+        "ETag": manifest.etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "public, no-cache",
+        "Content-Disposition": f'attachment; filename="{manifest.filename}"'
+    }
+    if request.headers.get("if-none-match") == manifest.etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if if_range is None or if_range == manifest.etag:
+        try:
+            byte_range = offline_bundle.parse_range(request.headers.get("range"), manifest.length)
+        except ValueError:
+            return Response(
+                status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                headers={**headers, "Content-Range": f"bytes */{manifest.length}"}
+            )
+    
+    start, end = byte_range or (0, manifest.length - 1)
+    headers["Content-Length"] = str(end - start + 1)
+    if byte_range is not None:
+        headers["Content-Range"] = f"bytes {start}-{end}/{manifest.length}"
+    return StreamingResponse(
+        offline_bundle.stream_bundle(manifest, start, end),
+        status_code=status.HTTP_206_PARTIAL_CONTENT if byte_range is not None else status.HTTP_200_OK,
+        media_type=offline_bundle.BUNDLE_FORMATS[format],
+        headers=headers
+    )
+
 @router.get("/lessons/{lesson_id}")
-async def get_lesson_details(lesson_id: int, db: Session = Depends(get_db)):
+async def get_lesson_details(
+    lesson_id: int,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_read_db)
+):
     """
-    Get detailed information about a specific lesson
+    Get detailed information about a specific lesson and start generating the
+    next lesson's content in the background
     """
     try:
         lesson = db.query(Lesson).filter(
@@ -173,24 +445,19 @@ async def get_lesson_details(lesson_id: int, db: Session = Depends(get_db)):
         # Get course information
         course = lesson.course
         
-        result = {
-            "id": lesson.id,
-            "title": lesson.title,
-            "description": lesson.description,
-            "lesson_number": lesson.lesson_number,
-            "estimated_duration": lesson.estimated_duration,
-            "learning_objectives": json.loads(lesson.learning_objectives) if lesson.learning_objectives else [],
-            "course": {
-                "id": course.id,
-                "title": course.title
-            },
-            "has_generated_content": bool(lesson.lesson_content)
+        result = serialize_lesson(lesson)
+        result["course"] = {
+            "id": course.id,
+            "title": course.title
         }
+        result["has_generated_content"] = bool(lesson.lesson_content)
         
         # If lesson content exists, include summary
         if lesson.lesson_content:
             result["content_summary"] = lesson.lesson_content.content_summary
         
+        prefetcher.schedule(background_tasks, lesson_id)
+        
         return {
             "success": True,
             "lesson": result
@@ -205,53 +472,83 @@ async def get_lesson_details(lesson_id: int, db: Session = Depends(get_db)):
         )
 
 @router.get("/user/{user_id}/progress")
-async def get_user_progress(user_id: str, db: Session = Depends(get_db)):
+async def get_user_progress(
+    user_id: str,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    fields: Optional[str] = None,
+    db: Session = Depends(get_read_db)
+):
     """
-    Get user's learning progress across all courses
+    Get user's learning progress, most recently accessed lessons first, one
+    keyset page at a time and grouped by course. Course totals always cover
+    all of the user's lessons in that course, not just this page.
     """
     try:
-        progress_records = db.query(UserProgress).filter(
-            UserProgress.user_id == user_id
-        ).all()
+        selected = parse_fields(fields, PROGRESS_LESSON_FIELDS, required=("lesson_id",))
+        
+        keys = [SortKey(UserProgress.last_accessed, descending=True), SortKey(UserProgress.id, descending=True)]
+        columns = [
+            UserProgress.id,
+            UserProgress.last_accessed,
+            UserProgress.lesson_id,
+            UserProgress.course_id,
+            Course.title.label("course_title")
+        ] + [
+            getattr(UserProgress, name) for name in PROGRESS_LESSON_FIELDS
+            if name in selected and name not in ("lesson_id", "lesson_title", "last_accessed")
+        ]
+        query = db.query(*columns).join(Course, Course.id == UserProgress.course_id)
+        if "lesson_title" in selected:
+            query = query.add_columns(Lesson.title.label("lesson_title")).join(Lesson, Lesson.id == UserProgress.lesson_id)
+        query = query.filter(UserProgress.user_id == user_id)
+        
+        rows, next_cursor = keyset_page(query, keys, cursor, limit)
         
         # Group by course
         course_progress = {}
-        for record in progress_records:
-            course_id = record.course_id
+        for row in rows:
+            course_id = row.course_id
             if course_id not in course_progress:
                 course_progress[course_id] = {
                     "course_id": course_id,
-                    "course_title": record.course.title,
+                    "course_title": row.course_title,
                     "lessons": [],
                     "total_completion": 0,
                     "total_time_spent": 0
                 }
             
             course_progress[course_id]["lessons"].append({
-                "lesson_id": record.lesson_id,
-                "lesson_title": record.lesson.title,
-                "is_completed": record.is_completed,
-                "completion_percentage": record.completion_percentage,
-                "time_spent_minutes": record.time_spent_minutes,
-                "last_accessed": record.last_accessed
+                name: getattr(row, name) for name in PROGRESS_LESSON_FIELDS if name in selected
             })
-            
-            course_progress[course_id]["total_time_spent"] += record.time_spent_minutes
         
-        # Calculate overall completion percentages
-        for course_id, data in course_progress.items():
-            if data["lessons"]:
-                avg_completion = sum(lesson["completion_percentage"] for lesson in data["lessons"]) / len(data["lessons"])
-                data["total_completion"] = round(avg_completion, 1)
+        # Course totals in one grouped query for the courses on this page
+        if course_progress:
+            totals = db.query(
+                UserProgress.course_id,
+                func.avg(UserProgress.completion_percentage),
+                func.sum(UserProgress.time_spent_minutes)
+            ).filter(
+                UserProgress.user_id == user_id,
+                UserProgress.course_id.in_(list(course_progress))
+            ).group_by(UserProgress.course_id).all()
+            
+            for course_id, avg_completion, time_spent in totals:
+                course_progress[course_id]["total_completion"] = round(float(avg_completion or 0), 1)
+                course_progress[course_id]["total_time_spent"] = int(time_spent or 0)
         
         return {
             "success": True,
             "user_id": user_id,
-            "progress": list(course_progress.values())
+            "progress": list(course_progress.values()),
+            "next_cursor": next_cursor,
+            "has_more": next_cursor is not None
         }
         
+    except InvalidPageRequest as e:
+        raise invalid_page_request(e)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error retrieving user progress: {str(e)}"
-        )
\ No newline at end of file
+        )
@@ -0,0 +1,30 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.orm import Session
+
+from ..database.replicas import get_read_db
+from ..services.recommendations import recommender
+
+router = APIRouter(prefix="/api", tags=["recommendations"])
+
+@router.get("/user/{user_id}/recommendations")
+def get_recommendations(
+    user_id: str,
+    limit: int = Query(10, ge=1, le=50),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Recommend the next lessons for a user from their progress history and
+    lesson similarity (lessons already completed are never recommended)
+    """
+    try:
+        return {
+            "success": True,
+            "user_id": user_id,
+            "recommendations": recommender.recommend(db, user_id, limit)
+        }
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error generating recommendations: {str(e)}"
+        )
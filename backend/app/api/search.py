@@ -0,0 +1,39 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.orm import Session
+from typing import Optional
+import time
+
+from ..database.replicas import get_read_db
+from ..services import search as search_service
+
+router = APIRouter(prefix="/api", tags=["search"])
+
+@router.get("/search")
+def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    type: Optional[str] = Query(None, pattern="^(course|lesson)$"),
+    limit: int = Query(20, ge=1, le=50),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Ranked full-text search over courses and lessons (titles, descriptions,
+    overviews, learning objectives and generated key concepts). Every term must
+    match; the last term also matches as a prefix.
+    """
+    try:
+        start = time.perf_counter()
+        results = search_service.search(db, q, type, limit)
+
+        return {
+            "success": True,
+            "query": q,
+            "results": results,
+            "backend": search_service.backend.name,
+            "took_ms": round((time.perf_counter() - start) * 1000, 2)
+        }
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error searching: {str(e)}"
+        )
@@ -0,0 +1,350 @@
+"""
+Streaming, idempotent importer for course and lesson catalogs.
+
+Catalogs are JSON, NDJSON or YAML. A course record carries a stable ``slug``
+(derived from the title when omitted) and may nest its ``lessons``; in NDJSON
+a line can also be a single lesson with a ``course_slug``. Records are read
+one at a time, grouped into batches and written with bulk INSERT/UPDATE
+statements keyed by slug. Every row stores a hash of its catalog fields, so
+re-importing the same catalog writes nothing and an edited catalog only
+touches the rows that changed. Rows missing from a catalog are left alone.
+
+    python -m app.database.catalog catalogs/courses.ndjson --batch-size 2000
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import time
+from typing import IO, Any, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import insert, inspect, select, text, update
+from sqlalchemy.orm import Session
+
+from .config import SessionLocal, engine
+from ..models import Course, Lesson
+
+DEFAULT_CATALOG_PATH = os.path.join(os.path.dirname(__file__), "default_catalog.json")
+DEFAULT_BATCH_SIZE = 1000
+
+FORMATS = {".ndjson": "ndjson", ".jsonl": "ndjson", ".json": "json", ".yaml": "yaml", ".yml": "yaml"}
+
+class CatalogError(ValueError):
+    """Raised for malformed catalog files or records"""
+
+def slugify(value: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", value.lower()).strip("-")
+
+def detect_format(filename: str) -> str:
+    extension = os.path.splitext(filename)[1].lower()
+    if extension not in FORMATS:
+        raise CatalogError(f"Cannot infer catalog format from '{filename}'; use one of {', '.join(FORMATS)}")
+    return FORMATS[extension]
+
+def _expand(record: Dict[str, Any]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Split a course record with nested lessons into individual records"""
+    if not isinstance(record, dict):
+        raise CatalogError(f"Catalog records must be objects, got {type(record).__name__}")
+    if "course_slug" in record:
+        yield "lesson", record
+        return
+    course = {key: value for key, value in record.items() if key != "lessons"}
+    yield "course", course
+    if not course.get("title"):
+        return
+    course_slug = course.get("slug") or slugify(course["title"])
+    for lesson in record.get("lessons") or []:
+        yield "lesson", {**lesson, "course_slug": course_slug}
+
+def _expand_document(document: Any) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    if isinstance(document, dict):
+        courses, lessons = document.get("courses") or [], document.get("lessons") or []
+    else:
+        courses, lessons = document or [], []
+    for record in courses:
+        yield from _expand(record)
+    for record in lessons:
+        yield "lesson", record
+
+def iter_catalog(stream: IO[str], fmt: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Yield ``("course" | "lesson", record)`` pairs. NDJSON is read line by line;
+    JSON and YAML documents are parsed whole and then expanded lazily.
+    """
+    if fmt == "ndjson":
+        for line_number, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise CatalogError(f"Line {line_number}: {e}")
+            yield from _expand(record)
+    elif fmt == "json":
+        try:
+            document = json.load(stream)
+        except json.JSONDecodeError as e:
+            raise CatalogError(f"Invalid JSON catalog: {e}")
+        yield from _expand_document(document)
+    elif fmt == "yaml":
+        try:
+            import yaml
+        except ImportError:
+            raise CatalogError("PyYAML is required to import YAML catalogs (pip install pyyaml)")
+        yield from _expand_document(yaml.safe_load(stream))
+    else:
+        raise CatalogError(f"Unsupported catalog format: {fmt}")
+
+def _row_hash(row: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(row, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def _course_row(record: Dict[str, Any]) -> Dict[str, Any]:
+    if not record.get("title"):
+        raise CatalogError(f"Course is missing a title: {record.get('slug', record)}")
+    row = {
+        "slug": record.get("slug") or slugify(record["title"]),
+        "title": record["title"],
+        "description": record.get("description") or "",
+        "overview": record.get("overview") or record.get("description") or "",
+        "difficulty_level": record.get("difficulty_level") or "Beginner",
+        "estimated_duration": record.get("estimated_duration"),
+        "image_url": record.get("image_url"),
+        "is_active": bool(record.get("is_active", True))
+    }
+    row["content_hash"] = _row_hash(row)
+    return row
+
+def _objectives_list(objectives: Any) -> List[str]:
+    """Objectives as a list; a string is either a JSON list or a single objective"""
+    if not isinstance(objectives, str):
+        return list(objectives)
+    try:
+        decoded = json.loads(objectives)
+    except ValueError:
+        return [objectives]
+    return decoded if isinstance(decoded, list) else [objectives]
+
+def _lesson_row(record: Dict[str, Any]) -> Dict[str, Any]:
+    if not record.get("title") or record.get("lesson_number") is None:
+        raise CatalogError(f"Lesson needs a title and lesson_number: {record.get('slug', record)}")
+    objectives = record.get("learning_objectives") or []
+    row = {
+        "slug": record.get("slug") or slugify(record["title"]),
+        "title": record["title"],
+        "description": record.get("description"),
+        "lesson_number": int(record["lesson_number"]),
+        "estimated_duration": record.get("estimated_duration"),
+        # Hashed in the JSON-string form the column used to hold, so existing hashes still match
+        "learning_objectives": objectives if isinstance(objectives, str) else json.dumps(objectives),
+        "is_active": bool(record.get("is_active", True))
+    }
+    row["content_hash"] = _row_hash(row)
+    row["learning_objectives"] = _objectives_list(objectives)
+    row["course_slug"] = record["course_slug"]
+    return row
+
+class CatalogImporter:
+    """Accumulates catalog records and writes them in batches"""
+
+    def __init__(self, db: Session, batch_size: int = DEFAULT_BATCH_SIZE):
+        self.db = db
+        self.batch_size = batch_size
+        self.stats = {
+            "courses": {"inserted": 0, "updated": 0, "unchanged": 0},
+            "lessons": {"inserted": 0, "updated": 0, "unchanged": 0}
+        }
+        self._courses: Dict[str, Dict[str, Any]] = {}
+        self._lessons: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._course_ids: Dict[str, int] = {}
+
+    def add(self, kind: str, record: Dict[str, Any]) -> None:
+        if kind == "course":
+            row = _course_row(record)
+            self._courses[row["slug"]] = row
+            if len(self._courses) >= self.batch_size:
+                self._flush_courses()
+        else:
+            row = _lesson_row(record)
+            self._lessons[(row["course_slug"], row["slug"])] = row
+            if len(self._lessons) >= self.batch_size:
+                self._flush_lessons()
+
+    def finish(self) -> Dict[str, Dict[str, int]]:
+        self._flush_lessons()
+        self._flush_courses()
+        return self.stats
+
+    def _flush_courses(self) -> None:
+        if not self._courses:
+            return
+        rows = list(self._courses.values())
+        self._courses.clear()
+
+        existing = {
+            slug: (course_id, content_hash)
+            for course_id, slug, content_hash in self.db.execute(
+                select(Course.id, Course.slug, Course.content_hash).where(Course.slug.in_([row["slug"] for row in rows]))
+            )
+        }
+        new_rows = [row for row in rows if row["slug"] not in existing]
+        changed_rows = [
+            {"id": existing[row["slug"]][0], **row}
+            for row in rows
+            if row["slug"] in existing and existing[row["slug"]][1] != row["content_hash"]
+        ]
+        for slug, (course_id, _) in existing.items():
+            self._course_ids[slug] = course_id
+
+        if new_rows:
+            self.db.execute(insert(Course), new_rows)
+            for course_id, slug in self.db.execute(
+                select(Course.id, Course.slug).where(Course.slug.in_([row["slug"] for row in new_rows]))
+            ):
+                self._course_ids[slug] = course_id
+        if changed_rows:
+            self.db.execute(update(Course), changed_rows)
+        self.db.commit()
+
+        self.stats["courses"]["inserted"] += len(new_rows)
+        self.stats["courses"]["updated"] += len(changed_rows)
+        self.stats["courses"]["unchanged"] += len(rows) - len(new_rows) - len(changed_rows)
+
+    def _resolve_course_ids(self, slugs: List[str]) -> None:
+        missing = [slug for slug in slugs if slug not in self._course_ids]
+        if not missing:
+            return
+        for course_id, slug in self.db.execute(select(Course.id, Course.slug).where(Course.slug.in_(missing))):
+            self._course_ids[slug] = course_id
+        unknown = [slug for slug in missing if slug not in self._course_ids]
+        if unknown:
+            raise CatalogError(f"Lessons reference unknown courses: {', '.join(sorted(unknown)[:10])}")
+
+    def _flush_lessons(self) -> None:
+        if not self._lessons:
+            return
+        # Lessons may belong to courses that are still buffered
+        self._flush_courses()
+        rows = list(self._lessons.values())
+        self._lessons.clear()
+
+        self._resolve_course_ids(list({row["course_slug"] for row in rows}))
+        for row in rows:
+            row["course_id"] = self._course_ids[row.pop("course_slug")]
+
+        existing = {
+            (course_id, slug): (lesson_id, content_hash)
+            for lesson_id, course_id, slug, content_hash in self.db.execute(
+                select(Lesson.id, Lesson.course_id, Lesson.slug, Lesson.content_hash).where(
+                    Lesson.course_id.in_({row["course_id"] for row in rows}),
+                    Lesson.slug.in_({row["slug"] for row in rows})
+                )
+            )
+        }
+        new_rows, changed_rows = [], []
+        for row in rows:
+            current = existing.get((row["course_id"], row["slug"]))
+            if current is None:
+                new_rows.append(row)
+            elif current[1] != row["content_hash"]:
+                changed_rows.append({"id": current[0], **row})
+
+        if new_rows:
+            self.db.execute(insert(Lesson), new_rows)
+        if changed_rows:
+            self.db.execute(update(Lesson), changed_rows)
+        self.db.commit()
+
+        self.stats["lessons"]["inserted"] += len(new_rows)
+        self.stats["lessons"]["updated"] += len(changed_rows)
+        self.stats["lessons"]["unchanged"] += len(rows) - len(new_rows) - len(changed_rows)
+
+def import_catalog(
+    stream: IO[str],
+    fmt: str,
+    db: Optional[Session] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE
+) -> Dict[str, Any]:
+    """Import a catalog stream and return insert/update/unchanged counts"""
+    owns_session = db is None
+    db = db or SessionLocal()
+    start = time.perf_counter()
+    try:
+        importer = CatalogImporter(db, batch_size)
+        for kind, record in iter_catalog(stream, fmt):
+            importer.add(kind, record)
+        stats = importer.finish()
+        return {**stats, "elapsed_seconds": round(time.perf_counter() - start, 3)}
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        if owns_session:
+            db.close()
+
+def import_catalog_file(
+    path: str,
+    db: Optional[Session] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    fmt: Optional[str] = None
+) -> Dict[str, Any]:
+    with open(path, encoding="utf-8") as stream:
+        return import_catalog(stream, fmt or detect_format(path), db, batch_size)
+
+def ensure_catalog_columns(bind=engine) -> None:
+    """
+    Add the slug/content_hash columns to tables created before catalogs
+    existed and backfill slugs from titles so existing rows are matched
+    """
+    inspector = inspect(bind)
+    with bind.begin() as conn:
+        for table in ("courses", "lessons"):
+            columns = {column["name"] for column in inspector.get_columns(table)}
+            if "slug" not in columns:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN slug VARCHAR(255)"))
+            if "content_hash" not in columns:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN content_hash VARCHAR(64)"))
+
+        for table, key in (("courses", None), ("lessons", "course_id")):
+            select_key = f", {key}" if key else ""
+            rows = conn.execute(text(f"SELECT id, title{select_key} FROM {table} WHERE slug IS NULL")).fetchall()
+            taken = {
+                tuple(row) for row in conn.execute(
+                    text(f"SELECT {key + ', ' if key else ''}slug FROM {table} WHERE slug IS NOT NULL")
+                )
+            }
+            for row in rows:
+                scope = (row[2],) if key else ()
+                slug = slugify(row[1])
+                if scope + (slug,) in taken:
+                    slug = f"{slug}-{row[0]}"
+                taken.add(scope + (slug,))
+                conn.execute(text(f"UPDATE {table} SET slug = :slug WHERE id = :id"), {"slug": slug, "id": row[0]})
+
+    inspector = inspect(bind)
+    indexes = set()
+    for table in ("courses", "lessons"):
+        indexes.update(index["name"] for index in inspector.get_indexes(table))
+        indexes.update(constraint["name"] for constraint in inspector.get_unique_constraints(table))
+    with bind.begin() as conn:
+        if "ix_courses_slug" not in indexes:
+            conn.execute(text("CREATE UNIQUE INDEX ix_courses_slug ON courses (slug)"))
+        if "uq_lessons_course_slug" not in indexes:
+            conn.execute(text("CREATE UNIQUE INDEX uq_lessons_course_slug ON lessons (course_id, slug)"))
+
+def main():
+    parser = argparse.ArgumentParser(description="Import course and lesson catalogs")
+    parser.add_argument("paths", nargs="*", default=[DEFAULT_CATALOG_PATH], help="Catalog files (.json, .ndjson, .yaml)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--format", choices=sorted(set(FORMATS.values())), help="Override format detection")
+    args = parser.parse_args()
+
+    from .init_db import create_tables
+    create_tables()
+    for path in args.paths:
+        stats = import_catalog_file(path, batch_size=args.batch_size, fmt=args.format)
+        print(f"{path}: {json.dumps(stats)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Streaming export of user progress as NDJSON or CSV.
+
+Rows are read through a server-side cursor (``stream_results`` with
+``yield_per``) in ``id`` order and written out one chunk at a time, so memory
+stays flat however many rows match. Every row carries its ``id``; an
+interrupted export resumes with ``after_id`` set to the last id received.
+Exports read from a healthy replica when one is configured.
+
+    python -m app.database.export --format csv --course-id 3 --since 2024-01-01 -o progress.csv
+"""
+import argparse
+import csv
+import io
+import json
+import sys
+import time
+from datetime import datetime
+from typing import Iterator, Optional
+
+from sqlalchemy import select
+
+from .config import engine
+from . import replicas
+from ..models import UserProgress
+
+DEFAULT_CHUNK_SIZE = 1000
+MAX_CHUNK_SIZE = 10000
+
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+EXPORT_FIELDS = [
+    "id", "user_id", "course_id", "lesson_id", "is_completed", "completion_percentage",
+    "time_spent_minutes", "time_spent_seconds", "started_at", "completed_at", "last_accessed"
+]
+
+def _query(
+    course_id: Optional[int] = None,
+    user_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    after_id: Optional[int] = None
+):
+    """Progress rows matching the filters; the date range applies to last_accessed"""
+    table = UserProgress.__table__
+    query = select(*(table.c[name] for name in EXPORT_FIELDS))
+    if course_id is not None:
+        query = query.where(table.c.course_id == course_id)
+    if user_id is not None:
+        query = query.where(table.c.user_id == user_id)
+    if since is not None:
+        query = query.where(table.c.last_accessed >= since)
+    if until is not None:
+        query = query.where(table.c.last_accessed < until)
+    if after_id is not None:
+        query = query.where(table.c.id > after_id)
+    return query.order_by(table.c.id)
+
+def _value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+def iter_progress_rows(chunk_size: int = DEFAULT_CHUNK_SIZE, **filters) -> Iterator[list]:
+    """
+    Yield lists of up to ``chunk_size`` row mappings from a server-side
+    cursor. The connection is held until the generator is exhausted or closed.
+    """
+    replica = replicas.choose_replica()
+    bind = replica.engine if replica is not None else engine
+    with bind.connect() as conn:
+        mysql = conn.dialect.name == "mysql"
+        if mysql:
+            # A full export outlives the per-statement SELECT timeout
+            conn.exec_driver_sql("SET SESSION max_execution_time = 0")
+        try:
+            result = conn.execution_options(stream_results=True, yield_per=chunk_size).execute(_query(**filters))
+            try:
+                for partition in result.mappings().partitions():
+                    yield partition
+            finally:
+                # Discards the rest of the cursor when the client went away mid-export
+                result.close()
+        finally:
+            if mysql:
+                conn.exec_driver_sql("SET SESSION max_execution_time = DEFAULT")
+
+def stream_progress(fmt: str = "ndjson", chunk_size: int = DEFAULT_CHUNK_SIZE, **filters) -> Iterator[str]:
+    """Encoded export, one chunk of rows per yielded string"""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}'; use one of {', '.join(EXPORT_FORMATS)}")
+
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_FIELDS)
+        yield buffer.getvalue()
+        for rows in iter_progress_rows(chunk_size, **filters):
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows([_value(row[name]) for name in EXPORT_FIELDS] for row in rows)
+            yield buffer.getvalue()
+        return
+
+    for rows in iter_progress_rows(chunk_size, **filters):
+        yield "".join(
+            json.dumps({name: _value(row[name]) for name in EXPORT_FIELDS}, separators=(",", ":")) + "\n"
+            for row in rows
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description="Export user progress as NDJSON or CSV")
+    parser.add_argument("--format", choices=list(EXPORT_FORMATS), default="ndjson")
+    parser.add_argument("--course-id", type=int)
+    parser.add_argument("--user-id")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="Last accessed at or after (ISO date/time)")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="Last accessed before (ISO date/time)")
+    parser.add_argument("--after-id", type=int, help="Resume after this progress id")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("-o", "--output", help="Output file (default: stdout)")
+    args = parser.parse_args()
+
+    output = open(args.output, "w", encoding="utf-8", newline="") if args.output else sys.stdout
+    start = time.perf_counter()
+    try:
+        for chunk in stream_progress(
+            args.format, args.chunk_size, course_id=args.course_id, user_id=args.user_id,
+            since=args.since, until=args.until, after_id=args.after_id
+        ):
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
+    print(f"Exported in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+SQL-level queries into the JSON columns of lessons and lesson content.
+
+Array expansion is spelled differently by each database: ``JSON_TABLE`` on
+MySQL 8, ``json_each`` on SQLite and ``json_array_elements`` on PostgreSQL.
+The statements below run entirely in the database, so the rows are never
+decoded in Python. Other databases fall back to decoding the column and
+counting in Python.
+"""
+from collections import Counter
+from typing import Dict
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from ..models import Lesson, LessonContent
+
+_EXERCISE_DIFFICULTY = {
+    "mysql": (
+        "SELECT LOWER(COALESCE(jt.difficulty, 'unspecified')) AS difficulty, COUNT(*) AS exercises "
+        "FROM lessons l JOIN lesson_content lc ON lc.lesson_id = l.id, "
+        "JSON_TABLE(lc.exercises, '$[*]' COLUMNS (difficulty VARCHAR(50) PATH '$.difficulty')) AS jt "
+        "WHERE l.course_id = :course_id AND l.is_active = 1 "
+        "GROUP BY 1"
+    ),
+    "sqlite": (
+        "SELECT LOWER(COALESCE(json_extract(je.value, '$.difficulty'), 'unspecified')) AS difficulty, "
+        "COUNT(*) AS exercises "
+        "FROM lessons l JOIN lesson_content lc ON lc.lesson_id = l.id, json_each(lc.exercises) AS je "
+        "WHERE l.course_id = :course_id AND l.is_active = 1 AND json_valid(lc.exercises) "
+        "GROUP BY 1"
+    ),
+    "postgresql": (
+        "SELECT LOWER(COALESCE(je.value ->> 'difficulty', 'unspecified')) AS difficulty, COUNT(*) AS exercises "
+        "FROM lessons l JOIN lesson_content lc ON lc.lesson_id = l.id "
+        "CROSS JOIN LATERAL json_array_elements(lc.exercises) AS je(value) "
+        "WHERE l.course_id = :course_id AND l.is_active "
+        "GROUP BY 1"
+    )
+}
+
+def exercise_difficulty_counts(db: Session, course_id: int) -> Dict[str, int]:
+    """Number of generated practice exercises per difficulty across a course's active lessons"""
+    dialect = db.get_bind().dialect.name
+    if dialect not in _EXERCISE_DIFFICULTY:
+        return _count_exercise_difficulties(db, course_id)
+    rows = db.execute(text(_EXERCISE_DIFFICULTY[dialect]), {"course_id": course_id})
+    return {row.difficulty: row.exercises for row in rows}
+
+def _count_exercise_difficulties(db: Session, course_id: int) -> Dict[str, int]:
+    """The same counts for databases without a JSON array expansion, decoded in Python"""
+    counts: Counter = Counter()
+    exercises = db.query(LessonContent.exercises).join(Lesson, Lesson.id == LessonContent.lesson_id).filter(
+        Lesson.course_id == course_id, Lesson.is_active == True
+    )
+    for (items,) in exercises:
+        if not isinstance(items, list):
+            continue
+        for item in items:
+            difficulty = item.get("difficulty") if isinstance(item, dict) else None
+            counts[str(difficulty).lower() if difficulty is not None else "unspecified"] += 1
+    return dict(counts)
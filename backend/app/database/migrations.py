@@ -0,0 +1,237 @@
+"""
+Schema versioning and the one-time migrate/seed step.
+
+The API no longer creates tables or seeds data on every boot. Run
+
+    python -m app.database.migrations
+
+once per deploy (it is idempotent); the server's startup only compares the
+recorded schema version with ``SCHEMA_VERSION`` and refuses to start on a
+mismatch. Set ``AUTO_MIGRATE=true`` to migrate at startup in development.
+
+Each migration must be safe to run against a database created by
+``create_all`` from the current models, since version 1 does exactly that.
+"""
+import argparse
+from typing import Callable, List, Tuple
+
+from sqlalchemy import JSON, Column, DateTime, Integer, MetaData, String, Table, inspect, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.sql import func
+
+from .config import Base, engine
+
+class SchemaVersionError(RuntimeError):
+    """Raised when the database schema does not match the application"""
+
+_metadata = MetaData()
+
+schema_version = Table(
+    "schema_version",
+    _metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String(255), nullable=False),
+    Column("applied_at", DateTime(timezone=True), server_default=func.now())
+)
+
+def _create_tables(bind: Engine) -> None:
+    from .. import models  # noqa: F401 - register models on Base.metadata
+    Base.metadata.create_all(bind=bind)
+
+def _catalog_columns(bind: Engine) -> None:
+    from .catalog import ensure_catalog_columns
+    ensure_catalog_columns(bind)
+
+def _create_missing_indexes(bind: Engine, *table_names: str) -> None:
+    """Create model-declared indexes that tables built by an older version lack"""
+    from .. import models  # noqa: F401
+    inspector = inspect(bind)
+    for name in table_names:
+        existing = {index["name"] for index in inspector.get_indexes(name)}
+        for index in Base.metadata.tables[name].indexes:
+            if index.name not in existing:
+                index.create(bind=bind)
+
+def _listing_indexes(bind: Engine) -> None:
+    with bind.begin() as conn:
+        # Keyset pagination orders by last_accessed, which must not be NULL
+        conn.execute(text("UPDATE user_progress SET last_accessed = COALESCE(started_at, CURRENT_TIMESTAMP) WHERE last_accessed IS NULL"))
+    _create_missing_indexes(bind, "lessons", "user_progress")
+
+# FULLTEXT indexes as released with migration 4, over the text columns that
+# migration 7 turns into JSON (it re-creates them over generated text copies)
+_SEARCH_INDEXES_V4 = (
+    ("courses", "ft_courses_search", ("title", "description", "overview")),
+    ("lessons", "ft_lessons_search", ("title", "description", "learning_objectives")),
+    ("lesson_content", "ft_lesson_content_key_concepts", ("key_concepts",)),
+)
+
+def _search_indexes(bind: Engine) -> None:
+    # FULLTEXT is MySQL-only; other databases use the in-process search index
+    if bind.dialect.name != "mysql":
+        return
+    inspector = inspect(bind)
+    with bind.begin() as conn:
+        for table, name, columns in _SEARCH_INDEXES_V4:
+            # Tables created from the current models already have JSON columns, indexed by migration 7
+            types = {column["name"]: column["type"] for column in inspector.get_columns(table)}
+            if any(isinstance(types.get(column), JSON) for column in columns):
+                continue
+            if name not in {index["name"] for index in inspector.get_indexes(table)}:
+                conn.execute(text(f"CREATE FULLTEXT INDEX {name} ON {table} ({', '.join(columns)})"))
+
+def _progress_rollups(bind: Engine) -> None:
+    from .rollups import rebuild
+    _create_tables(bind)
+    rebuild(bind)
+
+def _content_versions(bind: Engine) -> None:
+    columns = {column["name"] for column in inspect(bind).get_columns("lesson_content")}
+    with bind.begin() as conn:
+        for name, ddl in (
+            ("version", "INTEGER NOT NULL DEFAULT 1"),
+            ("fingerprint", "VARCHAR(64)"),
+            ("model", "VARCHAR(255)"),
+            ("pinned", "BOOLEAN NOT NULL DEFAULT 0"),
+        ):
+            if name not in columns:
+                conn.execute(text(f"ALTER TABLE lesson_content ADD COLUMN {name} {ddl}"))
+    _create_tables(bind)
+
+# Text columns holding JSON strings that migration 7 turns into native JSON
+JSON_COLUMNS = (
+    ("lessons", ("learning_objectives",)),
+    ("lesson_content", ("key_concepts", "code_examples", "exercises")),
+    ("lesson_content_versions", ("key_concepts", "code_examples", "exercises")),
+)
+
+def _json_columns(bind: Engine) -> None:
+    dialect = bind.dialect.name
+    if dialect == "mysql":
+        from ..services.search import FULLTEXT_INDEXES, FULLTEXT_TEXT_COLUMNS
+        # Indexes and generated columns over the old text are rebuilt afterwards
+        inspector = inspect(bind)
+        with bind.begin() as conn:
+            for table, name, _ in FULLTEXT_INDEXES:
+                if table in dict(JSON_COLUMNS) and name in {index["name"] for index in inspector.get_indexes(table)}:
+                    conn.execute(text(f"DROP INDEX {name} ON {table}"))
+            for table, column, _ in FULLTEXT_TEXT_COLUMNS:
+                if column in {existing["name"] for existing in inspector.get_columns(table)}:
+                    conn.execute(text(f"ALTER TABLE {table} DROP COLUMN {column}"))
+
+    with bind.begin() as conn:
+        for table, columns in JSON_COLUMNS:
+            for column in columns:
+                # Keep free-text values (e.g. hand-written catalog objectives) as one-element lists
+                if dialect == "mysql":
+                    conn.execute(text(
+                        f"UPDATE {table} SET {column} = JSON_ARRAY({column}) "
+                        f"WHERE {column} IS NOT NULL AND JSON_VALID({column}) = 0"
+                    ))
+                    conn.execute(text(f"ALTER TABLE {table} MODIFY {column} JSON"))
+                elif dialect == "sqlite":
+                    # SQLite stores JSON as text; only the values need fixing
+                    conn.execute(text(
+                        f"UPDATE {table} SET {column} = json_array({column}) "
+                        f"WHERE {column} IS NOT NULL AND json_valid({column}) = 0"
+                    ))
+                elif dialect == "postgresql":
+                    conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN {column} TYPE JSON USING {column}::json"))
+    if dialect == "mysql":
+        _json_search_indexes(bind)
+
+def _json_search_indexes(bind: Engine) -> None:
+    """FULLTEXT indexes over generated text copies of the JSON columns (MySQL only)"""
+    from ..services.search import FULLTEXT_INDEXES, FULLTEXT_TEXT_COLUMNS
+    inspector = inspect(bind)
+    with bind.begin() as conn:
+        for table, column, source in FULLTEXT_TEXT_COLUMNS:
+            if column not in {existing["name"] for existing in inspector.get_columns(table)}:
+                conn.execute(text(
+                    f"ALTER TABLE {table} ADD COLUMN {column} TEXT "
+                    f"GENERATED ALWAYS AS (CAST({source} AS CHAR)) STORED"
+                ))
+        for table, name, columns in FULLTEXT_INDEXES:
+            if name not in {index["name"] for index in inspector.get_indexes(table)}:
+                conn.execute(text(f"CREATE FULLTEXT INDEX {name} ON {table} ({', '.join(columns)})"))
+
+def _progress_seconds(bind: Engine) -> None:
+    columns = {column["name"] for column in inspect(bind).get_columns("user_progress")}
+    if "time_spent_seconds" in columns:
+        return
+    with bind.begin() as conn:
+        conn.execute(text("ALTER TABLE user_progress ADD COLUMN time_spent_seconds INTEGER DEFAULT 0"))
+        conn.execute(text("UPDATE user_progress SET time_spent_seconds = COALESCE(time_spent_minutes, 0) * 60"))
+
+MIGRATIONS: List[Tuple[int, str, Callable[[Engine], None]]] = [
+    (1, "initial schema", _create_tables),
+    (2, "catalog slugs and content hashes", _catalog_columns),
+    (3, "keyset pagination indexes", _listing_indexes),
+    (4, "full-text search indexes", _search_indexes),
+    (5, "course analytics rollups", _progress_rollups),
+    (6, "versioned lesson content", _content_versions),
+    (7, "native JSON columns", _json_columns),
+    (8, "progress time in seconds", _progress_seconds),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def current_version(bind: Engine = engine) -> int:
+    """Highest applied migration, or 0 for an unversioned database"""
+    if not inspect(bind).has_table(schema_version.name):
+        return 0
+    with bind.connect() as conn:
+        return conn.execute(select(func.max(schema_version.c.version))).scalar() or 0
+
+def check_schema_version(bind: Engine = engine) -> int:
+    """Fast startup check: one query, no DDL"""
+    version = current_version(bind)
+    if version != SCHEMA_VERSION:
+        raise SchemaVersionError(
+            f"Database schema is at version {version}, the application expects {SCHEMA_VERSION}. "
+            f"Run `python -m app.database.migrations` first (or set AUTO_MIGRATE=true in development)."
+        )
+    return version
+
+def migrate(bind: Engine = engine, seed: bool = True) -> int:
+    """Apply pending migrations in order and optionally load the default catalog"""
+    _metadata.create_all(bind=bind)
+    version = current_version(bind)
+    if version > SCHEMA_VERSION:
+        raise SchemaVersionError(
+            f"Database schema version {version} is newer than this application ({SCHEMA_VERSION})"
+        )
+
+    for number, description, apply in MIGRATIONS:
+        if number <= version:
+            continue
+        print(f"Applying migration {number}: {description}")
+        apply(bind)
+        with bind.begin() as conn:
+            conn.execute(schema_version.insert().values(version=number, description=description))
+
+    if seed:
+        from .init_db import init_course_data
+        init_course_data()
+    return SCHEMA_VERSION
+
+def reset(bind: Engine = engine) -> None:
+    """Drop everything, including the version table"""
+    from .. import models  # noqa: F401
+    Base.metadata.drop_all(bind=bind)
+    _metadata.drop_all(bind=bind)
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate the database schema and seed the default catalog")
+    parser.add_argument("--no-seed", action="store_true", help="Skip loading the default course catalog")
+    parser.add_argument("--check", action="store_true", help="Only check the schema version")
+    args = parser.parse_args()
+
+    if args.check:
+        print(f"Schema version {check_schema_version()} is up to date")
+        return
+    version = migrate(seed=not args.no_seed)
+    print(f"Database is at schema version {version}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+Per-request SQL query tracking built on SQLAlchemy cursor events.
+
+Every statement executed through an instrumented engine is attributed to the
+current request (via a context variable) and to any process-wide collectors
+opened with ``track_queries()``. For each scope we keep the query count, the
+total time spent in the database and how often each statement shape repeats,
+which is how N+1 access patterns show up.
+
+Statements slower than ``SLOW_QUERY_MS`` (see ``settings.DatabaseSettings``)
+are logged individually as structured ``slow_query`` records, which replaces
+``echo=True`` as the way to find expensive SQL in running environments.
+
+Usage in pytest (see ``tests/test_query_budget.py``)::
+
+    from app.database.query_tracker import assert_max_queries
+
+    def test_course_details_query_budget(client):
+        with assert_max_queries(2, allow_repeated=False):
+            client.get("/api/courses/1")
+"""
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+
+from .settings import database_settings
+
+logger = logging.getLogger(__name__)
+
+DEBUG = os.getenv("DEBUG", "false").lower() == "true"
+QUERY_BUDGET = int(os.getenv("QUERY_BUDGET", "25"))
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "5"))
+
+_WHITESPACE = re.compile(r"\s+")
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\((?:\s*(?:\?|%s|%\(\w+\)s|:\w+)\s*,)+\s*(?:\?|%s|%\(\w+\)s|:\w+)\s*\)")
+
+def statement_shape(statement: str) -> str:
+    """
+    Reduce a SQL statement to its shape so that the same query with different
+    parameters (or a different number of IN-list items) compares equal
+    """
+    shape = _STRING_LITERAL.sub("?", statement)
+    shape = _NUMBER_LITERAL.sub("?", shape)
+    shape = _PLACEHOLDER_LIST.sub("(?)", shape)
+    return _WHITESPACE.sub(" ", shape).strip()
+
+class QueryStats:
+    """Query count, database time and statement shapes for one tracking scope"""
+
+    def __init__(self, path: str = ""):
+        self.path = path
+        self.count = 0
+        self.total_time = 0.0
+        self.shapes: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, statement: str, duration: float) -> None:
+        shape = statement_shape(statement)
+        with self._lock:
+            self.count += 1
+            self.total_time += duration
+            self.shapes[shape] += 1
+
+    def repeated(self, threshold: int = N_PLUS_ONE_THRESHOLD) -> List[Tuple[str, int]]:
+        """Statement shapes executed at least ``threshold`` times (likely N+1)"""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+    def summary(self) -> dict:
+        return {
+            "query_count": self.count,
+            "db_time_ms": round(self.total_time * 1000, 2),
+            "repeated_statements": [
+                {"statement": shape, "count": count} for shape, count in self.repeated()
+            ]
+        }
+
+_request_stats: ContextVar[Optional[QueryStats]] = ContextVar("request_query_stats", default=None)
+_global_collectors: List[QueryStats] = []
+_instrumented_engines = set()
+
+def current_stats() -> Optional[QueryStats]:
+    """Stats of the request being served in the current context, if any"""
+    return _request_stats.get()
+
+def _log_slow_query(statement: str, duration: float, stats: Optional[QueryStats]) -> None:
+    shape = statement_shape(statement)
+    path = stats.path if stats is not None else ""
+    logger.warning(
+        "Slow query: %.1f ms on %s: %s",
+        duration * 1000,
+        path or "<no request>",
+        shape[:500],
+        extra={"event": "slow_query", "duration_ms": round(duration * 1000, 2), "path": path, "statement": shape}
+    )
+
+def instrument_engine(engine, slow_query_ms: Optional[float] = None) -> None:
+    """Attach the cursor event listeners to an engine (idempotent)"""
+    from sqlalchemy import event
+
+    if id(engine) in _instrumented_engines:
+        return
+    _instrumented_engines.add(id(engine))
+    slow_query_seconds = (database_settings.slow_query_ms if slow_query_ms is None else slow_query_ms) / 1000
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._query_tracker_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        stats = _request_stats.get()
+        if stats is None and not _global_collectors and not slow_query_seconds:
+            return
+        start = getattr(context, "_query_tracker_start", None)
+        duration = time.perf_counter() - start if start is not None else 0.0
+        if stats is not None:
+            stats.record(statement, duration)
+        for collector in list(_global_collectors):
+            collector.record(statement, duration)
+        if slow_query_seconds and duration >= slow_query_seconds:
+            _log_slow_query(statement, duration, stats)
+
+@contextmanager
+def track_queries():
+    """
+    Collect every statement executed in this process while the block is active.
+
+    Unlike the per-request scope this is not tied to a context variable, so it
+    also sees queries run by a TestClient on its own event loop thread.
+    """
+    stats = QueryStats()
+    _global_collectors.append(stats)
+    try:
+        yield stats
+    finally:
+        _global_collectors.remove(stats)
+
+@contextmanager
+def assert_max_queries(limit: int, allow_repeated: bool = True):
+    """
+    Fail with an AssertionError when the block runs more than ``limit``
+    statements, or repeats a statement shape when ``allow_repeated`` is False
+    """
+    with track_queries() as stats:
+        yield stats
+    details = "\n".join(f"  {count}x {shape}" for shape, count in stats.shapes.most_common())
+    assert stats.count <= limit, f"Expected at most {limit} queries, {stats.count} were executed:\n{details}"
+    if not allow_repeated:
+        repeated = stats.repeated()
+        assert not repeated, f"Repeated statements (possible N+1):\n{details}"
+
+class QueryTrackerMiddleware:
+    """
+    Pure ASGI middleware that scopes query tracking to each HTTP request.
+
+    In debug mode the query count, database time and number of repeated
+    statement shapes are added as response headers. Requests over the query
+    budget or with repeated statements are logged.
+    """
+
+    def __init__(self, app, debug: bool = DEBUG, budget: int = QUERY_BUDGET):
+        self.app = app
+        self.debug = debug
+        self.budget = budget
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats(scope.get("path", ""))
+        token = _request_stats.set(stats)
+
+        async def send_wrapper(message):
+            if self.debug and message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-db-query-count", str(stats.count).encode()))
+                headers.append((b"x-db-time-ms", f"{stats.total_time * 1000:.2f}".encode()))
+                headers.append((b"x-db-repeated-queries", str(len(stats.repeated())).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_stats.reset(token)
+            repeated = stats.repeated()
+            if stats.count > self.budget or repeated:
+                route = getattr(scope.get("route"), "path", scope.get("path", ""))
+                logger.warning(
+                    "Query budget report for %s %s: %d queries in %.1f ms (budget %d), repeated: %s",
+                    scope.get("method", ""),
+                    route,
+                    stats.count,
+                    stats.total_time * 1000,
+                    self.budget,
+                    "; ".join(f"{count}x {shape[:120]}" for shape, count in repeated) or "none"
+                )
@@ -0,0 +1,236 @@
+"""
+Read/write routing between the primary database and read replicas.
+
+``DATABASE_REPLICA_URLS`` is a comma-separated list of replica URLs. Read-only
+routes depend on ``get_read_db`` and get a session on a healthy replica
+(round-robin); everything else keeps using ``config.get_db`` on the primary.
+Without replicas configured ``get_read_db`` is the primary, so nothing changes.
+
+Replicas are health-checked at most every ``REPLICA_HEALTH_INTERVAL`` seconds
+(``SELECT 1`` plus the MySQL replication lag). A replica that fails the check
+or lags more than ``REPLICA_MAX_LAG_SECONDS`` is skipped until it recovers; when
+no replica is usable, reads fall back to the primary. A read that fails on a
+replica with ``OperationalError`` (lost connection, replica restarting) takes it
+out of rotation and is re-run once on the primary before the error is raised.
+
+Read-your-writes: after a user's write, ``record_write`` pins that user's reads
+to the primary for ``READ_YOUR_WRITES_SECONDS`` in this process, and the write
+response carries an ``X-Consistency-Token`` (the write's Unix time). Clients
+that echo the token back are served by a replica only once its last health
+check proves it had caught up to that time (check time - lag - 1s of
+``Seconds_Behind_Source`` granularity), which also works across worker processes.
+"""
+import itertools
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from fastapi import Request
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, sessionmaker
+
+from . import query_tracker
+from .config import SessionLocal, engine as primary_engine, settings
+from .settings import apply_statement_timeout, engine_options
+
+logger = logging.getLogger(__name__)
+
+REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+REPLICA_HEALTH_INTERVAL = float(os.getenv("REPLICA_HEALTH_INTERVAL", "5"))
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", str(REPLICA_MAX_LAG_SECONDS)))
+
+CONSISTENCY_HEADER = "X-Consistency-Token"
+
+class ReplicaSession(Session):
+    """Session on a replica that re-runs a failed read once on the primary"""
+
+    def __init__(self, *args, replica: "Replica" = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.replica = replica
+
+    def _fail_over(self, error: OperationalError) -> bool:
+        """Rebind to the primary after a replica failure; False when already there or mid-write"""
+        if self.bind is primary_engine or self.new or self.dirty or self.deleted:
+            return False
+        if self.replica is not None:
+            self.replica.mark_unhealthy(error)
+        self.rollback()
+        self.bind = primary_engine
+        return True
+
+    def _read(self, method, *args, **kwargs):
+        try:
+            return method(*args, **kwargs)
+        except OperationalError as e:
+            if not self._fail_over(e):
+                raise
+            return method(*args, **kwargs)
+
+    def execute(self, *args, **kwargs):
+        return self._read(super().execute, *args, **kwargs)
+
+    def scalar(self, *args, **kwargs):
+        return self._read(super().scalar, *args, **kwargs)
+
+    def scalars(self, *args, **kwargs):
+        return self._read(super().scalars, *args, **kwargs)
+
+class Replica:
+    """One replica engine with its last health-check result"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.engine = create_engine(url, **engine_options(url, settings))
+        apply_statement_timeout(self.engine, settings)
+        query_tracker.instrument_engine(self.engine)
+        self.SessionLocal = sessionmaker(
+            class_=ReplicaSession, autocommit=False, autoflush=False, bind=self.engine, replica=self
+        )
+        self.healthy = True
+        self.lag = 0.0
+        self.checked_at = 0.0
+        self.applied_until = 0.0  # Unix time up to which the replica is known to be current
+        self._lock = threading.Lock()
+        event.listen(self.engine, "handle_error", self._handle_error)
+
+    def _handle_error(self, context) -> None:
+        # Connection-level failures take the replica out of rotation right away
+        if context.is_disconnect or type(context.original_exception).__name__ == "OperationalError":
+            self.mark_unhealthy(context.original_exception)
+
+    @property
+    def name(self) -> str:
+        return self.engine.url.render_as_string(hide_password=True)
+
+    def _replication_lag(self, conn) -> float:
+        """Seconds behind the source; 0 when the server is not a replica (e.g. local testing)"""
+        if self.engine.dialect.name != "mysql":
+            return 0.0
+        for statement, column in (
+            ("SHOW REPLICA STATUS", "Seconds_Behind_Source"),
+            ("SHOW SLAVE STATUS", "Seconds_Behind_Master")
+        ):
+            try:
+                row = conn.execute(text(statement)).mappings().first()
+            except Exception:
+                continue
+            if row is None:
+                return 0.0
+            lag = row.get(column)
+            if lag is None:
+                raise RuntimeError("replication is not running")
+            return float(lag)
+        return 0.0
+
+    def check(self, force: bool = False) -> bool:
+        """Refresh the health state if it is older than REPLICA_HEALTH_INTERVAL"""
+        now = time.monotonic()
+        if not force and now - self.checked_at < REPLICA_HEALTH_INTERVAL:
+            return self.healthy
+        with self._lock:
+            if not force and now - self.checked_at < REPLICA_HEALTH_INTERVAL:
+                return self.healthy
+            try:
+                with self.engine.connect() as conn:
+                    conn.execute(text("SELECT 1"))
+                    self.lag = self._replication_lag(conn)
+                healthy = self.lag <= REPLICA_MAX_LAG_SECONDS
+                reason = f"lag {self.lag:.1f}s"
+            except Exception as e:
+                healthy = False
+                reason = str(e)
+            if healthy != self.healthy:
+                logger.warning(
+                    "Replica %s is now %s (%s)", self.name, "healthy" if healthy else "unhealthy", reason
+                )
+            self.healthy = healthy
+            self.checked_at = time.monotonic()
+            if healthy:
+                self.applied_until = time.time() - self.lag - 1
+            return healthy
+
+    def mark_unhealthy(self, error: Exception) -> None:
+        """Take the replica out of rotation until the next health check"""
+        if self.healthy:
+            logger.warning("Replica %s failed a query, falling back to the primary: %s", self.name, error)
+        self.healthy = False
+        self.checked_at = time.monotonic()
+
+replicas: List[Replica] = [Replica(url) for url in REPLICA_URLS]
+_rotation = itertools.count()
+
+# user_id -> monotonic deadline until which that user's reads go to the primary
+_recent_writers: Dict[str, float] = {}
+_writers_lock = threading.Lock()
+
+def record_write(user_id: Optional[str]) -> str:
+    """
+    Pin ``user_id``'s reads to the primary for READ_YOUR_WRITES_SECONDS and
+    return the consistency token to send back to the client
+    """
+    if user_id and replicas:
+        now = time.monotonic()
+        with _writers_lock:
+            _recent_writers[user_id] = now + READ_YOUR_WRITES_SECONDS
+            if len(_recent_writers) > 10000:
+                for key in [key for key, deadline in _recent_writers.items() if deadline < now]:
+                    del _recent_writers[key]
+    return f"{time.time():.3f}"
+
+def _consistency_floor(user_id: Optional[str], token: Optional[str]) -> Optional[float]:
+    """
+    Unix time a replica must have applied to serve this read (infinity pins it
+    to the primary), or None when any healthy replica will do
+    """
+    if user_id:
+        deadline = _recent_writers.get(user_id)
+        if deadline is not None:
+            if deadline > time.monotonic():
+                return float("inf")
+            with _writers_lock:
+                _recent_writers.pop(user_id, None)
+    if token:
+        try:
+            return float(token)
+        except ValueError:
+            return None
+    return None
+
+def choose_replica(floor: Optional[float] = None) -> Optional[Replica]:
+    """Next healthy replica (round-robin) that has applied writes up to ``floor``, if any"""
+    if not replicas or floor == float("inf"):
+        return None
+    start = next(_rotation)
+    for offset in range(len(replicas)):
+        replica = replicas[(start + offset) % len(replicas)]
+        if not replica.check():
+            continue
+        if floor is not None and replica.applied_until <= floor:
+            continue
+        return replica
+    return None
+
+def get_read_db(request: Request):
+    """
+    Dependency for read-only routes: a replica session when one is healthy and
+    consistent enough for this caller, otherwise a primary session
+    """
+    user_id = request.path_params.get("user_id") or request.query_params.get("user_id")
+    replica = choose_replica(_consistency_floor(user_id, request.headers.get(CONSISTENCY_HEADER)))
+
+    db = replica.SessionLocal() if replica is not None else SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def replica_status() -> List[dict]:
+    """Health snapshot of every configured replica"""
+    return [
+        {"replica": replica.name, "healthy": replica.healthy, "lag_seconds": replica.lag}
+        for replica in replicas
+    ]
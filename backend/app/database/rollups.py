@@ -0,0 +1,181 @@
+"""
+Incrementally maintained progress rollups for course analytics.
+
+``lesson_progress_rollups`` keeps running totals per (course, lesson) and
+``lesson_progress_daily`` per (course, day, lesson). Every progress write calls
+``record_progress_change`` with the row's state before and after the write;
+the difference is applied as an atomic ``col = col + delta`` upsert in the same
+transaction, so analytics never have to scan ``user_progress``.
+
+The daily table records events on the day they are written: a new progress
+row counts as started, the first completion as completed, and reported
+minutes as time spent. ``rebuild`` recomputes both tables from
+``user_progress``; since a progress row only keeps its running total of
+minutes, a rebuild attributes all of a row's time to the day it was last
+accessed. Run it after bulk loads or to repair drift:
+
+    python -m app.database.rollups --rebuild [--course-id 3]
+"""
+import argparse
+import time
+from datetime import date, datetime
+from typing import Dict, NamedTuple, Optional
+
+from sqlalchemy import Integer, case, delete, func, insert, literal, select, union_all, update
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from .config import engine
+from ..models import LessonProgressDaily, LessonProgressRollup, UserProgress
+
+class ProgressSnapshot(NamedTuple):
+    """The fields of a progress row that the rollups aggregate"""
+    is_completed: bool
+    completion_percentage: int
+    time_spent_minutes: int
+    completed_at: Optional[datetime]
+
+def snapshot(progress: Optional[UserProgress]) -> Optional[ProgressSnapshot]:
+    """State of ``progress`` to pass to ``record_progress_change``; None for a new row"""
+    if progress is None:
+        return None
+    return ProgressSnapshot(
+        bool(progress.is_completed),
+        progress.completion_percentage or 0,
+        progress.time_spent_minutes or 0,
+        progress.completed_at
+    )
+
+def _increment(db: Session, model, key: Dict[str, object], deltas: Dict[str, int]) -> None:
+    """Add ``deltas`` to the row identified by ``key``, inserting it if missing"""
+    table = model.__table__
+    dialect = db.get_bind().dialect.name
+    values = {**key, **deltas}
+
+    if dialect == "mysql":
+        stmt = mysql.insert(table).values(values)
+        stmt = stmt.on_duplicate_key_update({name: table.c[name] + stmt.inserted[name] for name in deltas})
+        db.execute(stmt)
+    elif dialect in ("sqlite", "postgresql"):
+        insert_ = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        stmt = insert_(table).values(values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(key),
+            set_={name: table.c[name] + stmt.excluded[name] for name in deltas}
+        )
+        db.execute(stmt)
+    else:
+        where = [table.c[name] == value for name, value in key.items()]
+        result = db.execute(
+            update(table).where(*where).values({name: table.c[name] + delta for name, delta in deltas.items()})
+        )
+        if result.rowcount == 0:
+            db.execute(insert(table).values(values))
+
+def record_progress_change(
+    db: Session,
+    course_id: int,
+    lesson_id: int,
+    before: Optional[ProgressSnapshot],
+    after: ProgressSnapshot,
+    day: Optional[date] = None
+) -> None:
+    """
+    Apply the difference between two states of one progress row to the
+    rollups. Call it before committing the progress write so both land in
+    the same transaction.
+    """
+    started = before is None
+    before = before or ProgressSnapshot(False, 0, 0, None)
+    first_completion = before.completed_at is None and after.completed_at is not None
+    minutes = after.time_spent_minutes - before.time_spent_minutes
+
+    totals = {
+        "learners": int(started),
+        "completed": int(after.is_completed) - int(before.is_completed),
+        "completion_percentage_sum": after.completion_percentage - before.completion_percentage,
+        "time_spent_minutes_sum": minutes
+    }
+    if any(totals.values()):
+        _increment(db, LessonProgressRollup, {"course_id": course_id, "lesson_id": lesson_id}, totals)
+
+    daily = {"started": int(started), "completed": int(first_completion), "time_spent_minutes": minutes}
+    if any(daily.values()):
+        key = {"course_id": course_id, "day": day or datetime.now().date(), "lesson_id": lesson_id}
+        _increment(db, LessonProgressDaily, key, daily)
+
+def rebuild(bind: Engine = engine, course_id: Optional[int] = None) -> Dict[str, int]:
+    """Recompute the rollups (of one course, or all) from user_progress"""
+    progress = UserProgress.__table__
+    rollups = LessonProgressRollup.__table__
+    daily = LessonProgressDaily.__table__
+    scope = [progress.c.course_id == course_id] if course_id is not None else []
+
+    totals = select(
+        progress.c.course_id,
+        progress.c.lesson_id,
+        func.count().label("learners"),
+        func.sum(case((progress.c.is_completed == True, 1), else_=0)).label("completed"),
+        func.coalesce(func.sum(progress.c.completion_percentage), 0).label("completion_percentage_sum"),
+        func.coalesce(func.sum(progress.c.time_spent_minutes), 0).label("time_spent_minutes_sum")
+    ).where(*scope).group_by(progress.c.course_id, progress.c.lesson_id)
+
+    def events(day_column, started, completed, minutes, *where):
+        return select(
+            progress.c.course_id,
+            progress.c.lesson_id,
+            func.date(day_column).label("day"),
+            literal(started, Integer).label("started"),
+            literal(completed, Integer).label("completed"),
+            minutes.label("time_spent_minutes")
+        ).where(day_column.isnot(None), *scope, *where)
+
+    zero = literal(0, Integer)
+    all_events = union_all(
+        events(progress.c.started_at, 1, 0, zero),
+        events(progress.c.completed_at, 0, 1, zero),
+        events(progress.c.last_accessed, 0, 0, progress.c.time_spent_minutes, progress.c.time_spent_minutes > 0)
+    ).subquery()
+    per_day = select(
+        all_events.c.course_id,
+        all_events.c.day,
+        all_events.c.lesson_id,
+        func.sum(all_events.c.started),
+        func.sum(all_events.c.completed),
+        func.sum(all_events.c.time_spent_minutes)
+    ).group_by(all_events.c.course_id, all_events.c.day, all_events.c.lesson_id)
+
+    with bind.begin() as conn:
+        for table in (rollups, daily):
+            stmt = delete(table)
+            if course_id is not None:
+                stmt = stmt.where(table.c.course_id == course_id)
+            conn.execute(stmt)
+        lessons = conn.execute(insert(rollups).from_select(
+            ["course_id", "lesson_id", "learners", "completed", "completion_percentage_sum", "time_spent_minutes_sum"],
+            totals
+        )).rowcount
+        days = conn.execute(insert(daily).from_select(
+            ["course_id", "day", "lesson_id", "started", "completed", "time_spent_minutes"],
+            per_day
+        )).rowcount
+    return {"lessons": lessons, "daily_rows": days}
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the course analytics rollups")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute the rollups from user_progress")
+    parser.add_argument("--course-id", type=int, help="Only rebuild this course")
+    args = parser.parse_args()
+
+    if not args.rebuild:
+        parser.error("nothing to do; pass --rebuild")
+    start = time.perf_counter()
+    result = rebuild(course_id=args.course_id)
+    print(
+        f"Rebuilt rollups for {result['lessons']} lessons ({result['daily_rows']} daily rows) "
+        f"in {time.perf_counter() - start:.2f}s"
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Typed database engine settings with dev/test/prod profiles.
+
+``DB_PROFILE`` picks the profile (default ``dev``); individual values can be
+overridden with the environment variables listed on ``DatabaseSettings``.
+
+* dev  - small pool, echo off by default, generous timeouts
+* test - tiny pool, no pre-ping, short timeouts so hung queries fail fast
+* prod - sized for the threadpool, pre-ping and recycle below MySQL's
+         ``wait_timeout`` so idle connections are never handed out stale
+"""
+import os
+from dataclasses import dataclass, replace
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+@dataclass(frozen=True)
+class DatabaseSettings:
+    """Engine and session settings (environment variable in brackets)"""
+
+    profile: str = "dev"
+    pool_size: int = 5              # DB_POOL_SIZE
+    max_overflow: int = 5           # DB_MAX_OVERFLOW
+    pool_timeout: float = 30.0      # DB_POOL_TIMEOUT, seconds to wait for a checkout
+    pool_recycle: int = 3600        # DB_POOL_RECYCLE, seconds; -1 disables
+    pool_pre_ping: bool = True      # DB_POOL_PRE_PING
+    statement_timeout_ms: int = 0   # DB_STATEMENT_TIMEOUT_MS, 0 disables
+    slow_query_ms: float = 0        # SLOW_QUERY_MS, 0 disables the slow-query log
+    echo: bool = False              # SQL_ECHO
+
+PROFILES: Dict[str, DatabaseSettings] = {
+    "dev": DatabaseSettings(
+        profile="dev", pool_size=5, max_overflow=5, pool_timeout=30, pool_recycle=3600,
+        pool_pre_ping=True, statement_timeout_ms=0, slow_query_ms=200
+    ),
+    "test": DatabaseSettings(
+        profile="test", pool_size=2, max_overflow=0, pool_timeout=5, pool_recycle=-1,
+        pool_pre_ping=False, statement_timeout_ms=5000, slow_query_ms=0
+    ),
+    "prod": DatabaseSettings(
+        profile="prod", pool_size=20, max_overflow=10, pool_timeout=10, pool_recycle=1800,
+        pool_pre_ping=True, statement_timeout_ms=10000, slow_query_ms=500
+    ),
+}
+
+_OVERRIDES = {
+    "pool_size": ("DB_POOL_SIZE", int),
+    "max_overflow": ("DB_MAX_OVERFLOW", int),
+    "pool_timeout": ("DB_POOL_TIMEOUT", float),
+    "pool_recycle": ("DB_POOL_RECYCLE", int),
+    "pool_pre_ping": ("DB_POOL_PRE_PING", lambda value: value.lower() == "true"),
+    "statement_timeout_ms": ("DB_STATEMENT_TIMEOUT_MS", int),
+    "slow_query_ms": ("SLOW_QUERY_MS", float),
+    "echo": ("SQL_ECHO", lambda value: value.lower() == "true"),
+}
+
+def load_database_settings(profile: Optional[str] = None) -> DatabaseSettings:
+    """Settings for ``profile`` (or ``DB_PROFILE``) with environment overrides applied"""
+    name = (profile or os.getenv("DB_PROFILE", "dev")).lower()
+    if name not in PROFILES:
+        raise ValueError(f"Unknown DB_PROFILE {name!r}, expected one of {', '.join(PROFILES)}")
+
+    overrides = {}
+    for field, (variable, parse) in _OVERRIDES.items():
+        value = os.getenv(variable)
+        if value not in (None, ""):
+            overrides[field] = parse(value)
+    return replace(PROFILES[name], **overrides)
+
+def engine_options(url: str, settings: DatabaseSettings) -> Dict[str, Any]:
+    """Keyword arguments for ``create_engine`` for this URL and profile"""
+    options: Dict[str, Any] = {"echo": settings.echo, "pool_pre_ping": settings.pool_pre_ping}
+    connect_args: Dict[str, Any] = {}
+
+    if url.startswith("sqlite"):
+        # SQLite (local benchmarks) is shared across the threadpool, so disable the thread check
+        connect_args["check_same_thread"] = False
+        if settings.statement_timeout_ms:
+            # No per-statement limit in SQLite; bound the wait for the write lock instead
+            connect_args["timeout"] = settings.statement_timeout_ms / 1000
+        if ":memory:" in url or url.rstrip("/") in ("sqlite:", "sqlite:/"):
+            return {**options, "connect_args": connect_args}
+    elif settings.statement_timeout_ms and url.startswith("mysql+pymysql"):
+        # Client-side cap for any statement; max_execution_time is set per connection
+        seconds = max(1, -(-settings.statement_timeout_ms // 1000))
+        connect_args["read_timeout"] = seconds
+        connect_args["write_timeout"] = seconds
+
+    options.update(
+        connect_args=connect_args,
+        pool_size=settings.pool_size,
+        max_overflow=settings.max_overflow,
+        pool_timeout=settings.pool_timeout,
+        pool_recycle=settings.pool_recycle
+    )
+    return options
+
+def apply_statement_timeout(engine, settings: DatabaseSettings) -> None:
+    """Set MySQL's server-side SELECT timeout on every new connection"""
+    if not settings.statement_timeout_ms or engine.dialect.name != "mysql":
+        return
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "connect")
+    def set_max_execution_time(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(f"SET SESSION max_execution_time = {int(settings.statement_timeout_ms)}")
+        finally:
+            cursor.close()
+
+database_settings = load_database_settings()
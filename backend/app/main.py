@@ -1,14 +1,20 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 import os
 from dotenv import load_dotenv
 
-from .api import courses, ai
-from .database.init_db import create_tables, init_course_data
+from .api import courses, ai, admin, search, recommendations, analytics
+from .database import query_tracker, replicas
+from .database.config import engine
+from .database.migrations import check_schema_version, migrate
+from .services import admission, idempotency, metrics, profiling, tracing
 
 load_dotenv()
 
+# Run migrations at boot instead of only checking the schema version (development only)
+AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", "false").lower() == "true"
+
 # Create FastAPI app
 app = FastAPI(
     title="LearnAnySkills API",
@@ -32,11 +38,38 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     allow_headers=["*"],
+    expose_headers=[replicas.CONSISTENCY_HEADER, tracing.TRACE_ID_HEADER, "Retry-After", idempotency.REPLAYED_HEADER],
 )
 
+# Record per-route latency, status codes and query counts
+metrics.instrument_engine(engine)
+if profiling.PROFILING_ENABLED:
+    # Innermost, so the query tracker scope is still open when a profile is written
+    app.add_middleware(profiling.ProfilingMiddleware)
+# Shed AI traffic over capacity before it takes the connections catalog reads need;
+# inside the metrics middleware so that shed requests are counted as 503s
+if admission.ADMISSION_CONTROL_ENABLED:
+    app.add_middleware(admission.AdmissionMiddleware)
+# Outside admission control, so a duplicate waiting on its original holds no slot
+app.add_middleware(idempotency.IdempotencyMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+app.add_middleware(query_tracker.QueryTrackerMiddleware)
+
+# Spans for requests, SQL statements, AI calls and background tasks
+if tracing.TRACING_ENABLED:
+    tracing.instrument_engine(engine)
+    for replica in replicas.replicas:
+        tracing.instrument_engine(replica.engine)
+    # Outermost, so the server span covers everything below it
+    app.add_middleware(tracing.TracingMiddleware)
+
 # Include routers
 app.include_router(courses.router)
 app.include_router(ai.router)
+app.include_router(admin.router)
+app.include_router(search.router)
+app.include_router(recommendations.router)
+app.include_router(analytics.router)
 
 @app.get("/")
 async def root():
@@ -55,24 +88,36 @@ async def health_check():
     return {
         "status": "healthy",
         "service": "LearnAnySkills API",
-        "version": "1.0.0"
+        "version": "1.0.0",
+        "replicas": replicas.replica_status()
     }
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    """Prometheus text exposition of HTTP, database pool and AI metrics"""
+    return Response(content=metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE_LATEST)
+
 @app.on_event("startup")
 async def startup_event():
-    """Initialize database on startup"""
+    """Verify the database schema version; migrations and seeding run separately"""
     try:
         print("🚀 Starting LearnAnySkills API...")
-        print("📊 Creating database tables...")
-        create_tables()
-        print("📚 Initializing course data...")
-        init_course_data()
-        print("✅ Database initialization completed!")
+        if AUTO_MIGRATE:
+            print("📊 Applying database migrations...")
+            migrate()
+        else:
+            check_schema_version()
         print("🎯 API is ready to serve requests!")
     except Exception as e:
         print(f"❌ Error during startup: {e}")
         raise e
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Export the trace spans still queued"""
+    if tracing.TRACING_ENABLED:
+        tracing.shutdown()
+
 @app.exception_handler(404)
 async def not_found_handler(request, exc):
     return JSONResponse(
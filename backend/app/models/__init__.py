@@ -1,3 +1,4 @@
-from .course import Course, Lesson, LessonContent, UserProgress
+from .course import Course, Lesson, LessonContent, LessonContentVersion, UserProgress
+from .analytics import LessonProgressDaily, LessonProgressRollup
 
-__all__ = ["Course", "Lesson", "LessonContent", "UserProgress"]
\ No newline at end of file
+__all__ = ["Course", "Lesson", "LessonContent", "LessonContentVersion", "UserProgress", "LessonProgressDaily", "LessonProgressRollup"]
\ No newline at end of file
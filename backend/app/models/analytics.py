@@ -0,0 +1,28 @@
+from sqlalchemy import Column, Integer, Date, DateTime, ForeignKey, PrimaryKeyConstraint
+from sqlalchemy.sql import func
+from ..database.config import Base
+
+class LessonProgressRollup(Base):
+    """Running totals of user_progress per lesson, maintained on every progress write"""
+    __tablename__ = "lesson_progress_rollups"
+    __table_args__ = (PrimaryKeyConstraint("course_id", "lesson_id"),)
+    
+    course_id = Column(Integer, ForeignKey("courses.id"), nullable=False)
+    lesson_id = Column(Integer, ForeignKey("lessons.id"), nullable=False)
+    learners = Column(Integer, nullable=False, default=0)  # progress rows (learners who started)
+    completed = Column(Integer, nullable=False, default=0)  # rows with is_completed
+    completion_percentage_sum = Column(Integer, nullable=False, default=0)
+    time_spent_minutes_sum = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class LessonProgressDaily(Base):
+    """Per-day activity per lesson: new learners, completions and minutes reported that day"""
+    __tablename__ = "lesson_progress_daily"
+    __table_args__ = (PrimaryKeyConstraint("course_id", "day", "lesson_id"),)
+    
+    course_id = Column(Integer, ForeignKey("courses.id"), nullable=False)
+    lesson_id = Column(Integer, ForeignKey("lessons.id"), nullable=False)
+    day = Column(Date, nullable=False)
+    started = Column(Integer, nullable=False, default=0)
+    completed = Column(Integer, nullable=False, default=0)
+    time_spent_minutes = Column(Integer, nullable=False, default=0)
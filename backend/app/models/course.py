@@ -1,12 +1,28 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, Index, JSON, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
+from typing import List, TypedDict
 from ..database.config import Base
 
+# Native JSON columns: decoded once by the driver when the row is loaded.
+# SQL NULL (not JSON null) for missing values, like the old Text columns.
+JSONColumn = JSON(none_as_null=True)
+
+class CodeExample(TypedDict, total=False):
+    title: str
+    code: str
+    explanation: str
+
+class PracticeExercise(TypedDict, total=False):
+    title: str
+    description: str
+    difficulty: str  # beginner | intermediate | advanced
+
 class Course(Base):
     __tablename__ = "courses"
     
     id = Column(Integer, primary_key=True, index=True)
+    slug = Column(String(255), unique=True, index=True)  # Stable catalog key
     title = Column(String(255), nullable=False)
     description = Column(Text, nullable=False)
     overview = Column(Text, nullable=False)
@@ -14,6 +30,7 @@ class Course(Base):
     estimated_duration = Column(String(50))  # e.g., "4 weeks", "20 hours"
     image_url = Column(String(500))
     is_active = Column(Boolean, default=True)
+    content_hash = Column(String(64))  # Hash of catalog fields, used to skip unchanged rows
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
@@ -22,21 +39,32 @@ class Course(Base):
 
 class Lesson(Base):
     __tablename__ = "lessons"
+    __table_args__ = (
+        UniqueConstraint("course_id", "slug", name="uq_lessons_course_slug"),
+        # Keyset pagination of a course's lessons
+        Index("ix_lessons_course_listing", "course_id", "is_active", "lesson_number", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     course_id = Column(Integer, ForeignKey("courses.id"), nullable=False)
+    slug = Column(String(255))  # Stable catalog key, unique within the course
     title = Column(String(255), nullable=False)
     description = Column(Text)
     lesson_number = Column(Integer, nullable=False)  # Order within course
     estimated_duration = Column(String(50))  # e.g., "30 minutes"
-    learning_objectives = Column(Text)  # JSON string of objectives
+    learning_objectives = Column(JSONColumn)  # List of objective strings
     is_active = Column(Boolean, default=True)
+    content_hash = Column(String(64))  # Hash of catalog fields, used to skip unchanged rows
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     # Relationships
     course = relationship("Course", back_populates="lessons")
     lesson_content = relationship("LessonContent", back_populates="lesson", uselist=False)
+    
+    @property
+    def objectives(self) -> List[str]:
+        return self.learning_objectives or []
 
 class LessonContent(Base):
     __tablename__ = "lesson_content"
@@ -45,17 +73,57 @@ class LessonContent(Base):
     lesson_id = Column(Integer, ForeignKey("lessons.id"), nullable=False, unique=True)
     ai_generated_content = Column(Text)  # Full lesson content from AI
     content_summary = Column(Text)  # Brief summary/introduction
-    key_concepts = Column(Text)  # JSON string of key concepts
-    code_examples = Column(Text)  # JSON string of code examples
-    exercises = Column(Text)  # JSON string of practice exercises
+    key_concepts = Column(JSONColumn)  # List of key takeaway strings
+    code_examples = Column(JSONColumn)  # List of CodeExample objects
+    exercises = Column(JSONColumn)  # List of PracticeExercise objects
+    version = Column(Integer, nullable=False, default=1)
+    fingerprint = Column(String(64))  # Hash of the generation request (lesson metadata, prompt, model)
+    model = Column(String(255))
+    pinned = Column(Boolean, nullable=False, default=False)  # Set by a rollback; never regenerated automatically
     generated_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     # Relationships
     lesson = relationship("Lesson", back_populates="lesson_content")
+    
+    @property
+    def takeaways(self) -> List[str]:
+        return self.key_concepts or []
+    
+    @property
+    def examples(self) -> List[CodeExample]:
+        return self.code_examples or []
+    
+    @property
+    def practice_exercises(self) -> List[PracticeExercise]:
+        return self.exercises or []
+
+class LessonContentVersion(Base):
+    """Earlier versions of a lesson's content, kept for rollback"""
+    __tablename__ = "lesson_content_versions"
+    __table_args__ = (
+        UniqueConstraint("lesson_id", "version", name="uq_lesson_content_versions_lesson_version"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    lesson_id = Column(Integer, ForeignKey("lessons.id"), nullable=False)
+    version = Column(Integer, nullable=False)
+    ai_generated_content = Column(Text)
+    content_summary = Column(Text)
+    key_concepts = Column(JSONColumn)
+    code_examples = Column(JSONColumn)
+    exercises = Column(JSONColumn)
+    fingerprint = Column(String(64))
+    model = Column(String(255))
+    generated_at = Column(DateTime(timezone=True))
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
 
 class UserProgress(Base):
     __tablename__ = "user_progress"
+    __table_args__ = (
+        # Keyset pagination of a user's progress, most recently accessed first
+        Index("ix_user_progress_user_accessed", "user_id", "last_accessed", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(String(255), nullable=False)  # Can be session ID or user ID
@@ -63,7 +131,8 @@ class UserProgress(Base):
     course_id = Column(Integer, ForeignKey("courses.id"), nullable=False)
     is_completed = Column(Boolean, default=False)
     completion_percentage = Column(Integer, default=0)  # 0-100
-    time_spent_minutes = Column(Integer, default=0)
+    time_spent_minutes = Column(Integer, default=0)  # Whole minutes of time_spent_seconds
+    time_spent_seconds = Column(Integer, default=0)
     started_at = Column(DateTime(timezone=True), server_default=func.now())
     completed_at = Column(DateTime(timezone=True))
     last_accessed = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
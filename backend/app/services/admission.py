@@ -0,0 +1,201 @@
+"""
+Admission control: separate concurrency pools per route class.
+
+Lesson generation and overviews hold a worker and a database connection for
+the whole model call. Without a limit, a burst of them takes every connection
+and the catalog reads behind them time out. Each request is therefore
+classified by path and has to take a slot from its class's pool:
+
+- ``ai``: ``/api/ai/lessons/{id}/generate`` and ``/overview``. By default at
+  most half of the database pool (``DB_POOL_SIZE + DB_MAX_OVERFLOW``), so
+  the other half is left for reads;
+- ``catalog``: course, lesson, progress, search and recommendation reads,
+  including cached lesson content (``/api/ai/lessons/{id}/content``);
+- ``default``: everything else. ``/health``, ``/metrics`` and the docs are
+  exempt.
+
+A request that finds its pool full waits in that pool's FIFO queue for up to
+``*_QUEUE_TIMEOUT`` seconds. If the queue already holds ``*_QUEUE`` requests,
+or the wait times out, the request is shed at once with ``503`` and
+``Retry-After``. The pools are independent, so a full AI pool never delays a
+catalog read. Slots are released when the response is complete, before any
+background tasks run.
+
+Every limit is configurable per class, for example ``ADMISSION_AI_CONCURRENCY``
+or ``ADMISSION_CATALOG_QUEUE``. ``ADMISSION_CONTROL_ENABLED=false`` turns the
+middleware off. Limits are per worker process.
+"""
+import asyncio
+import json
+import os
+import re
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from ..database.settings import database_settings
+from . import metrics
+
+ADMISSION_CONTROL_ENABLED = os.getenv("ADMISSION_CONTROL_ENABLED", "true").lower() == "true"
+
+EXEMPT_PATHS = re.compile(r"^/(health|metrics|docs|redoc|openapi\.json)?$")
+
+# (route class, path pattern), first match wins
+ROUTE_CLASSES = (
+    ("ai", re.compile(r"^/api/ai/lessons/[^/]+/(generate|overview)$")),
+    ("catalog", re.compile(r"^/api/((courses|lessons|user|search|recommendations)(/|$)|ai/lessons/[^/]+/content$)")),
+)
+
+def _setting(route_class: str, name: str, default: float) -> float:
+    return float(os.getenv(f"ADMISSION_{route_class.upper()}_{name}", str(default)))
+
+class AdmissionPool:
+    """A concurrency limit with a bounded FIFO queue of waiting requests"""
+
+    def __init__(self, name: str, concurrency: int, queue: int, queue_timeout: float, retry_after: int):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue = queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @classmethod
+    def from_env(cls, name: str, concurrency: int, queue: int, queue_timeout: float, retry_after: int):
+        return cls(
+            name,
+            int(_setting(name, "CONCURRENCY", concurrency)),
+            int(_setting(name, "QUEUE", queue)),
+            _setting(name, "QUEUE_TIMEOUT", queue_timeout),
+            int(_setting(name, "RETRY_AFTER", retry_after))
+        )
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> Optional[str]:
+        """Take a slot; returns None when admitted or the reason for shedding"""
+        if self.active < self.concurrency and not self._waiters:
+            self.active += 1
+            return None
+        if len(self._waiters) >= self.queue:
+            return "queue_full"
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()  # Handed a slot just as the wait timed out
+            return "queue_timeout"
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if not waiter.done():
+                waiter.cancel()
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                pass
+        metrics.ADMISSION_WAIT.observe(time.perf_counter() - start, route_class=self.name)
+        return None
+
+    def release(self) -> None:
+        """Hand the slot to the oldest waiter, or free it"""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+_db_connections = database_settings.pool_size + max(database_settings.max_overflow, 0)
+_ai_concurrency = max(1, _db_connections // 2)
+
+POOLS: Dict[str, AdmissionPool] = {
+    "ai": AdmissionPool.from_env("ai", _ai_concurrency, _ai_concurrency, 2.0, 5),
+    "catalog": AdmissionPool.from_env("catalog", 64, 256, 10.0, 1),
+    "default": AdmissionPool.from_env("default", 32, 64, 10.0, 1),
+}
+
+metrics.ADMISSION_IN_FLIGHT.set_callback(lambda: {(name,): pool.active for name, pool in POOLS.items()})
+metrics.ADMISSION_QUEUE_DEPTH.set_callback(lambda: {(name,): pool.waiting for name, pool in POOLS.items()})
+metrics.ADMISSION_LIMIT.set_callback(lambda: {
+    key: value
+    for name, pool in POOLS.items()
+    for key, value in (((name, "concurrency"), pool.concurrency), ((name, "queue"), pool.queue))
+})
+
+def route_class(path: str) -> Optional[str]:
+    """Pool name for a request path, or None when the path is exempt"""
+    if EXEMPT_PATHS.match(path):
+        return None
+    for name, pattern in ROUTE_CLASSES:
+        if pattern.match(path):
+            return name
+    return "default"
+
+class AdmissionMiddleware:
+    """Pure ASGI middleware that admits or sheds each HTTP request"""
+
+    def __init__(self, app, pools: Optional[Dict[str, AdmissionPool]] = None):
+        self.app = app
+        self.pools = pools or POOLS
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("method") == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+        name = route_class(scope.get("path", ""))
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+
+        pool = self.pools[name]
+        reason = await pool.acquire()
+        if reason is not None:
+            metrics.ADMISSION_REJECTED.inc(route_class=name, reason=reason)
+            await self._shed(send, pool)
+            return
+
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                pool.release()
+
+        async def send_wrapper(message):
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                release()
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            release()
+
+    @staticmethod
+    async def _shed(send, pool: AdmissionPool) -> None:
+        body = json.dumps({
+            "success": False,
+            "error": "Service overloaded",
+            "message": f"Too many {pool.name} requests in progress. Please retry in {pool.retry_after} seconds."
+        }).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(pool.retry_after).encode())
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
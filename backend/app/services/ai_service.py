@@ -1,21 +1,101 @@
 import os
 import json
-import httpx
-from typing import Dict, Any, Optional
+import time
+import hashlib
+import functools
+from typing import Dict, Any, List, Optional
+from urllib.parse import urlparse
 from dotenv import load_dotenv
 
+from . import metrics, tracing
+
 load_dotenv()
 
+# Shared by the per-lesson and the batched course prompts
+SYSTEM_PROMPT = "You are an expert educator and curriculum designer. Create engaging, clear, and comprehensive lesson content that helps students learn effectively. Always respond with valid JSON."
+
+LESSON_SECTIONS = """1. **Introduction** (2-3 paragraphs): Engaging opening that explains what students will learn and why it's important
+2. **Main Content** (4-6 sections): Core concepts explained in clear, easy-to-understand paragraphs
+3. **Code Examples** (if applicable): Minimal, well-commented code snippets that demonstrate key concepts
+4. **Key Takeaways** (3-5 bullet points): Main concepts students should remember
+5. **Practice Exercise** (1-2 exercises): Hands-on activities to reinforce learning"""
+
+LESSON_GUIDELINES = """Guidelines:
+- Use clear, conversational language appropriate for beginners to intermediate learners
+- Break complex concepts into digestible chunks
+- Include practical examples relevant to real-world scenarios
+- Keep code examples minimal and well-commented
+- Focus on understanding concepts rather than memorization
+- Make it engaging and interactive where possible"""
+
+LESSON_JSON_STRUCTURE = """{
+    "introduction": "...",
+    "main_content": [
+        {
+            "section_title": "...",
+            "content": "..."
+        }
+    ],
+    "code_examples": [
+        {
+            "title": "...",
+            "code": "...",
+            "explanation": "..."
+        }
+    ],
+    "key_takeaways": ["..."],
+    "practice_exercises": [
+        {
+            "title": "...",
+            "description": "...",
+            "difficulty": "beginner|intermediate|advanced"
+        }
+    ]
+}"""
+
+# Changes whenever the lesson prompt template does; part of memoised fingerprint keys
+PROMPT_VERSION = hashlib.sha256(
+    "\n".join((SYSTEM_PROMPT, LESSON_SECTIONS, LESSON_GUIDELINES, LESSON_JSON_STRUCTURE)).encode()
+).hexdigest()[:16]
+
+def _traced_call(operation: str):
+    """Run an OpenRouter call in a client span (token usage is added by metrics.record_ai_call)"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            with tracing.start_span(f"chat {self.model}", "client", {
+                "gen_ai.system": "openrouter",
+                "gen_ai.operation.name": "chat",
+                "gen_ai.request.model": self.model,
+                "app.ai.operation": operation,
+                "server.address": urlparse(self.base_url).hostname
+            }):
+                return await func(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
 class AIService:
     def __init__(self):
         self.api_key = os.getenv("OPENROUTER_API_KEY")
         self.model = os.getenv("OPENROUTER_MODEL", "qwen/qwen3-coder:free")
-        self.base_url = "https://openrouter.ai/api/v1/chat/completions"
+        self.base_url = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1/chat/completions")
         
         if not self.api_key:
             raise ValueError("OPENROUTER_API_KEY environment variable is required")
     
-    async def generate_lesson_content(
+    def _headers(self) -> Dict[str, str]:
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+            "HTTP-Referer": "http://localhost:3000",
+            "X-Title": "LearnAnySkills Platform"
+        }
+        span = tracing.current_span()
+        if span is not None:
+            headers["traceparent"] = span.traceparent
+        return headers
+    
+    def build_lesson_content_request(
         self, 
         course_title: str, 
         lesson_title: str, 
@@ -24,7 +104,7 @@ class AIService:
         estimated_duration: str
     ) -> Dict[str, Any]:
         """
-        Generate comprehensive lesson content using OpenRouter AI
+        Assemble the chat completion payload for full lesson generation
         """
         
         # Create a detailed prompt for lesson generation
@@ -41,60 +121,20 @@ Learning Objectives:
 
 Please create a well-structured lesson that includes:
 
-1. **Introduction** (2-3 paragraphs): Engaging opening that explains what students will learn and why it's important
-2. **Main Content** (4-6 sections): Core concepts explained in clear, easy-to-understand paragraphs
-3. **Code Examples** (if applicable): Minimal, well-commented code snippets that demonstrate key concepts
-4. **Key Takeaways** (3-5 bullet points): Main concepts students should remember
-5. **Practice Exercise** (1-2 exercises): Hands-on activities to reinforce learning
+{LESSON_SECTIONS}
 
-Guidelines:
-- Use clear, conversational language appropriate for beginners to intermediate learners
-- Break complex concepts into digestible chunks
-- Include practical examples relevant to real-world scenarios
-- Keep code examples minimal and well-commented
-- Focus on understanding concepts rather than memorization
-- Make it engaging and interactive where possible
+{LESSON_GUIDELINES}
 
 Format your response as valid JSON with the following structure:
-{{
-    "introduction": "...",
-    "main_content": [
-        {{
-            "section_title": "...",
-            "content": "..."
-        }}
-    ],
-    "code_examples": [
-        {{
-            "title": "...",
-            "code": "...",
-            "explanation": "..."
-        }}
-    ],
-    "key_takeaways": ["..."],
-    "practice_exercises": [
-        {{
-            "title": "...",
-            "description": "...",
-            "difficulty": "beginner|intermediate|advanced"
-        }}
-    ]
-}}
+{LESSON_JSON_STRUCTURE}
 """
 
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-            "HTTP-Referer": "http://localhost:3000",
-            "X-Title": "LearnAnySkills Platform"
-        }
-        
         data = {
             "model": self.model,
             "messages": [
                 {
                     "role": "system",
-                    "content": "You are an expert educator and curriculum designer. Create engaging, clear, and comprehensive lesson content that helps students learn effectively. Always respond with valid JSON."
+                    "content": SYSTEM_PROMPT
                 },
                 {
                     "role": "user", 
@@ -108,6 +148,46 @@ Format your response as valid JSON with the following structure:
             "presence_penalty": 0
         }
         
+        return data
+    
+    def lesson_content_fingerprint(
+        self, 
+        course_title: str, 
+        lesson_title: str, 
+        lesson_description: str,
+        learning_objectives: list,
+        estimated_duration: str
+    ) -> str:
+        """
+        Hash of the full generation request (lesson metadata, prompt template,
+        model and sampling parameters); cached content with a different
+        fingerprint is out of date
+        """
+        data = self.build_lesson_content_request(
+            course_title, lesson_title, lesson_description, learning_objectives, estimated_duration
+        )
+        return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+    
+    @_traced_call("lesson_content")
+    async def generate_lesson_content(
+        self, 
+        course_title: str, 
+        lesson_title: str, 
+        lesson_description: str,
+        learning_objectives: list,
+        estimated_duration: str
+    ) -> Dict[str, Any]:
+        """
+        Generate comprehensive lesson content using OpenRouter AI
+        """
+        import httpx
+        
+        headers = self._headers()
+        data = self.build_lesson_content_request(
+            course_title, lesson_title, lesson_description, learning_objectives, estimated_duration
+        )
+        
+        start = time.perf_counter()
         try:
             async with httpx.AsyncClient(timeout=60.0) as client:
                 response = await client.post(
@@ -125,13 +205,18 @@ Format your response as valid JSON with the following structure:
                     # Try to parse the JSON response
                     try:
                         lesson_data = json.loads(content)
+                        metrics.record_ai_call("lesson_content", time.perf_counter() - start, result.get("usage"))
                         return {
                             "success": True,
                             "content": lesson_data,
-                            "raw_content": content
+                            "raw_content": content,
+                            "usage": result.get("usage")
                         }
                     except json.JSONDecodeError:
                         # If JSON parsing fails, return raw content
+                        metrics.record_ai_call(
+                            "lesson_content", time.perf_counter() - start, result.get("usage"), error="invalid_json"
+                        )
                         return {
                             "success": True,
                             "content": {
@@ -141,36 +226,152 @@ Format your response as valid JSON with the following structure:
                                 "key_takeaways": ["Review the generated content"],
                                 "practice_exercises": []
                             },
-                            "raw_content": content
+                            "raw_content": content,
+                            "usage": result.get("usage")
                         }
                 else:
+                    metrics.record_ai_call(
+                        "lesson_content", time.perf_counter() - start, result.get("usage"), error="empty_response"
+                    )
                     return {
                         "success": False,
                         "error": "No content generated by AI model",
-                        "content": None
+                        "content": None,
+                        "usage": result.get("usage")
                     }
                     
         except httpx.HTTPStatusError as e:
+            metrics.record_ai_call("lesson_content", time.perf_counter() - start, error=f"http_{e.response.status_code}")
             return {
                 "success": False,
                 "error": f"API request failed: {e.response.status_code} - {e.response.text}",
                 "content": None
             }
         except Exception as e:
+            metrics.record_ai_call("lesson_content", time.perf_counter() - start, error=type(e).__name__)
             return {
                 "success": False,
                 "error": f"Unexpected error: {str(e)}",
                 "content": None
             }
     
-    async def generate_lesson_overview(
+    def build_course_batch_request(self, course_title: str, lessons: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Assemble one chat completion payload that generates several lessons of
+        a course. ``lessons`` are ``lesson_inputs`` dicts with an added ``key``
+        that the model echoes back as ``lesson_key``.
+        """
+        lesson_blocks = "\n\n".join(
+            f"""Lesson key: {lesson["key"]}
+Lesson: {lesson["lesson_title"]}
+Description: {lesson["lesson_description"]}
+Duration: {lesson["estimated_duration"]}
+Learning Objectives:
+{chr(10).join(f"- {obj}" for obj in lesson["learning_objectives"])}"""
+            for lesson in lessons
+        )
+        prompt = f"""
+You are an expert educator creating {len(lessons)} comprehensive lessons of one course for an online learning platform.
+
+Course: {course_title}
+
+{lesson_blocks}
+
+For each lesson, create a well-structured lesson that includes:
+
+{LESSON_SECTIONS}
+
+{LESSON_GUIDELINES}
+
+Format your response as valid JSON with one entry per lesson, in the order given:
+{{"lessons": [{{"lesson_key": "...", ...}}]}}
+where each entry also has the following structure:
+{LESSON_JSON_STRUCTURE}
+"""
+
+        return {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": 0.7,
+            "max_tokens": 4000 * len(lessons),
+            "top_p": 1,
+            "frequency_penalty": 0,
+            "presence_penalty": 0
+        }
+    
+    @staticmethod
+    def parse_course_batch(content: str, keys: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Split a batched response into lesson content by key. Lessons that are
+        missing or malformed are left out, so the caller can generate them one
+        by one.
+        """
+        try:
+            document = json.loads(content)
+        except (json.JSONDecodeError, TypeError):
+            return {}
+        entries = document.get("lessons") if isinstance(document, dict) else None
+        if not isinstance(entries, list):
+            return {}
+        lessons = {}
+        for entry in entries:
+            if not isinstance(entry, dict):
+                continue
+            key = str(entry.pop("lesson_key", ""))
+            if key not in keys or key in lessons:
+                continue
+            if not isinstance(entry.get("introduction"), str) or not isinstance(entry.get("main_content"), list):
+                continue
+            lessons[key] = {"content": entry, "raw_content": json.dumps(entry)}
+        return lessons
+    
+    @_traced_call("course_batch")
+    async def generate_course_batch(self, course_title: str, lessons: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Generate several lessons of a course in a single call. ``lessons`` maps
+        each parsed lesson key to its content and raw JSON.
+        """
+        import httpx
+        
+        data = self.build_course_batch_request(course_title, lessons)
+        keys = [lesson["key"] for lesson in lessons]
+        
+        start = time.perf_counter()
+        try:
+            async with httpx.AsyncClient(timeout=60.0 * len(lessons)) as client:
+                response = await client.post(self.base_url, headers=self._headers(), json=data)
+                response.raise_for_status()
+                result = response.json()
+            
+            content = result["choices"][0]["message"]["content"] if result.get("choices") else None
+            parsed = self.parse_course_batch(content, keys)
+            error = None if len(parsed) == len(keys) else ("invalid_json" if not parsed else "partial")
+            metrics.record_ai_call("course_batch", time.perf_counter() - start, result.get("usage"), error=error)
+            return {
+                "success": bool(parsed),
+                "lessons": parsed,
+                "usage": result.get("usage")
+            }
+        except Exception as e:
+            reason = f"http_{e.response.status_code}" if isinstance(e, httpx.HTTPStatusError) else type(e).__name__
+            metrics.record_ai_call("course_batch", time.perf_counter() - start, error=reason)
+            return {
+                "success": False,
+                "error": f"Batch request failed: {str(e)}",
+                "lessons": {}
+            }
+    
+    def build_lesson_overview_request(
         self, 
         course_title: str, 
         lesson_title: str, 
         lesson_description: str
-    ) -> Dict[str, str]:
+    ) -> Dict[str, Any]:
         """
-        Generate a brief lesson overview and introduction
+        Assemble the chat completion payload for a lesson overview
         """
         
         prompt = f"""
@@ -188,13 +389,6 @@ Write a 2-3 paragraph overview that:
 Keep it concise, clear, and exciting. Focus on the practical value and real-world applications.
 """
 
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-            "HTTP-Referer": "http://localhost:3000",
-            "X-Title": "LearnAnySkills Platform"
-        }
-        
         data = {
             "model": self.model,
             "messages": [
@@ -212,6 +406,24 @@ Keep it concise, clear, and exciting. Focus on the practical value and real-worl
             "top_p": 1
         }
         
+        return data
+    
+    @_traced_call("lesson_overview")
+    async def generate_lesson_overview(
+        self, 
+        course_title: str, 
+        lesson_title: str, 
+        lesson_description: str
+    ) -> Dict[str, Any]:
+        """
+        Generate a brief lesson overview and introduction
+        """
+        import httpx
+        
+        headers = self._headers()
+        data = self.build_lesson_overview_request(course_title, lesson_title, lesson_description)
+        
+        start = time.perf_counter()
         try:
             async with httpx.AsyncClient(timeout=30.0) as client:
                 response = await client.post(
@@ -225,11 +437,16 @@ Keep it concise, clear, and exciting. Focus on the practical value and real-worl
                 
                 if "choices" in result and len(result["choices"]) > 0:
                     overview = result["choices"][0]["message"]["content"]
+                    metrics.record_ai_call("lesson_overview", time.perf_counter() - start, result.get("usage"))
                     return {
                         "success": True,
-                        "overview": overview.strip()
+                        "overview": overview.strip(),
+                        "usage": result.get("usage")
                     }
                 else:
+                    metrics.record_ai_call(
+                        "lesson_overview", time.perf_counter() - start, result.get("usage"), error="empty_response"
+                    )
                     return {
                         "success": False,
                         "overview": f"Get ready to dive into {lesson_title}! This lesson will provide you with essential knowledge and practical skills that you can apply immediately."
@@ -237,7 +454,21 @@ Keep it concise, clear, and exciting. Focus on the practical value and real-worl
                     
         except Exception as e:
             # Fallback overview if AI fails
+            reason = f"http_{e.response.status_code}" if isinstance(e, httpx.HTTPStatusError) else type(e).__name__
+            metrics.record_ai_call("lesson_overview", time.perf_counter() - start, error=reason)
             return {
                 "success": False,
                 "overview": f"Welcome to {lesson_title}! In this lesson, you'll learn {lesson_description.lower()}. Let's get started on this exciting learning journey!"
-            }
\ No newline at end of file
+            }
+
+_ai_service: Optional[AIService] = None
+
+def get_ai_service() -> AIService:
+    """
+    Shared AIService, built on first use so that importing the API (catalog-only
+    workers, tests) neither requires OPENROUTER_API_KEY nor loads httpx
+    """
+    global _ai_service
+    if _ai_service is None:
+        _ai_service = AIService()
+    return _ai_service
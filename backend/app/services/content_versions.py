@@ -0,0 +1,304 @@
+"""
+Versioned lesson content with stale-while-revalidate regeneration.
+
+``lesson_content`` holds the current version of each lesson's content. It
+also holds the fingerprint of the request that produced it: a hash of the
+lesson metadata, prompt template and model (``AIService.lesson_content_fingerprint``).
+Writing a new version first copies the current one to
+``lesson_content_versions``, so any earlier version can be restored.
+
+Content becomes stale in two cases. Its fingerprint may no longer match,
+because the lesson was edited, the prompt changed or ``OPENROUTER_MODEL``
+was switched. Or it may be older than ``LESSON_CONTENT_TTL_HOURS`` (0
+disables the TTL). Stale content is still served right away, while one
+background regeneration per lesson (per process) replaces it. Rows written
+before versioning have no fingerprint and only expire through the TTL. A
+rollback pins the restored version so it is not regenerated until an
+explicit regeneration.
+"""
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Set
+
+from fastapi import BackgroundTasks
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from ..database.config import SessionLocal
+from ..models import Lesson, LessonContent, LessonContentVersion
+from . import metrics, search
+from .ai_service import PROMPT_VERSION, AIService, get_ai_service
+from .page_cache import course_pages
+from .tracing import traced
+
+logger = logging.getLogger(__name__)
+
+LESSON_CONTENT_TTL_HOURS = float(os.getenv("LESSON_CONTENT_TTL_HOURS", "0"))
+FINGERPRINT_CACHE_SIZE = int(os.getenv("FINGERPRINT_CACHE_SIZE", "10000"))
+
+# Columns copied between the current row and its archived versions
+VERSIONED_FIELDS = (
+    "ai_generated_content", "content_summary", "key_concepts", "code_examples", "exercises",
+    "fingerprint", "model", "generated_at"
+)
+
+def lesson_inputs(lesson: Lesson) -> Dict[str, Any]:
+    """Keyword arguments for AIService.generate_lesson_content / lesson_content_fingerprint"""
+    return {
+        "course_title": lesson.course.title,
+        "lesson_title": lesson.title,
+        "lesson_description": lesson.description,
+        "learning_objectives": lesson.objectives,
+        "estimated_duration": lesson.estimated_duration
+    }
+
+_fingerprints: "OrderedDict[tuple, str]" = OrderedDict()
+_fingerprints_lock = threading.Lock()
+
+def lesson_fingerprint(ai_service: AIService, lesson: Lesson) -> str:
+    """
+    ``lesson_content_fingerprint`` of a lesson, memoised per lesson on its
+    generation inputs, the model and the prompt template. The key is made of
+    values already loaded, so a hit neither builds the prompt nor hashes it;
+    unlike ``updated_at`` it also tells apart two edits within the same second.
+    """
+    inputs = lesson_inputs(lesson)
+    key = (
+        lesson.id, ai_service.model, PROMPT_VERSION,
+        inputs["course_title"], inputs["lesson_title"], inputs["lesson_description"],
+        json.dumps(inputs["learning_objectives"]), inputs["estimated_duration"]
+    )
+    with _fingerprints_lock:
+        fingerprint = _fingerprints.get(key)
+        if fingerprint is not None:
+            _fingerprints.move_to_end(key)
+            return fingerprint
+    fingerprint = ai_service.lesson_content_fingerprint(**inputs)
+    with _fingerprints_lock:
+        _fingerprints[key] = fingerprint
+        while len(_fingerprints) > FINGERPRINT_CACHE_SIZE:
+            _fingerprints.popitem(last=False)
+    return fingerprint
+
+def parse_lesson_content(content: LessonContent) -> Dict[str, Any]:
+    """
+    Decode cached lesson content, rebuilding the lesson structure from the
+    individual columns when the raw AI response is not valid JSON
+    """
+    try:
+        return json.loads(content.ai_generated_content)
+    except (json.JSONDecodeError, TypeError):
+        return {
+            "introduction": content.content_summary or "Lesson content",
+            "main_content": [{"section_title": "Content", "content": content.ai_generated_content}],
+            "code_examples": content.examples,
+            "key_takeaways": content.takeaways,
+            "practice_exercises": content.practice_exercises
+        }
+
+def staleness(content: LessonContent, fingerprint: Optional[str]) -> Optional[str]:
+    """Why ``content`` should be regenerated ("inputs_changed" or "expired"), or None"""
+    if content.pinned:
+        return None
+    if content.fingerprint and fingerprint and content.fingerprint != fingerprint:
+        return "inputs_changed"
+    if LESSON_CONTENT_TTL_HOURS > 0 and content.generated_at is not None:
+        now = datetime.now(timezone.utc) if content.generated_at.tzinfo else datetime.now()
+        if now - content.generated_at > timedelta(hours=LESSON_CONTENT_TTL_HOURS):
+            return "expired"
+    return None
+
+def _archive(db: Session, current: LessonContent) -> None:
+    """Copy the current version into the history unless it is already there"""
+    archived = db.query(LessonContentVersion.id).filter(
+        LessonContentVersion.lesson_id == current.lesson_id,
+        LessonContentVersion.version == current.version
+    ).first()
+    if archived is None:
+        db.add(LessonContentVersion(
+            lesson_id=current.lesson_id,
+            version=current.version,
+            **{name: getattr(current, name) for name in VERSIONED_FIELDS}
+        ))
+
+def _latest_version(db: Session, lesson_id: int) -> int:
+    return db.query(func.max(LessonContentVersion.version)).filter(
+        LessonContentVersion.lesson_id == lesson_id
+    ).scalar() or 0
+
+def store_version(
+    db: Session,
+    lesson_id: int,
+    content: Dict[str, Any],
+    raw_content: str,
+    fingerprint: Optional[str] = None,
+    model: Optional[str] = None
+) -> LessonContent:
+    """Make generated content the lesson's current version, archiving the previous one"""
+    fields = {
+        "ai_generated_content": raw_content,
+        "content_summary": content.get("introduction", "")[:500],
+        "key_concepts": content.get("key_takeaways", []),
+        "code_examples": content.get("code_examples", []),
+        "exercises": content.get("practice_exercises", []),
+        "fingerprint": fingerprint,
+        "model": model,
+        "generated_at": datetime.now()
+    }
+    current = db.query(LessonContent).filter(LessonContent.lesson_id == lesson_id).first()
+    if current is None:
+        current = LessonContent(lesson_id=lesson_id, version=_latest_version(db, lesson_id) + 1, **fields)
+        db.add(current)
+        return current
+
+    _archive(db, current)
+    current.version = max(current.version, _latest_version(db, lesson_id)) + 1
+    current.pinned = False
+    for name, value in fields.items():
+        setattr(current, name, value)
+    return current
+
+def _content_written(db: Session, lesson_id: int, key_concepts: Optional[List[str]]) -> None:
+    """Refresh the derived caches after the current version changed"""
+    search.index_lesson_content(db, lesson_id, key_concepts)
+    course_id = db.query(Lesson.course_id).filter(Lesson.id == lesson_id).scalar()
+    if course_id is not None:
+        course_pages.invalidate_course(course_id)
+
+@traced("cache_lesson_content")
+def cache_lesson_content(
+    lesson_id: int,
+    content: Dict[Any, Any],
+    raw_content: str,
+    fingerprint: Optional[str] = None,
+    model: Optional[str] = None
+) -> bool:
+    """
+    Store generated lesson content as a new version; False when the write
+    failed. Runs as a background task, so it opens (and closes) its own session.
+    """
+    db = SessionLocal()
+    try:
+        stored = store_version(db, lesson_id, content, raw_content, fingerprint, model)
+        db.commit()
+        _content_written(db, lesson_id, stored.key_concepts)
+        return True
+    except Exception as e:
+        logger.error("Caching content of lesson %s failed: %s", lesson_id, e)
+        db.rollback()
+        return False
+    finally:
+        db.close()
+
+def list_versions(db: Session, lesson_id: int) -> List[Dict[str, Any]]:
+    """The current version followed by the archived ones, newest first"""
+    current = db.query(LessonContent).filter(LessonContent.lesson_id == lesson_id).first()
+    archived = db.query(LessonContentVersion).filter(
+        LessonContentVersion.lesson_id == lesson_id
+    ).order_by(LessonContentVersion.version.desc()).all()
+
+    def describe(row, is_current: bool) -> Dict[str, Any]:
+        return {
+            "version": row.version,
+            "current": is_current,
+            "fingerprint": row.fingerprint,
+            "model": row.model,
+            "generated_at": row.generated_at,
+            "content_summary": row.content_summary
+        }
+
+    versions = [describe(current, True)] if current else []
+    versions.extend(describe(row, False) for row in archived if not current or row.version != current.version)
+    return versions
+
+def rollback(db: Session, lesson_id: int, version: int) -> LessonContent:
+    """
+    Restore an archived version as the current content (or keep the current
+    one) and pin it. Raises LookupError when the lesson has no such version.
+    """
+    current = db.query(LessonContent).filter(LessonContent.lesson_id == lesson_id).first()
+    if current is not None and current.version == version:
+        current.pinned = True
+        db.commit()
+        return current
+    target = db.query(LessonContentVersion).filter(
+        LessonContentVersion.lesson_id == lesson_id,
+        LessonContentVersion.version == version
+    ).first()
+    if target is None or current is None:
+        raise LookupError(f"Lesson {lesson_id} has no content version {version}")
+
+    _archive(db, current)
+    current.version = target.version
+    current.pinned = True
+    for name in VERSIONED_FIELDS:
+        setattr(current, name, getattr(target, name))
+    db.commit()
+    _content_written(db, lesson_id, current.key_concepts)
+    return current
+
+def _load_inputs(lesson_id: int) -> Optional[Dict[str, Any]]:
+    db = SessionLocal()
+    try:
+        lesson = db.query(Lesson).filter(Lesson.id == lesson_id, Lesson.is_active == True).first()
+        return lesson_inputs(lesson) if lesson else None
+    finally:
+        db.close()
+
+class Regenerator:
+    """At most one background regeneration per lesson at a time"""
+
+    def __init__(self):
+        self._in_flight: Set[int] = set()
+
+    def schedule(self, background_tasks: BackgroundTasks, lesson_id: int, reason: str) -> bool:
+        """Queue a regeneration unless one is already running; True when queued"""
+        if lesson_id in self._in_flight:
+            return False
+        self._in_flight.add(lesson_id)
+        background_tasks.add_task(self._regenerate, lesson_id, reason)
+        return True
+
+    @traced("regenerate_lesson_content")
+    async def _regenerate(self, lesson_id: int, reason: str) -> None:
+        try:
+            ai_service = get_ai_service()
+            inputs = await run_in_threadpool(_load_inputs, lesson_id)
+            if inputs is None:
+                return
+            result = await ai_service.generate_lesson_content(**inputs)
+            if not result["success"]:
+                metrics.LESSON_CONTENT_REGENERATIONS.inc(reason=reason, result="failed")
+                return
+            stored = await run_in_threadpool(
+                cache_lesson_content, lesson_id, result["content"], result["raw_content"],
+                ai_service.lesson_content_fingerprint(**inputs), ai_service.model
+            )
+            metrics.LESSON_CONTENT_REGENERATIONS.inc(reason=reason, result="regenerated" if stored else "failed")
+        except Exception as e:
+            logger.warning("Regenerating lesson %s content failed: %s", lesson_id, e)
+            metrics.LESSON_CONTENT_REGENERATIONS.inc(reason=reason, result="failed")
+        finally:
+            self._in_flight.discard(lesson_id)
+
+regenerator = Regenerator()
+
+def revalidate(background_tasks: BackgroundTasks, lesson: Lesson, content: LessonContent) -> Optional[str]:
+    """
+    Check cached content against the current generation inputs and queue a
+    regeneration when it is stale. Returns the staleness reason, if any;
+    the caller keeps serving ``content`` either way.
+    """
+    try:
+        ai_service = get_ai_service()
+    except ValueError:
+        return None  # Nothing could regenerate it
+    reason = staleness(content, lesson_fingerprint(ai_service, lesson))
+    if reason:
+        regenerator.schedule(background_tasks, lesson.id, reason)
+    return reason
@@ -0,0 +1,289 @@
+"""
+Whole-course lesson generation in batched model calls.
+
+Generating a course one lesson at a time resends the system prompt, the
+course context and the lesson instructions with every call. This module
+packs several lessons of a course into one ``AIService.generate_course_batch``
+call. The lessons are taken in order, for as long as the estimated prompt
+plus ``COURSE_BATCH_TOKENS_PER_LESSON`` of output per lesson stays within
+``COURSE_BATCH_TOKEN_BUDGET``, up to ``COURSE_BATCH_MAX_LESSONS`` per call.
+The response is split into one ``LessonContent`` version per lesson. Any
+lesson that is missing from the response, or fails to parse, is generated
+with its own ``generate_lesson_content`` call instead, as is a lesson that
+fits no batch with another (``single``).
+
+Content is stored with the lesson's per-lesson fingerprint. Batched content
+is therefore only regenerated when the lesson itself, the prompt or the model
+changes.
+
+Each run returns a report of the tokens and wall-clock time it used, next to
+an estimate for generating the same lessons one call at a time:
+
+- prompt tokens: the size of the per-lesson requests, calibrated against the
+  prompt tokens the provider reported for the batch;
+- completion tokens: assumed to be the same either way;
+- time: the mean ``lesson_content`` latency seen by this process.
+
+Run it with::
+
+    python -m app.services.course_generation --course-id 1
+
+or start a background run through the admin API, which ``course_runs`` tracks.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import BackgroundTasks
+from starlette.concurrency import run_in_threadpool
+
+from ..database.config import SessionLocal
+from ..models import Course, Lesson, LessonContent
+from . import metrics
+from .ai_service import AIService, get_ai_service
+from .content_versions import cache_lesson_content, lesson_inputs
+from .tracing import traced
+
+logger = logging.getLogger(__name__)
+
+COURSE_BATCH_TOKEN_BUDGET = int(os.getenv("COURSE_BATCH_TOKEN_BUDGET", "32000"))
+COURSE_BATCH_TOKENS_PER_LESSON = int(os.getenv("COURSE_BATCH_TOKENS_PER_LESSON", "4000"))
+COURSE_BATCH_MAX_LESSONS = int(os.getenv("COURSE_BATCH_MAX_LESSONS", "6"))
+# Finished admin API runs whose status is kept for lookup
+COURSE_RUNS_KEPT = int(os.getenv("COURSE_RUNS_KEPT", "100"))
+
+def estimate_tokens(payload: Dict[str, Any]) -> int:
+    """Rough prompt size of a chat completion payload (about four characters per token)"""
+    return sum(len(message["content"]) for message in payload["messages"]) // 4
+
+def plan_batches(ai_service: AIService, course_title: str, lessons: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """Split lessons, in order, into batches that fit the token budget"""
+    batches: List[List[Dict[str, Any]]] = []
+    batch: List[Dict[str, Any]] = []
+    for lesson in lessons:
+        candidate = batch + [lesson]
+        prompt = estimate_tokens(ai_service.build_course_batch_request(course_title, candidate))
+        fits = prompt + COURSE_BATCH_TOKENS_PER_LESSON * len(candidate) <= COURSE_BATCH_TOKEN_BUDGET
+        if batch and (not fits or len(candidate) > COURSE_BATCH_MAX_LESSONS):
+            batches.append(batch)
+            batch = [lesson]
+        else:
+            batch = candidate
+    if batch:
+        batches.append(batch)
+    return batches
+
+def _load_course(course_id: int, regenerate: bool) -> Optional[Dict[str, Any]]:
+    db = SessionLocal()
+    try:
+        course = db.query(Course).filter(Course.id == course_id).first()
+        if course is None:
+            return None
+        query = db.query(Lesson).filter(Lesson.course_id == course_id, Lesson.is_active == True)
+        if not regenerate:
+            query = query.outerjoin(LessonContent, LessonContent.lesson_id == Lesson.id).filter(
+                LessonContent.id == None
+            )
+        lessons = [
+            {"id": lesson.id, "key": str(lesson.id), **lesson_inputs(lesson)}
+            for lesson in query.order_by(Lesson.lesson_number, Lesson.id).all()
+        ]
+        return {"title": course.title, "lessons": lessons}
+    finally:
+        db.close()
+
+def _inputs(lesson: Dict[str, Any]) -> Dict[str, Any]:
+    return {name: value for name, value in lesson.items() if name not in ("id", "key")}
+
+def _tokens(usage: Optional[dict], name: str) -> int:
+    return (usage or {}).get(name) or 0
+
+@traced("generate_course")
+async def generate_course(course_id: int, regenerate: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Generate the lessons of a course that have no content yet (every active
+    lesson with ``regenerate``). Returns the savings report, or None when the
+    course does not exist.
+    """
+    ai_service = get_ai_service()
+    course = await run_in_threadpool(_load_course, course_id, regenerate)
+    if course is None:
+        return None
+
+    start = time.perf_counter()
+    prompt_tokens = completion_tokens = 0
+    per_lesson_tokens = 0.0  # Estimate for the batched lessons, had each been its own call
+    batch_seconds = 0.0
+    batched: List[int] = []
+    fallback: List[int] = []
+    single: List[int] = []
+    failed: List[int] = []
+    fallback_seconds: List[float] = []
+
+    async def store(lesson: Dict[str, Any], content: Dict[str, Any], raw_content: str) -> bool:
+        inputs = _inputs(lesson)
+        return await run_in_threadpool(
+            cache_lesson_content, lesson["id"], content, raw_content,
+            ai_service.lesson_content_fingerprint(**inputs), ai_service.model
+        )
+
+    batches = plan_batches(ai_service, course["title"], course["lessons"])
+    for batch in batches:
+        leftover = batch
+        if len(batch) > 1:
+            batch_start = time.perf_counter()
+            result = await ai_service.generate_course_batch(course["title"], batch)
+            batch_seconds += time.perf_counter() - batch_start
+            usage = result.get("usage")
+            prompt_tokens += _tokens(usage, "prompt_tokens")
+            completion_tokens += _tokens(usage, "completion_tokens")
+
+            parsed = result["lessons"]
+            done = [lesson for lesson in batch if lesson["key"] in parsed]
+            if done and usage:
+                # Scale the per-lesson request sizes by how the estimate compares to the batch as billed
+                ratio = _tokens(usage, "prompt_tokens") / max(
+                    1, estimate_tokens(ai_service.build_course_batch_request(course["title"], batch))
+                )
+                per_lesson_tokens += ratio * sum(
+                    estimate_tokens(ai_service.build_lesson_content_request(**_inputs(lesson))) for lesson in done
+                )
+                per_lesson_tokens += _tokens(usage, "completion_tokens") * len(done) / len(batch)
+            for lesson in done:
+                stored = await store(lesson, parsed[lesson["key"]]["content"], parsed[lesson["key"]]["raw_content"])
+                (batched if stored else failed).append(lesson["id"])
+            leftover = [lesson for lesson in batch if lesson["key"] not in parsed]
+            if leftover:
+                logger.info(
+                    "Course %s batch returned %s of %s lessons; generating the rest one by one",
+                    course_id, len(done), len(batch)
+                )
+
+        for lesson in leftover:
+            lesson_start = time.perf_counter()
+            result = await ai_service.generate_lesson_content(**_inputs(lesson))
+            fallback_seconds.append(time.perf_counter() - lesson_start)
+            prompt_tokens += _tokens(result.get("usage"), "prompt_tokens")
+            completion_tokens += _tokens(result.get("usage"), "completion_tokens")
+            per_lesson_tokens += _tokens(result.get("usage"), "total_tokens")
+            if not result["success"]:
+                failed.append(lesson["id"])
+                continue
+            if not await store(lesson, result["content"], result["raw_content"]):
+                failed.append(lesson["id"])
+                continue
+            (fallback if len(batch) > 1 else single).append(lesson["id"])
+
+    for outcome, lesson_ids in (("batched", batched), ("fallback", fallback), ("single", single), ("failed", failed)):
+        if lesson_ids:
+            metrics.COURSE_BATCH_LESSONS.inc(len(lesson_ids), result=outcome)
+
+    lesson_seconds = metrics.AI_LATENCY.mean(operation="lesson_content")
+    if lesson_seconds is None and fallback_seconds:
+        lesson_seconds = sum(fallback_seconds) / len(fallback_seconds)
+    model_seconds = batch_seconds + sum(fallback_seconds)
+    per_lesson_seconds = None
+    if lesson_seconds is not None:
+        per_lesson_seconds = lesson_seconds * len(batched) + sum(fallback_seconds)
+    elif not batched:
+        per_lesson_seconds = model_seconds
+    total_tokens = prompt_tokens + completion_tokens
+    report = {
+        "course_id": course_id,
+        "lessons": len(course["lessons"]),
+        "batches": sum(1 for batch in batches if len(batch) > 1),
+        "batched": batched,
+        "fallback": fallback,
+        "single": single,
+        "failed": failed,
+        "tokens": {
+            "prompt": prompt_tokens,
+            "completion": completion_tokens,
+            "total": total_tokens,
+            "per_lesson_estimate": round(per_lesson_tokens),
+            "saved_estimate": round(per_lesson_tokens) - total_tokens
+        },
+        "seconds": {
+            "elapsed": round(time.perf_counter() - start, 3),
+            "model": round(model_seconds, 3),
+            "per_lesson_estimate": round(per_lesson_seconds, 3) if per_lesson_seconds is not None else None,
+            "saved_estimate": round(per_lesson_seconds - model_seconds, 3) if per_lesson_seconds is not None else None
+        }
+    }
+    logger.info("Generated course %s: %s", course_id, json.dumps(report))
+    return report
+
+class CourseRuns:
+    """Background course generation runs, at most one per course at a time"""
+
+    def __init__(self, max_runs: int = COURSE_RUNS_KEPT):
+        self.max_runs = max_runs
+        self._runs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._active: Dict[int, str] = {}
+
+    def start(self, background_tasks: BackgroundTasks, course_id: int, regenerate: bool) -> Tuple[Dict[str, Any], bool]:
+        """
+        Queue a run of the course unless one is already queued or running.
+        Returns the run and whether it was queued by this call.
+        """
+        run_id = self._active.get(course_id)
+        if run_id is not None:
+            return self._runs[run_id], False
+        run = {
+            "id": uuid.uuid4().hex,
+            "course_id": course_id,
+            "regenerate": regenerate,
+            "status": "queued",
+            "queued_at": datetime.utcnow().isoformat(),
+            "finished_at": None,
+            "report": None,
+            "error": None
+        }
+        self._runs[run["id"]] = run
+        self._active[course_id] = run["id"]
+        finished = [run_id for run_id, old in self._runs.items() if old["finished_at"] is not None]
+        for run_id in finished[:len(self._runs) - self.max_runs]:
+            del self._runs[run_id]
+        background_tasks.add_task(self._run, run)
+        return run, True
+
+    def get(self, run_id: str) -> Optional[Dict[str, Any]]:
+        return self._runs.get(run_id)
+
+    async def _run(self, run: Dict[str, Any]) -> None:
+        run["status"] = "running"
+        try:
+            report = await generate_course(run["course_id"], regenerate=run["regenerate"])
+            if report is None:
+                run["status"], run["error"] = "failed", "Course not found"
+            else:
+                run["status"], run["report"] = "completed", report
+        except Exception as e:
+            logger.warning("Generating course %s failed: %s", run["course_id"], e)
+            run["status"], run["error"] = "failed", str(e)
+        finally:
+            run["finished_at"] = datetime.utcnow().isoformat()
+            self._active.pop(run["course_id"], None)
+
+course_runs = CourseRuns()
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a course's lesson content in batched model calls")
+    parser.add_argument("--course-id", type=int, required=True)
+    parser.add_argument("--regenerate", action="store_true", help="Also replace lessons that already have content")
+    args = parser.parse_args()
+
+    report = asyncio.run(generate_course(args.course_id, regenerate=args.regenerate))
+    if report is None:
+        parser.error(f"course {args.course_id} not found")
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+Idempotency keys for lesson generation and progress POSTs.
+
+Clients retry when a generation outlasts their timeout. Without a key, each
+retry starts another model call, and each retried progress POST adds its time
+again. A request with an ``Idempotency-Key`` header to one of
+``IDEMPOTENT_ROUTES`` is therefore recorded under (path, key):
+
+- the first request runs normally and its response (status, headers and body)
+  is kept for ``IDEMPOTENCY_TTL_SECONDS``;
+- a duplicate that arrives while the first is still running waits for it and
+  gets the same response;
+- a later duplicate gets the stored response. It does not reach the route,
+  so no work, background task or progress write is repeated.
+
+Replayed responses carry ``Idempotent-Replayed: true``. Reusing a key with a
+different body is refused with ``422``. Responses that say the request was not
+carried out are not stored, so a retry with the same key runs again. These
+are ``5xx`` responses, shed requests and quota refusals (``429``).
+
+Keys should be random (a UUID per logical operation). The store is an LRU of
+at most ``IDEMPOTENCY_MAX_ENTRIES`` keys per worker process.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import List, NamedTuple, Optional, Tuple
+
+from . import metrics
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "3600"))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+MAX_KEY_LENGTH = 255
+
+IDEMPOTENT_ROUTES = re.compile(r"^/api/ai/lessons/[^/]+/(generate|overview|progress)$")
+
+class StoredResponse(NamedTuple):
+    status: int
+    headers: List[Tuple[bytes, bytes]]
+    body: bytes
+
+class _Entry:
+    __slots__ = ("fingerprint", "done", "response", "expires")
+
+    def __init__(self, fingerprint: str):
+        self.fingerprint = fingerprint
+        self.done = asyncio.Event()
+        self.response: Optional[StoredResponse] = None
+        self.expires = float("inf")
+
+def _storable(status: int) -> bool:
+    return status < 500 and status != 429
+
+class IdempotencyStore:
+    """In-flight and completed requests by (path, key), least recently used first"""
+
+    def __init__(self, max_entries: int = IDEMPOTENCY_MAX_ENTRIES, ttl: float = IDEMPOTENCY_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def claim(self, key: Tuple[str, str], fingerprint: str) -> Tuple[_Entry, bool]:
+        """The entry for ``key`` and whether the caller owns it (must run the request)"""
+        entry = self._entries.get(key)
+        if entry is not None and entry.done.is_set() and entry.expires <= time.monotonic():
+            del self._entries[key]
+            entry = None
+        if entry is not None:
+            self._entries.move_to_end(key)
+            return entry, False
+        entry = self._entries[key] = _Entry(fingerprint)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry, True
+
+    def complete(self, key: Tuple[str, str], entry: _Entry, response: Optional[StoredResponse]) -> None:
+        """Publish the owner's response to waiters; without a storable one the key is released"""
+        if response is not None and _storable(response.status):
+            entry.response = response
+            entry.expires = time.monotonic() + self.ttl
+        elif self._entries.get(key) is entry:
+            del self._entries[key]
+        entry.done.set()
+
+idempotency_store = IdempotencyStore()
+
+metrics.IDEMPOTENCY_ENTRIES.set_callback(lambda: {(): len(idempotency_store)})
+
+class IdempotencyMiddleware:
+    """Pure ASGI middleware that runs each idempotent request once per key"""
+
+    def __init__(self, app, store: Optional[IdempotencyStore] = None):
+        self.app = app
+        self.store = store or idempotency_store
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("method") != "POST" or not IDEMPOTENT_ROUTES.match(scope.get("path", "")):
+            await self.app(scope, receive, send)
+            return
+        raw_key = dict(scope.get("headers") or []).get(IDEMPOTENCY_HEADER.lower().encode())
+        if raw_key is None:
+            await self.app(scope, receive, send)
+            return
+        idempotency_key = raw_key.decode("latin-1").strip()
+        if not idempotency_key or len(idempotency_key) > MAX_KEY_LENGTH:
+            await self._send_json(send, 400, f"{IDEMPOTENCY_HEADER} must be 1-{MAX_KEY_LENGTH} characters")
+            return
+
+        # Read the body up front: it identifies the request and is replayed to the route
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        body = b"".join(chunks)
+        fingerprint = hashlib.sha256(body).hexdigest()
+        key = (scope["path"], idempotency_key)
+
+        while True:
+            entry, owner = self.store.claim(key, fingerprint)
+            if entry.fingerprint != fingerprint:
+                metrics.IDEMPOTENCY_REQUESTS.inc(result="mismatch")
+                await self._send_json(
+                    send, 422, f"{IDEMPOTENCY_HEADER} was already used with a different request body"
+                )
+                return
+            if owner:
+                break
+            joined = not entry.done.is_set()
+            await entry.done.wait()
+            if entry.response is not None:
+                metrics.IDEMPOTENCY_REQUESTS.inc(result="joined" if joined else "replayed")
+                await self._replay(send, entry.response)
+                return
+            # The original was not carried out; take over the key and run it ourselves
+
+        metrics.IDEMPOTENCY_REQUESTS.inc(result="new")
+        await self._run(scope, body, receive, send, key, entry)
+
+    async def _run(self, scope, body: bytes, receive, send, key, entry: _Entry) -> None:
+        body_sent = False
+
+        async def replay_receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        status = 500
+        headers: List[Tuple[bytes, bytes]] = []
+        chunks: List[bytes] = []
+        response = None
+
+        async def capture_send(message):
+            nonlocal status, headers, response
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers") or [])
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body", False):
+                    response = StoredResponse(status, headers, b"".join(chunks))
+                    # Waiters are released as soon as the response is complete
+                    self.store.complete(key, entry, response)
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, capture_send)
+        finally:
+            if not entry.done.is_set():
+                self.store.complete(key, entry, response)
+
+    @staticmethod
+    async def _replay(send, response: StoredResponse) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": response.status,
+            "headers": response.headers + [(REPLAYED_HEADER.lower().encode(), b"true")]
+        })
+        await send({"type": "http.response.body", "body": response.body})
+
+    @staticmethod
+    async def _send_json(send, status: int, detail: str) -> None:
+        body = json.dumps({"detail": detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        })
+        await send({"type": "http.response.body", "body": body})
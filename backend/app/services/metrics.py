@@ -0,0 +1,415 @@
+"""
+In-process metrics registry rendered in the Prometheus text exposition format.
+
+Everything here is kept in memory and updated with a single lock-protected
+dictionary write, so instrumenting the hot path costs microseconds and needs
+no external services.
+"""
+import abc
+import bisect
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from ..database import query_tracker
+from . import profiling, tracing
+
+CONTENT_TYPE_LATEST = "text/plain; version=0.0.4"
+
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class _Metric(abc.ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    @abc.abstractmethod
+    def collect(self) -> List[str]:
+        """Exposition lines for every labelled sample of this metric"""
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.collect())
+        return "\n".join(lines)
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        callback: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None
+    ):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._callback = callback
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set_callback(self, callback: Callable[[], Dict[Tuple[str, ...], float]]) -> None:
+        """Compute the gauge lazily at scrape time instead of on every update"""
+        self._callback = callback
+
+    def collect(self) -> List[str]:
+        if self._callback is not None:
+            try:
+                items = list(self._callback().items())
+            except Exception:
+                items = []
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [bucket counts..., +Inf count, sum]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def mean(self, **labels) -> Optional[float]:
+        """Mean of the observed values, or None before the first observation"""
+        with self._lock:
+            series = self._values.get(self._key(labels))
+            count = sum(series[:-1]) if series else 0
+            return series[-1] / count if count else None
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._values.items()]
+        lines = []
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {_format_value(cumulative)}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{labels} {_format_value(cumulative)}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = (), callback=None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+REGISTRY = MetricsRegistry()
+
+# HTTP
+HTTP_REQUESTS = REGISTRY.counter(
+    "http_requests_total", "HTTP requests by route template and status code", ("method", "route", "status")
+)
+HTTP_LATENCY = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template", ("method", "route")
+)
+HTTP_IN_PROGRESS = REGISTRY.gauge("http_requests_in_progress", "HTTP requests currently being served")
+DB_QUERIES_PER_REQUEST = REGISTRY.histogram(
+    "db_queries_per_request", "SQL statements executed per HTTP request", ("route",), QUERY_COUNT_BUCKETS
+)
+
+# Database pool
+DB_POOL_CHECKOUT = REGISTRY.histogram(
+    "db_pool_checkout_seconds", "Time spent waiting for a pooled database connection"
+)
+DB_POOL_CONNECTIONS = REGISTRY.gauge(
+    "db_pool_connections", "Database pool connections by state", ("state",)
+)
+DB_POOL_UTILIZATION = REGISTRY.gauge(
+    "db_pool_utilization", "Checked-out connections as a fraction of the pool capacity"
+)
+
+# AI service
+AI_LATENCY = REGISTRY.histogram(
+    "ai_request_duration_seconds", "OpenRouter request latency by operation", ("operation",)
+)
+AI_TOKENS = REGISTRY.counter(
+    "ai_tokens_total", "Model tokens reported by OpenRouter", ("operation", "type")
+)
+AI_ERRORS = REGISTRY.counter(
+    "ai_errors_total", "Failed or unusable OpenRouter responses", ("operation", "reason")
+)
+
+# Lesson content cache
+LESSON_CONTENT_CACHE = REGISTRY.counter(
+    "lesson_content_cache_requests_total", "Lesson content lookups served from the database cache", ("result",)
+)
+
+def _cache_hit_ratio() -> Dict[Tuple[str, ...], float]:
+    hits = LESSON_CONTENT_CACHE.value(result="hit")
+    total = hits + LESSON_CONTENT_CACHE.value(result="miss")
+    return {(): hits / total if total else 0.0}
+
+LESSON_CONTENT_CACHE_HIT_RATIO = REGISTRY.gauge(
+    "lesson_content_cache_hit_ratio", "Share of lesson content lookups answered from the cache",
+    callback=_cache_hit_ratio
+)
+
+# Speculative lesson prefetch
+LESSON_PREFETCH = REGISTRY.counter(
+    "lesson_prefetch_total", "Speculative next-lesson generations by outcome", ("result",)
+)
+LESSON_PREFETCH_USES = REGISTRY.counter(
+    "lesson_prefetch_used_total",
+    "Prefetched lessons later requested by a learner (cached: after it finished, joined: while in flight)",
+    ("result",)
+)
+
+def _prefetch_hit_ratio() -> Dict[Tuple[str, ...], float]:
+    used = LESSON_PREFETCH_USES.value(result="cached") + LESSON_PREFETCH_USES.value(result="joined")
+    generated = LESSON_PREFETCH.value(result="generated")
+    return {(): used / generated if generated else 0.0}
+
+LESSON_PREFETCH_HIT_RATIO = REGISTRY.gauge(
+    "lesson_prefetch_hit_ratio", "Share of prefetched lessons that a learner went on to open",
+    callback=_prefetch_hit_ratio
+)
+
+def record_prefetch(result: str) -> None:
+    LESSON_PREFETCH.inc(result=result)
+
+def record_prefetch_use(result: str) -> None:
+    LESSON_PREFETCH_USES.inc(result=result)
+
+# Whole-course generation
+COURSE_BATCH_LESSONS = REGISTRY.counter(
+    "course_batch_lessons_total", "Lessons generated by whole-course runs by outcome", ("result",)
+)
+
+# Lesson content versions
+LESSON_CONTENT_REGENERATIONS = REGISTRY.counter(
+    "lesson_content_regenerations_total",
+    "Background regenerations of stale lesson content by reason and outcome", ("reason", "result")
+)
+
+# WebSocket progress channel
+PROGRESS_CONNECTIONS = REGISTRY.gauge("progress_channel_connections", "Open WebSocket progress connections")
+PROGRESS_HEARTBEATS = REGISTRY.counter("progress_channel_heartbeats_total", "Heartbeats received on progress connections")
+PROGRESS_WRITES = REGISTRY.counter(
+    "progress_channel_writes_total", "user_progress rows written by the progress channel by trigger", ("trigger",)
+)
+
+# Admission control (gauges are computed from the pools by services.admission)
+ADMISSION_IN_FLIGHT = REGISTRY.gauge(
+    "admission_in_flight", "Requests holding an admission slot by route class", ("route_class",)
+)
+ADMISSION_QUEUE_DEPTH = REGISTRY.gauge(
+    "admission_queue_depth", "Requests waiting for an admission slot by route class", ("route_class",)
+)
+ADMISSION_LIMIT = REGISTRY.gauge(
+    "admission_limit", "Configured admission limits by route class", ("route_class", "limit")
+)
+ADMISSION_REJECTED = REGISTRY.counter(
+    "admission_rejected_total", "Requests shed with 503 by route class and reason", ("route_class", "reason")
+)
+ADMISSION_WAIT = REGISTRY.histogram(
+    "admission_queue_wait_seconds", "Time admitted requests waited for a slot", ("route_class",)
+)
+
+# Idempotency keys
+IDEMPOTENCY_REQUESTS = REGISTRY.counter(
+    "idempotency_requests_total",
+    "Requests with an Idempotency-Key by outcome (new, joined, replayed, mismatch)", ("result",)
+)
+IDEMPOTENCY_ENTRIES = REGISTRY.gauge("idempotency_entries", "Idempotency keys held in this worker's store")
+
+# Generation quotas
+QUOTA_REJECTED = REGISTRY.counter(
+    "quota_rejected_total", "AI requests refused with 429 by quota scope and kind", ("scope", "kind")
+)
+QUOTA_TOKENS = REGISTRY.counter(
+    "quota_tokens_charged_total", "Model tokens charged to generation quotas by scope", ("scope",)
+)
+
+def record_cache_lookup(hit: bool) -> None:
+    LESSON_CONTENT_CACHE.inc(result="hit" if hit else "miss")
+
+def record_ai_call(operation: str, duration: float, usage: Optional[dict] = None, error: Optional[str] = None) -> None:
+    """Record latency, token usage and failures of one OpenRouter call"""
+    AI_LATENCY.observe(duration, operation=operation)
+    profiling.record_ai_call(duration)
+    tracing.record_ai_call(operation, usage, error)
+    if usage:
+        AI_TOKENS.inc(usage.get("prompt_tokens", 0) or 0, operation=operation, type="prompt")
+        AI_TOKENS.inc(usage.get("completion_tokens", 0) or 0, operation=operation, type="completion")
+    if error:
+        AI_ERRORS.inc(operation=operation, reason=error)
+
+def instrument_engine(engine) -> None:
+    """
+    Attach pool and per-request query instrumentation to a SQLAlchemy engine
+    """
+    pool = engine.pool
+    pool_connect = pool.connect
+
+    def timed_connect():
+        start = time.perf_counter()
+        try:
+            return pool_connect()
+        finally:
+            DB_POOL_CHECKOUT.observe(time.perf_counter() - start)
+
+    pool.connect = timed_connect
+
+    def pool_state() -> Dict[Tuple[str, ...], float]:
+        state = {}
+        for name in ("size", "checkedout", "checkedin", "overflow"):
+            getter = getattr(engine.pool, name, None)
+            if getter is not None:
+                state[(name,)] = getter()
+        return state
+
+    def pool_utilization() -> Dict[Tuple[str, ...], float]:
+        current = engine.pool
+        size = getattr(current, "size", None)
+        checked_out = getattr(current, "checkedout", None)
+        if size is None or checked_out is None:
+            return {}
+        capacity = size() + max(getattr(current, "_max_overflow", 0), 0)
+        return {(): checked_out() / capacity if capacity else 0.0}
+
+    DB_POOL_CONNECTIONS.set_callback(pool_state)
+    DB_POOL_UTILIZATION.set_callback(pool_utilization)
+    query_tracker.instrument_engine(engine)
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording latency, status and query count per route template.
+
+    Query counts come from the enclosing ``QueryTrackerMiddleware`` scope, so
+    this middleware must be added before it (i.e. run inside it).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_code[0] = message["status"]
+            await send(message)
+
+        HTTP_IN_PROGRESS.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - start
+            HTTP_IN_PROGRESS.dec()
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            method = scope.get("method", "")
+            HTTP_REQUESTS.inc(method=method, route=route_path, status=str(status_code[0]))
+            HTTP_LATENCY.observe(duration, method=method, route=route_path)
+            stats = query_tracker.current_stats()
+            if stats is not None:
+                DB_QUERIES_PER_REQUEST.observe(stats.count, route=route_path)
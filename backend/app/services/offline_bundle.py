@@ -0,0 +1,342 @@
+"""
+Offline course bundles: a course's metadata and all of its stored lesson
+content in one download, as a ZIP archive or as NDJSON.
+
+- ``zip``: ``course.json`` plus one ``lessons/<number>-<id>.json`` per lesson
+  that has content, each entry deflated;
+- ``ndjson``: a ``{"type": "course", ...}`` line followed by one
+  ``{"type": "lesson", ...}`` line per lesson with content.
+
+Bundles are byte-for-byte deterministic for the same course state. That gives
+them an exact ``Content-Length`` and a strong ETag, and lets an interrupted
+download resume with ``Range``/``If-Range``. The byte layout is described by
+a manifest: the offset, size and CRC of every entry, but none of the content.
+Building a manifest reads the lessons once through a server-side cursor. It is
+cached per worker under a version key: a hash of the course's and lessons'
+update timestamps and content versions, which one cheap query returns.
+
+Streaming reads the content again, one lesson at a time, so memory stays flat
+whatever the course size. A range request only reads, and compresses, the
+lessons whose bytes it overlaps. If a lesson changed since the manifest was
+built, the stream is cut short rather than send bytes that do not match. The
+client then gets a new ETag and a full download on its next request.
+"""
+import hashlib
+import json
+import os
+import struct
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from ..database import replicas
+from ..database.config import SessionLocal
+from ..models import Course, Lesson, LessonContent
+from .content_versions import parse_lesson_content
+
+BUNDLE_FORMATS = {"zip": "application/zip", "ndjson": "application/x-ndjson"}
+BUNDLE_CHUNK_SIZE = int(os.getenv("BUNDLE_CHUNK_SIZE", "50"))  # Lessons per cursor fetch
+BUNDLE_MANIFEST_CACHE_SIZE = int(os.getenv("BUNDLE_MANIFEST_CACHE_SIZE", "128"))
+
+class BundleEntry(NamedTuple):
+    name: str
+    lesson_id: Optional[int]  # None for the course entry
+    offset: int  # Of the entry's first byte (its ZIP local header) in the bundle
+    header: bytes
+    crc: int
+    size: int  # Uncompressed
+    data_size: int  # As stored in the bundle
+
+class Manifest(NamedTuple):
+    course_id: int
+    fmt: str
+    filename: str
+    etag: str
+    entries: List[BundleEntry]
+    tail: bytes  # ZIP central directory and end record
+    length: int
+
+def _session() -> Session:
+    replica = replicas.choose_replica()
+    return replica.SessionLocal() if replica is not None else SessionLocal()
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def _encode(document: Dict[str, Any], fmt: str) -> bytes:
+    if fmt == "ndjson":
+        return (json.dumps(document, default=_json_default, ensure_ascii=False, separators=(",", ":")) + "\n").encode()
+    return json.dumps(document, default=_json_default, ensure_ascii=False, indent=2).encode()
+
+def _deflate(data: bytes) -> bytes:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush()
+
+def _dos_timestamp(value: Optional[datetime]) -> Tuple[int, int]:
+    if value is None or value.year < 1980:
+        return 0, (1 << 5) | 1  # 1980-01-01 00:00
+    return (
+        (value.hour << 11) | (value.minute << 5) | (value.second // 2),
+        ((value.year - 1980) << 9) | (value.month << 5) | value.day
+    )
+
+# ZIP records (no data descriptors: sizes and CRCs are known up front)
+_UTF8_FLAG = 0x0800
+
+def _local_header(name: bytes, crc: int, data_size: int, size: int, modified: Optional[datetime]) -> bytes:
+    time_, date = _dos_timestamp(modified)
+    return struct.pack(
+        "<IHHHHHIIIHH", 0x04034B50, 20, _UTF8_FLAG, zlib.DEFLATED, time_, date, crc, data_size, size, len(name), 0
+    ) + name
+
+def _central_header(entry: BundleEntry) -> bytes:
+    name = entry.name.encode()
+    # The local header holds the same version, flags, method, time, date, CRC and sizes
+    fields = struct.unpack("<IHHHHHIIIHH", entry.header[:30])
+    return struct.pack(
+        "<IHHHHHHIIIHHHHHII", 0x02014B50, 20, fields[1], fields[2], fields[3], fields[4], fields[5],
+        entry.crc, entry.data_size, entry.size, len(name), 0, 0, 0, 0, 0, entry.offset
+    ) + name
+
+def _zip_tail(entries: List[BundleEntry], directory_offset: int) -> bytes:
+    directory = b"".join(_central_header(entry) for entry in entries)
+    return directory + struct.pack(
+        "<IHHHHIIH", 0x06054B50, 0, 0, len(entries), len(entries), len(directory), directory_offset, 0
+    )
+
+# Documents
+def _course_document(course: Course, lessons) -> Dict[str, Any]:
+    return {
+        "id": course.id,
+        "slug": course.slug,
+        "title": course.title,
+        "description": course.description,
+        "overview": course.overview,
+        "difficulty_level": course.difficulty_level,
+        "estimated_duration": course.estimated_duration,
+        "lesson_count": len(lessons),
+        "lessons": [
+            {
+                "id": lesson.id,
+                "lesson_number": lesson.lesson_number,
+                "title": lesson.title,
+                "description": lesson.description,
+                "estimated_duration": lesson.estimated_duration,
+                "learning_objectives": lesson.objectives,
+                "has_content": version is not None,
+                "version": version
+            }
+            for lesson, version in lessons
+        ]
+    }
+
+def _lesson_document(lesson: Lesson, content: LessonContent) -> Dict[str, Any]:
+    return {
+        "lesson": {
+            "id": lesson.id,
+            "lesson_number": lesson.lesson_number,
+            "title": lesson.title,
+            "description": lesson.description,
+            "estimated_duration": lesson.estimated_duration,
+            "learning_objectives": lesson.objectives
+        },
+        "content": parse_lesson_content(content),
+        "version": content.version,
+        "model": content.model,
+        "generated_at": content.generated_at
+    }
+
+def _entry_name(lesson: Optional[Lesson]) -> str:
+    return "course.json" if lesson is None else f"lessons/{lesson.lesson_number:03d}-{lesson.id}.json"
+
+def _entry_bytes(document: Dict[str, Any], fmt: str, kind: str) -> bytes:
+    if fmt == "ndjson":
+        return _encode({"type": kind, **document}, fmt)
+    return _encode(document, fmt)
+
+# Queries
+def _course(db: Session, course_id: int) -> Optional[Course]:
+    return db.query(Course).filter(Course.id == course_id, Course.is_active == True).first()
+
+def _lesson_versions(db: Session, course_id: int):
+    return db.query(Lesson, LessonContent.version).outerjoin(
+        LessonContent, LessonContent.lesson_id == Lesson.id
+    ).filter(
+        Lesson.course_id == course_id, Lesson.is_active == True
+    ).order_by(Lesson.lesson_number, Lesson.id).all()
+
+def _lessons_with_content(db: Session, course_id: int, lesson_ids: Optional[List[int]] = None):
+    """(Lesson, LessonContent) pairs in bundle order, streamed from a server-side cursor"""
+    query = select(Lesson, LessonContent).join(
+        LessonContent, LessonContent.lesson_id == Lesson.id
+    ).where(Lesson.course_id == course_id, Lesson.is_active == True)
+    if lesson_ids is not None:
+        query = query.where(Lesson.id.in_(lesson_ids))
+    query = query.order_by(Lesson.lesson_number, Lesson.id).execution_options(yield_per=BUNDLE_CHUNK_SIZE)
+    return db.execute(query).tuples()
+
+def _version_key(db: Session, course_id: int) -> Optional[str]:
+    """Hash of everything a bundle is built from, without reading any content"""
+    course = db.query(Course.updated_at, Course.content_hash).filter(
+        Course.id == course_id, Course.is_active == True
+    ).first()
+    if course is None:
+        return None
+    lessons = db.query(
+        Lesson.id, Lesson.lesson_number, Lesson.updated_at, Lesson.content_hash,
+        LessonContent.version, LessonContent.updated_at, LessonContent.generated_at
+    ).outerjoin(
+        LessonContent, LessonContent.lesson_id == Lesson.id
+    ).filter(
+        Lesson.course_id == course_id, Lesson.is_active == True
+    ).order_by(Lesson.lesson_number, Lesson.id).all()
+    state = json.dumps([list(course), [list(row) for row in lessons]], default=str)
+    return hashlib.sha256(state.encode()).hexdigest()
+
+class ManifestCache:
+    def __init__(self, max_entries: int = BUNDLE_MANIFEST_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._manifests: "OrderedDict[Tuple[int, str], Tuple[str, Manifest]]" = OrderedDict()
+
+    def get(self, course_id: int, fmt: str, version_key: str) -> Optional[Manifest]:
+        cached = self._manifests.get((course_id, fmt))
+        if cached is None or cached[0] != version_key:
+            return None
+        self._manifests.move_to_end((course_id, fmt))
+        return cached[1]
+
+    def put(self, version_key: str, manifest: Manifest) -> None:
+        self._manifests[(manifest.course_id, manifest.fmt)] = (version_key, manifest)
+        self._manifests.move_to_end((manifest.course_id, manifest.fmt))
+        while len(self._manifests) > self.max_entries:
+            self._manifests.popitem(last=False)
+
+manifests = ManifestCache()
+
+def _add_entry(entries: List[BundleEntry], offset: int, fmt: str, lesson: Optional[Lesson], data: bytes, modified) -> int:
+    name = _entry_name(lesson)
+    crc = zlib.crc32(data)
+    stored = _deflate(data) if fmt == "zip" else data
+    header = _local_header(name.encode(), crc, len(stored), len(data), modified) if fmt == "zip" else b""
+    entries.append(BundleEntry(name, lesson.id if lesson else None, offset, header, crc, len(data), len(stored)))
+    return offset + len(header) + len(stored)
+
+def _build_manifest(db: Session, course_id: int, fmt: str, version_key: str) -> Optional[Manifest]:
+    course = _course(db, course_id)
+    if course is None:
+        return None
+    entries: List[BundleEntry] = []
+    course_data = _entry_bytes(_course_document(course, _lesson_versions(db, course_id)), fmt, "course")
+    offset = _add_entry(entries, 0, fmt, None, course_data, course.updated_at or course.created_at)
+    for lesson, content in _lessons_with_content(db, course_id):
+        data = _entry_bytes(_lesson_document(lesson, content), fmt, "lesson")
+        offset = _add_entry(entries, offset, fmt, lesson, data, content.generated_at)
+        db.expunge(content)
+        db.expunge(lesson)
+    tail = _zip_tail(entries, offset) if fmt == "zip" else b""
+    return Manifest(
+        course_id=course_id,
+        fmt=fmt,
+        filename=f"{course.slug or f'course-{course_id}'}.{fmt}",
+        etag=f'"{hashlib.sha256(f"{fmt}:{version_key}".encode()).hexdigest()[:32]}"',
+        entries=entries,
+        tail=tail,
+        length=offset + len(tail)
+    )
+
+def get_manifest(course_id: int, fmt: str) -> Optional[Manifest]:
+    """The layout of a course's bundle, or None when the course does not exist"""
+    if fmt not in BUNDLE_FORMATS:
+        raise ValueError(f"Unknown bundle format '{fmt}'; use one of {', '.join(BUNDLE_FORMATS)}")
+    db = _session()
+    try:
+        version_key = _version_key(db, course_id)
+        if version_key is None:
+            return None
+        manifest = manifests.get(course_id, fmt, version_key)
+        if manifest is None:
+            manifest = _build_manifest(db, course_id, fmt, version_key)
+            if manifest is not None:
+                manifests.put(version_key, manifest)
+        return manifest
+    finally:
+        db.close()
+
+def parse_range(header: Optional[str], length: int) -> Optional[Tuple[int, int]]:
+    """
+    First and last byte of a single ``bytes=`` range, or None to send the
+    whole bundle (no header, or several ranges). Raises ValueError when the
+    range cannot be satisfied.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = min(int(last), length - 1) if last else length - 1
+        else:
+            start, end = max(0, length - int(last)), length - 1
+    except ValueError:
+        return None
+    if start > end or start >= length:
+        raise ValueError(f"Range not satisfiable for {length} bytes")
+    return start, end
+
+def stream_bundle(manifest: Manifest, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+    """Bytes ``start`` to ``end`` (inclusive) of the bundle, one entry at a time"""
+    end = manifest.length - 1 if end is None else end
+
+    def overlaps(first: int, size: int) -> bool:
+        return size > 0 and first <= end and first + size > start
+
+    def clip(first: int, data: bytes) -> bytes:
+        return data[max(0, start - first):max(0, end + 1 - first)]
+
+    needed = [
+        entry.lesson_id for entry in manifest.entries
+        if entry.lesson_id is not None and overlaps(entry.offset + len(entry.header), entry.data_size)
+    ]
+    db = _session()
+    try:
+        # Built before the lesson cursor is opened: an unbuffered (MySQL) cursor
+        # allows no other query on the session until it is exhausted
+        course_data = None
+        course_entry = manifest.entries[0]
+        if overlaps(course_entry.offset + len(course_entry.header), course_entry.data_size):
+            course = _course(db, manifest.course_id)
+            if course is None:
+                raise RuntimeError(f"Course {manifest.course_id} was removed during the download")
+            course_data = _entry_bytes(
+                _course_document(course, _lesson_versions(db, manifest.course_id)), manifest.fmt, "course"
+            )
+        rows = iter(_lessons_with_content(db, manifest.course_id, needed)) if needed else iter(())
+        for entry in manifest.entries:
+            if overlaps(entry.offset, len(entry.header)):
+                yield clip(entry.offset, entry.header)
+            data_offset = entry.offset + len(entry.header)
+            if not overlaps(data_offset, entry.data_size):
+                continue
+            if entry.lesson_id is None:
+                data = course_data
+            else:
+                lesson, content = next(rows, (None, None))
+                if lesson is None or lesson.id != entry.lesson_id:
+                    raise RuntimeError(f"Lesson {entry.lesson_id} changed during the download")
+                data = _entry_bytes(_lesson_document(lesson, content), manifest.fmt, "lesson")
+                db.expunge(content)
+                db.expunge(lesson)
+            if zlib.crc32(data) != entry.crc or len(data) != entry.size:
+                raise RuntimeError(f"Bundle entry {entry.name} changed during the download")
+            yield clip(data_offset, _deflate(data) if manifest.fmt == "zip" else data)
+        tail_offset = manifest.length - len(manifest.tail)
+        if overlaps(tail_offset, len(manifest.tail)):
+            yield clip(tail_offset, manifest.tail)
+    finally:
+        db.close()
@@ -0,0 +1,114 @@
+"""
+Short-lived, per-user cache of assembled course-page bundles.
+
+Entries are keyed by (course_id, user_id) and hold the encoded JSON body with
+its ETag, so a repeat page load costs a dictionary lookup and usually a 304.
+Invalidation:
+
+- a progress write drops that user's entry for the course and bumps the
+  user's generation for it, so a page built before the write is not cached;
+- newly cached lesson content bumps the course's generation, which retires
+  every user's entry for that course;
+- a catalog import bumps the global generation.
+
+Each worker has its own cache and only sees its own invalidations, so entries
+also expire after ``BUNDLE_CACHE_SECONDS``. A request that carries an
+``X-Consistency-Token`` newer than an entry bypasses it, so a learner always
+sees their own writes whichever worker served them.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+from fastapi.encoders import jsonable_encoder
+
+BUNDLE_CACHE_SECONDS = float(os.getenv("BUNDLE_CACHE_SECONDS", "30"))
+BUNDLE_CACHE_SIZE = int(os.getenv("BUNDLE_CACHE_SIZE", "10000"))
+
+class CachedPage(NamedTuple):
+    body: bytes
+    etag: str
+    created_at: float  # Unix time, compared with consistency tokens
+    expires: float  # monotonic
+    generation: Tuple[int, int, int]
+
+def encode_page(payload: Dict[str, Any]) -> Tuple[bytes, str]:
+    """JSON body and a strong ETag derived from it"""
+    body = json.dumps(jsonable_encoder(payload), separators=(",", ":")).encode()
+    return body, '"' + hashlib.sha1(body).hexdigest() + '"'
+
+class PageCache:
+    def __init__(self, ttl: float = BUNDLE_CACHE_SECONDS, max_entries: int = BUNDLE_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[int, str], CachedPage]" = OrderedDict()
+        self._course_generations: Dict[int, int] = {}
+        self._global_generation = 0
+        # (course_id, user_id) -> sequence number of its last invalidation, most recent last.
+        # Pairs dropped from here fall back to the highest dropped number, so a
+        # page built before the drop is still rejected.
+        self._user_generations: "OrderedDict[Tuple[int, str], int]" = OrderedDict()
+        self._user_generation_floor = 0
+        self._invalidations = 0
+        self._lock = threading.Lock()
+
+    def generation(self, course_id: int, user_id: str = "") -> Tuple[int, int, int]:
+        """Read before building a page and pass to ``put`` so a concurrent invalidation wins"""
+        return (
+            self._global_generation,
+            self._course_generations.get(course_id, 0),
+            self._user_generations.get((course_id, user_id), self._user_generation_floor)
+        )
+
+    def get(self, course_id: int, user_id: str, newer_than: Optional[float] = None) -> Optional[CachedPage]:
+        key = (course_id, user_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires < time.monotonic() or entry.generation != self.generation(course_id, user_id):
+                del self._entries[key]
+                return None
+            if newer_than is not None and entry.created_at < newer_than:
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, course_id: int, user_id: str, payload: Dict[str, Any], generation: Tuple[int, int, int]) -> CachedPage:
+        body, etag = encode_page(payload)
+        entry = CachedPage(body, etag, time.time(), time.monotonic() + self.ttl, generation)
+        if self.ttl <= 0:
+            return entry
+        with self._lock:
+            if generation != self.generation(course_id, user_id):
+                return entry  # Invalidated while it was being built; serve it once, do not cache it
+            self._entries[(course_id, user_id)] = entry
+            self._entries.move_to_end((course_id, user_id))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, course_id: int, user_id: str) -> None:
+        with self._lock:
+            self._entries.pop((course_id, user_id), None)
+            self._invalidations += 1
+            self._user_generations[(course_id, user_id)] = self._invalidations
+            self._user_generations.move_to_end((course_id, user_id))
+            while len(self._user_generations) > self.max_entries:
+                _, dropped = self._user_generations.popitem(last=False)
+                self._user_generation_floor = max(self._user_generation_floor, dropped)
+
+    def invalidate_course(self, course_id: int) -> None:
+        with self._lock:
+            self._course_generations[course_id] = self._course_generations.get(course_id, 0) + 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._global_generation += 1
+            self._entries.clear()
+
+course_pages = PageCache()
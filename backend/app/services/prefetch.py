@@ -0,0 +1,189 @@
+"""
+Speculative generation of the next lesson's content.
+
+Learners usually open lesson N+1 right after lesson N. When a lesson is
+opened, ``schedule`` queues a background check of the next ``PREFETCH_AHEAD``
+active lessons of the course (by ``lesson_number``). Those without cached
+content are generated and cached before the learner asks for them.
+
+Speculative calls are bounded in two ways. At most ``PREFETCH_MAX_CONCURRENCY``
+run at once; beyond that new prefetches are dropped, not queued. At most
+``PREFETCH_BUDGET`` start per ``PREFETCH_BUDGET_WINDOW`` seconds. A lesson that
+is already cached or being generated is skipped. A request for a lesson whose
+prefetch is still running waits for that call through ``join`` instead of
+starting a second one. State is per process, so each worker keeps its own
+budget.
+
+Hit rate: ``lesson_prefetch_used_total / lesson_prefetch_total{result="generated"}``,
+also exported as the ``lesson_prefetch_hit_ratio`` gauge.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional
+
+from fastapi import BackgroundTasks
+from starlette.concurrency import run_in_threadpool
+
+from ..database.config import SessionLocal
+from ..models import Course, Lesson, LessonContent
+from . import metrics
+from .ai_service import get_ai_service
+from .content_versions import cache_lesson_content
+from .tracing import traced
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "true").lower() == "true"
+PREFETCH_AHEAD = int(os.getenv("PREFETCH_AHEAD", "1"))
+PREFETCH_MAX_CONCURRENCY = int(os.getenv("PREFETCH_MAX_CONCURRENCY", "2"))
+PREFETCH_BUDGET = int(os.getenv("PREFETCH_BUDGET", "100"))
+PREFETCH_BUDGET_WINDOW = float(os.getenv("PREFETCH_BUDGET_WINDOW", "3600"))
+
+# Prefetched lessons remembered for hit accounting
+MAX_TRACKED_LESSONS = 10000
+
+def _next_lessons(lesson_id: int, ahead: int) -> List[Dict[str, Any]]:
+    """Generation inputs of the next ``ahead`` active lessons that have no cached content"""
+    db = SessionLocal()
+    try:
+        current = db.query(Lesson.course_id, Lesson.lesson_number).filter(Lesson.id == lesson_id).first()
+        if current is None:
+            return []
+        rows = db.query(
+            Lesson.id,
+            Lesson.title,
+            Lesson.description,
+            Lesson.learning_objectives,
+            Lesson.estimated_duration,
+            Course.title.label("course_title"),
+            LessonContent.id.label("content_id")
+        ).join(
+            Course, Course.id == Lesson.course_id
+        ).outerjoin(
+            LessonContent, LessonContent.lesson_id == Lesson.id
+        ).filter(
+            Lesson.course_id == current.course_id,
+            Lesson.is_active == True,
+            Lesson.lesson_number > current.lesson_number
+        ).order_by(Lesson.lesson_number, Lesson.id).limit(ahead).all()
+        return [
+            {
+                "id": row.id,
+                "course_title": row.course_title,
+                "lesson_title": row.title,
+                "lesson_description": row.description,
+                "learning_objectives": row.learning_objectives or [],
+                "estimated_duration": row.estimated_duration
+            }
+            for row in rows if row.content_id is None
+        ]
+    finally:
+        db.close()
+
+class Prefetcher:
+    """Budgeted, deduplicated background generation of upcoming lessons"""
+
+    def __init__(
+        self,
+        ahead: int = PREFETCH_AHEAD,
+        max_concurrency: int = PREFETCH_MAX_CONCURRENCY,
+        budget: int = PREFETCH_BUDGET,
+        budget_window: float = PREFETCH_BUDGET_WINDOW
+    ):
+        self.ahead = ahead
+        self.max_concurrency = max_concurrency
+        self.budget = budget
+        self.budget_window = budget_window
+        self._in_flight: Dict[int, asyncio.Task] = {}
+        self._started: Deque[float] = deque()
+        self._prefetched: "OrderedDict[int, float]" = OrderedDict()
+
+    def schedule(self, background_tasks: BackgroundTasks, lesson_id: int) -> None:
+        """Queue a prefetch of the lessons after ``lesson_id`` once the response is sent"""
+        if PREFETCH_ENABLED and self.ahead > 0 and self.budget > 0:
+            background_tasks.add_task(self.prefetch_after, lesson_id)
+
+    def _take_budget(self) -> bool:
+        now = time.monotonic()
+        while self._started and now - self._started[0] > self.budget_window:
+            self._started.popleft()
+        if len(self._started) >= self.budget:
+            return False
+        self._started.append(now)
+        return True
+
+    @traced("prefetch_after")
+    async def prefetch_after(self, lesson_id: int) -> None:
+        try:
+            get_ai_service()
+        except ValueError:
+            return  # AI not configured
+        try:
+            candidates = await run_in_threadpool(_next_lessons, lesson_id, self.ahead)
+        except Exception as e:
+            logger.warning("Prefetch lookup after lesson %s failed: %s", lesson_id, e)
+            return
+
+        for lesson in candidates:
+            if lesson["id"] in self._in_flight:
+                metrics.record_prefetch("skipped_in_flight")
+                continue
+            if len(self._in_flight) >= self.max_concurrency:
+                metrics.record_prefetch("skipped_concurrency")
+                continue
+            if not self._take_budget():
+                metrics.record_prefetch("skipped_budget")
+                continue
+            task = asyncio.create_task(self._generate(lesson))
+            self._in_flight[lesson["id"]] = task
+            task.add_done_callback(lambda _, key=lesson["id"]: self._in_flight.pop(key, None))
+
+    @traced("prefetch_lesson_content")
+    async def _generate(self, lesson: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        ai_service = get_ai_service()
+        inputs = {name: value for name, value in lesson.items() if name != "id"}
+        result = await ai_service.generate_lesson_content(**inputs)
+        if not result["success"]:
+            metrics.record_prefetch("failed")
+            return None
+        stored = await run_in_threadpool(
+            cache_lesson_content, lesson["id"], result["content"], result["raw_content"],
+            ai_service.lesson_content_fingerprint(**inputs), ai_service.model
+        )
+        if not stored:
+            # A learner joining this prefetch would otherwise skip caching the content
+            metrics.record_prefetch("failed")
+            return None
+        metrics.record_prefetch("generated")
+        self._prefetched[lesson["id"]] = time.time()
+        while len(self._prefetched) > MAX_TRACKED_LESSONS:
+            self._prefetched.popitem(last=False)
+        return result
+
+    async def join(self, lesson_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Result of the prefetch currently generating ``lesson_id`` (None when
+        there is none or it failed). The caller's cancellation does not
+        cancel the prefetch.
+        """
+        task = self._in_flight.get(lesson_id)
+        if task is None:
+            return None
+        try:
+            result = await asyncio.shield(task)
+        except Exception:
+            return None
+        if result is not None:
+            self._prefetched.pop(lesson_id, None)
+            metrics.record_prefetch_use("joined")
+        return result
+
+    def record_use(self, lesson_id: int) -> None:
+        """Count a learner opening cached content as a hit if a prefetch produced it"""
+        if self._prefetched.pop(lesson_id, None) is not None:
+            metrics.record_prefetch_use("cached")
+
+prefetcher = Prefetcher()
@@ -0,0 +1,377 @@
+"""
+Opt-in wall-clock profiling of individual requests.
+
+With ``PROFILING_ENABLED=true`` the ``ProfilingMiddleware`` profiles a request
+when one of these holds:
+
+- it carries a valid ``X-Profile-Token`` (``python -m app.services.profiling
+  --sign 600`` prints one that is valid for 10 minutes, signed with
+  ``PROFILING_SECRET``); the response then names the profile in ``X-Profile-Id``;
+- it is picked by ``PROFILE_SAMPLE_RATE`` (0.0-1.0);
+- ``PROFILE_SLOW_MS`` is set and the request takes at least that long. Every
+  request is sampled then, and the profiles of faster ones are discarded.
+
+A sampler thread records the request's stack every ``PROFILE_INTERVAL_MS``.
+If the request's task is suspended, it records the ``await`` chain instead,
+which ends in an ``<awaiting ...>`` frame. The profile is therefore
+wall-clock time, and the time spent waiting on the model or a thread shows
+up next to CPU time.
+
+Each profile is written to ``PROFILE_DIR`` as:
+
+- ``.folded``: collapsed stacks for flamegraph.pl, inferno or speedscope;
+- ``.prof``: pstats data for snakeviz, gprof2dot or ``python -m pstats``;
+- ``.json``: a summary splitting the wall time into SQL (from the query
+  tracker), AIService calls and sampled categories.
+
+Background tasks run before the ASGI call returns, so they are part of the
+request's profile. When ``PROFILING_ENABLED`` is off the middleware is not
+installed.
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import marshal
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from ..database import query_tracker
+
+logger = logging.getLogger(__name__)
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+PROFILING_SECRET = os.getenv("PROFILING_SECRET")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))  # profiles kept, oldest are removed
+
+PROFILE_HEADER = "X-Profile-Token"
+PROFILE_ID_HEADER = "X-Profile-Id"
+
+# Sample categories, matched on the file names of the sampled stack
+_SQL_FILES = ("sqlalchemy", "pymysql", "sqlite3", "psycopg")
+_SERIALIZATION_FILES = (f"{os.sep}json{os.sep}", "encoders.py", "pydantic")
+_AI_FILES = ("ai_service.py",)
+
+Frame = Tuple[str, int, str]  # (filename, first line, function), the pstats key
+
+def sign_token(ttl: float, secret: Optional[str] = None) -> str:
+    """Profile token valid for ``ttl`` seconds"""
+    secret = secret or PROFILING_SECRET
+    if not secret:
+        raise ValueError("PROFILING_SECRET is not set")
+    expires = str(int(time.time() + ttl))
+    signature = hmac.new(secret.encode(), expires.encode(), hashlib.sha256).hexdigest()
+    return f"{expires}.{signature}"
+
+def verify_token(token: Optional[str], secret: Optional[str] = None) -> bool:
+    secret = secret or PROFILING_SECRET
+    if not token or not secret or "." not in token:
+        return False
+    expires, signature = token.split(".", 1)
+    expected = hmac.new(secret.encode(), expires.encode(), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(signature, expected) and expires.isdigit() and int(expires) >= time.time()
+
+class RequestProfile:
+    """Samples and timers of one profiled request"""
+
+    def __init__(self, task, thread_id: int, method: str, path: str, trigger: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.task = task
+        self.thread_id = thread_id
+        self.method = method
+        self.path = path
+        self.trigger = trigger
+        self.started_at = datetime.now()
+        self.start = time.perf_counter()
+        self.last_sample = self.start
+        self.samples: Dict[Tuple[Frame, ...], float] = defaultdict(float)  # seconds per distinct stack
+        self.stack_counts: Dict[Tuple[Frame, ...], int] = defaultdict(int)
+        self.sample_count = 0
+        self.categories: Dict[str, float] = defaultdict(float)
+        self.ai_calls = 0
+        self.ai_time = 0.0
+
+    def add_sample(self, stack: Tuple[Frame, ...], awaiting: bool) -> None:
+        now = time.perf_counter()
+        weight, self.last_sample = now - self.last_sample, now
+        self.samples[stack] += weight
+        self.stack_counts[stack] += 1
+        self.sample_count += 1
+        self.categories[_category(stack, awaiting)] += weight
+
+def _category(stack: Tuple[Frame, ...], awaiting: bool) -> str:
+    files = [frame[0] for frame in stack]
+    if awaiting:
+        return "ai_await" if any(name in path for path in files for name in _AI_FILES) else "await"
+    if any(name in path for path in files for name in _SQL_FILES):
+        return "sql"
+    if any(name in path for path in files for name in _SERIALIZATION_FILES):
+        return "serialization"
+    return "python"
+
+def _frame_key(frame) -> Frame:
+    code = frame.f_code
+    return code.co_filename, code.co_firstlineno, code.co_name
+
+def _running_stack(frame, root) -> Tuple[Frame, ...]:
+    """Stack from the task's outermost coroutine down to ``frame`` (leaf)"""
+    stack = []
+    while frame is not None:
+        stack.append(_frame_key(frame))
+        if frame is root:
+            break
+        frame = frame.f_back
+    return tuple(reversed(stack))
+
+def _awaiting_stack(coro) -> Tuple[Frame, ...]:
+    """The chain of awaits of a suspended coroutine, ending in what it waits on"""
+    stack = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None) or getattr(coro, "ag_frame", None)
+        if frame is None:
+            stack.append(("~", 0, f"<awaiting {type(coro).__name__}>"))
+            break
+        stack.append((frame.f_code.co_filename, frame.f_code.co_firstlineno, frame.f_code.co_name))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None) or getattr(coro, "ag_await", None)
+    return tuple(stack)
+
+class Sampler:
+    """Samples the stacks of the requests being profiled; runs only while there are any"""
+
+    def __init__(self, interval: float = PROFILE_INTERVAL_MS / 1000):
+        self.interval = interval
+        self._profiles: Dict[str, RequestProfile] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, profile: RequestProfile) -> None:
+        with self._lock:
+            self._profiles[profile.id] = profile
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._thread.start()
+
+    def stop(self, profile: RequestProfile) -> None:
+        with self._lock:
+            self._profiles.pop(profile.id, None)
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                if not self._profiles:
+                    self._thread = None
+                    return
+                profiles = list(self._profiles.values())
+            frames = sys._current_frames()
+            for profile in profiles:
+                coro = profile.task.get_coro()
+                try:
+                    if getattr(coro, "cr_running", False) and profile.thread_id in frames:
+                        profile.add_sample(_running_stack(frames[profile.thread_id], coro.cr_frame), awaiting=False)
+                    else:
+                        profile.add_sample(_awaiting_stack(coro), awaiting=True)
+                except Exception:
+                    pass  # The stack changed under us; skip this sample
+            del frames
+            time.sleep(self.interval)
+
+sampler = Sampler()
+
+_current_profile: ContextVar[Optional[RequestProfile]] = ContextVar("request_profile", default=None)
+
+def record_ai_call(duration: float) -> None:
+    """Attribute an AIService call to the request being profiled, if any"""
+    profile = _current_profile.get()
+    if profile is not None:
+        profile.ai_calls += 1
+        profile.ai_time += duration
+
+def _frame_label(frame: Frame) -> str:
+    filename, line, name = frame
+    if filename == "~":
+        return name
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+def folded_stacks(profile: RequestProfile) -> str:
+    """Collapsed stacks weighted in microseconds"""
+    lines = []
+    for stack, seconds in profile.samples.items():
+        weight = int(seconds * 1_000_000)
+        if weight > 0:
+            lines.append(";".join(_frame_label(frame).replace(";", ":") for frame in stack) + f" {weight}")
+    return "\n".join(sorted(lines)) + "\n"
+
+def pstats_data(profile: RequestProfile) -> dict:
+    """Samples in the marshalled format read by ``pstats.Stats``"""
+    stats: Dict[Frame, list] = {}
+
+    def entry(frame: Frame) -> list:
+        if frame not in stats:
+            stats[frame] = [0, 0, 0.0, 0.0, defaultdict(lambda: [0, 0, 0.0, 0.0])]
+        return stats[frame]
+
+    for stack, seconds in profile.samples.items():
+        count = profile.stack_counts[stack]  # "calls" are samples
+        leaf = entry(stack[-1])
+        leaf[2] += seconds
+        for frame in set(stack):
+            item = entry(frame)
+            item[0] += count
+            item[1] += count
+            item[3] += seconds
+        for caller, callee in zip(stack, stack[1:]):
+            edge = entry(callee)[4][caller]
+            edge[0] += count
+            edge[1] += count
+            edge[2] += seconds if callee == stack[-1] else 0.0
+            edge[3] += seconds
+    return {
+        frame: (calls, primitive, total, cumulative, {caller: tuple(edge) for caller, edge in callers.items()})
+        for frame, (calls, primitive, total, cumulative, callers) in stats.items()
+    }
+
+def summary(profile: RequestProfile, status_code: int, wall: float, stats) -> dict:
+    return {
+        "id": profile.id,
+        "method": profile.method,
+        "path": profile.path,
+        "status": status_code,
+        "trigger": profile.trigger,
+        "started_at": profile.started_at.isoformat(),
+        "wall_ms": round(wall * 1000, 2),
+        "sql": {
+            "queries": stats.count if stats else None,
+            "time_ms": round(stats.total_time * 1000, 2) if stats else None
+        },
+        "ai": {"calls": profile.ai_calls, "time_ms": round(profile.ai_time * 1000, 2)},
+        "samples": {
+            "count": profile.sample_count,
+            "interval_ms": PROFILE_INTERVAL_MS,
+            "by_category_ms": {name: round(seconds * 1000, 2) for name, seconds in sorted(profile.categories.items())}
+        }
+    }
+
+def _prune(directory: str, keep: int) -> None:
+    profiles = sorted(name for name in os.listdir(directory) if name.endswith(".json"))
+    for name in profiles[:max(0, len(profiles) - keep)]:
+        for suffix in (".json", ".folded", ".prof"):
+            try:
+                os.remove(os.path.join(directory, name[:-len(".json")] + suffix))
+            except FileNotFoundError:
+                pass
+
+def write_profile(profile: RequestProfile, report: dict, directory: str = PROFILE_DIR) -> str:
+    """Write the three profile files and return their common path prefix"""
+    os.makedirs(directory, exist_ok=True)
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", profile.path).strip("_")[:60] or "root"
+    prefix = os.path.join(
+        directory, f"{profile.started_at:%Y%m%dT%H%M%S}-{profile.method.lower()}-{slug}-{profile.id}"
+    )
+    with open(prefix + ".folded", "w", encoding="utf-8") as output:
+        output.write(folded_stacks(profile))
+    with open(prefix + ".prof", "wb") as output:
+        marshal.dump(pstats_data(profile), output)
+    with open(prefix + ".json", "w", encoding="utf-8") as output:
+        json.dump(report, output, indent=2)
+    _prune(directory, PROFILE_MAX_FILES)
+    return prefix
+
+class ProfilingMiddleware:
+    """
+    Pure ASGI middleware that profiles selected requests. Add it before
+    ``QueryTrackerMiddleware`` (so it runs inside it) to get SQL totals.
+    """
+
+    def __init__(
+        self,
+        app,
+        sample_rate: float = PROFILE_SAMPLE_RATE,
+        slow_ms: float = PROFILE_SLOW_MS,
+        directory: str = PROFILE_DIR
+    ):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.directory = directory
+
+    def _trigger(self, scope) -> Optional[str]:
+        token = None
+        for name, value in scope.get("headers", []):
+            if name == PROFILE_HEADER.lower().encode():
+                token = value.decode("latin-1")
+                break
+        if token is not None and verify_token(token):
+            return "header"
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return "sampled"
+        if self.slow_ms > 0:
+            return "slow"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        trigger = self._trigger(scope)
+        if trigger is None:
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(
+            asyncio.current_task(), threading.get_ident(), scope.get("method", ""), scope.get("path", ""), trigger
+        )
+        status_code = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_code[0] = message["status"]
+                if trigger == "header":
+                    message = {**message, "headers": [
+                        *message.get("headers", []), (PROFILE_ID_HEADER.lower().encode(), profile.id.encode())
+                    ]}
+            await send(message)
+
+        token = _current_profile.set(profile)
+        sampler.start(profile)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.stop(profile)
+            _current_profile.reset(token)
+            wall = time.perf_counter() - profile.start
+            if trigger != "slow" or wall * 1000 >= self.slow_ms:
+                report = summary(profile, status_code[0], wall, query_tracker.current_stats())
+                try:
+                    prefix = await run_in_threadpool(write_profile, profile, report, self.directory)
+                    logger.info(
+                        "Profiled %s %s (%s) in %.1f ms: %s", profile.method, profile.path, trigger, wall * 1000, prefix
+                    )
+                except OSError as e:
+                    logger.warning("Writing profile %s failed: %s", profile.id, e)
+
+def main():
+    parser = argparse.ArgumentParser(description="Request profiling helpers")
+    parser.add_argument("--sign", type=float, metavar="SECONDS", required=True,
+                        help=f"Print an {PROFILE_HEADER} value valid for this many seconds")
+    args = parser.parse_args()
+    print(sign_token(args.sign))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+"""
+Lesson progress over a WebSocket instead of one POST per time delta.
+
+The lesson page opens ``/api/ai/lessons/{lesson_id}/progress/ws?user_id=...``
+and sends a heartbeat every ``PROGRESS_HEARTBEAT_SECONDS`` while the lesson is
+visible, plus a pause when it is hidden::
+
+    {"type": "heartbeat", "completion_percentage": 40, "is_completed": false}
+    {"type": "pause"}
+
+The server measures reading time itself. Each heartbeat credits the seconds
+since the previous one, capped at ``PROGRESS_MAX_HEARTBEAT_GAP`` so a
+suspended tab does not count as reading. Time and the highest reported
+completion accumulate in memory per connection. Every ``PROGRESS_FLUSH_SECONDS``
+all connections with unsaved progress are written to ``user_progress`` in one
+transaction. A connection's remainder is written when it closes, and a
+completion is written right away. Each write is acknowledged with
+``{"type": "saved", ...}`` carrying the stored totals and a consistency token.
+
+Time is stored in ``user_progress.time_spent_seconds``; ``time_spent_minutes``
+keeps the whole minutes so existing readers and the rollups are unaffected.
+If a write fails, live connections keep their progress for the next flush.
+Progress of connections that have closed is held by the channel and retried
+with every periodic flush. Progress that is still pending or held when a
+worker dies is lost.
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from fastapi import WebSocket, WebSocketDisconnect
+from starlette.concurrency import run_in_threadpool
+
+from ..database import rollups
+from ..database.config import SessionLocal
+from ..database.replicas import record_write
+from ..models import Lesson, UserProgress
+from . import metrics
+from .page_cache import course_pages
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_HEARTBEAT_SECONDS = float(os.getenv("PROGRESS_HEARTBEAT_SECONDS", "15"))
+PROGRESS_MAX_HEARTBEAT_GAP = float(os.getenv("PROGRESS_MAX_HEARTBEAT_GAP", str(2 * PROGRESS_HEARTBEAT_SECONDS)))
+PROGRESS_FLUSH_SECONDS = float(os.getenv("PROGRESS_FLUSH_SECONDS", "30"))
+
+def add_time_spent(progress: UserProgress, seconds: int) -> None:
+    """Add reading time, keeping ``time_spent_minutes`` the whole minutes of the seconds"""
+    progress.time_spent_seconds = (progress.time_spent_seconds or 0) + seconds
+    progress.time_spent_minutes = progress.time_spent_seconds // 60
+
+class ProgressUpdate(NamedTuple):
+    user_id: str
+    lesson_id: int
+    course_id: int
+    seconds: int
+    completion_percentage: Optional[int]
+    is_completed: bool
+
+    def merge(self, other: "ProgressUpdate") -> "ProgressUpdate":
+        """Combine two updates of the same user and lesson (e.g. two open tabs)"""
+        completions = [value for value in (self.completion_percentage, other.completion_percentage) if value is not None]
+        return self._replace(
+            seconds=self.seconds + other.seconds,
+            completion_percentage=max(completions) if completions else None,
+            is_completed=self.is_completed or other.is_completed
+        )
+
+class ProgressTracker:
+    """Unsaved progress of one connection"""
+
+    def __init__(self, websocket: WebSocket, user_id: str, lesson_id: int, course_id: int):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.lesson_id = lesson_id
+        self.course_id = course_id
+        self.last_beat = time.monotonic()
+        self.paused = False
+        self.pending_seconds = 0.0
+        self.completion_percentage: Optional[int] = None
+        self.is_completed = False
+        self.completion_saved = False
+
+    def _credit(self) -> None:
+        now = time.monotonic()
+        if not self.paused:
+            self.pending_seconds += min(now - self.last_beat, PROGRESS_MAX_HEARTBEAT_GAP)
+        self.last_beat = now
+
+    def heartbeat(self, completion_percentage=None, is_completed: bool = False) -> None:
+        self._credit()
+        self.paused = False
+        if completion_percentage is not None:
+            try:
+                reported = min(100, max(0, int(completion_percentage)))
+            except (TypeError, ValueError):
+                reported = None
+            if reported is not None:
+                self.completion_percentage = max(self.completion_percentage or 0, reported)
+        self.is_completed = self.is_completed or is_completed
+
+    def pause(self) -> None:
+        self._credit()
+        self.paused = True
+
+    @property
+    def completion_pending(self) -> bool:
+        return self.is_completed and not self.completion_saved
+
+    def take(self, final: bool = False) -> Optional[ProgressUpdate]:
+        """
+        Unsaved progress so far (None when there is none), cleared until
+        ``requeue``. Partial seconds carry over, except on the final take.
+        """
+        self._credit()
+        seconds = round(self.pending_seconds) if final else int(self.pending_seconds)
+        if not seconds and self.completion_percentage is None and not self.completion_pending:
+            return None
+        self.pending_seconds -= seconds
+        update = ProgressUpdate(
+            self.user_id, self.lesson_id, self.course_id, seconds, self.completion_percentage, self.is_completed
+        )
+        self.completion_percentage = None
+        self.completion_saved = self.is_completed
+        return update
+
+    def requeue(self, update: ProgressUpdate) -> None:
+        """Put back an update whose write failed"""
+        self.pending_seconds += update.seconds
+        if update.completion_percentage is not None:
+            self.completion_percentage = max(self.completion_percentage or 0, update.completion_percentage)
+        if update.is_completed:
+            self.completion_saved = False
+
+def lesson_course(lesson_id: int) -> Optional[int]:
+    """Course of an active lesson, or None"""
+    db = SessionLocal()
+    try:
+        return db.query(Lesson.course_id).filter(Lesson.id == lesson_id, Lesson.is_active == True).scalar()
+    finally:
+        db.close()
+
+def persist(updates: List[ProgressUpdate]) -> Dict[Tuple[str, int], dict]:
+    """Write a batch of updates in one transaction; returns the stored totals per (user, lesson)"""
+    db = SessionLocal()
+    saved = {}
+    try:
+        for update in updates:
+            progress = db.query(UserProgress).filter(
+                UserProgress.user_id == update.user_id,
+                UserProgress.lesson_id == update.lesson_id
+            ).first()
+            before = rollups.snapshot(progress)
+            if not progress:
+                progress = UserProgress(
+                    user_id=update.user_id,
+                    lesson_id=update.lesson_id,
+                    course_id=update.course_id,
+                    completion_percentage=0,
+                    time_spent_minutes=0,
+                    time_spent_seconds=0
+                )
+                db.add(progress)
+
+            add_time_spent(progress, update.seconds)
+            if update.completion_percentage is not None:
+                progress.completion_percentage = max(progress.completion_percentage or 0, update.completion_percentage)
+            if update.is_completed and not progress.is_completed:
+                progress.is_completed = True
+                progress.completion_percentage = 100
+                progress.completed_at = progress.completed_at or datetime.now()
+            progress.last_accessed = datetime.now()
+
+            rollups.record_progress_change(db, update.course_id, update.lesson_id, before, rollups.snapshot(progress))
+            saved[(update.user_id, update.lesson_id)] = {
+                "lesson_id": update.lesson_id,
+                "completion_percentage": progress.completion_percentage,
+                "time_spent_seconds": progress.time_spent_seconds,
+                "is_completed": bool(progress.is_completed)
+            }
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    for update in updates:
+        course_pages.invalidate(update.course_id, update.user_id)
+    return saved
+
+class ProgressChannel:
+    """Open progress connections and the periodic batch writer"""
+
+    def __init__(self, flush_seconds: float = PROGRESS_FLUSH_SECONDS):
+        self.flush_seconds = flush_seconds
+        self._trackers: Set[ProgressTracker] = set()
+        # Updates of closed connections whose write failed, retried by the periodic flush
+        self._pending: Dict[Tuple[str, int], ProgressUpdate] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+
+    async def serve(self, websocket: WebSocket, user_id: str, lesson_id: int, course_id: int) -> None:
+        """Read heartbeats from an accepted connection until it closes"""
+        tracker = ProgressTracker(websocket, user_id, lesson_id, course_id)
+        self._trackers.add(tracker)
+        metrics.PROGRESS_CONNECTIONS.inc()
+        self._ensure_flusher()
+        try:
+            while True:
+                message = await websocket.receive_json()
+                kind = message.get("type") if isinstance(message, dict) else None
+                if kind == "heartbeat":
+                    metrics.PROGRESS_HEARTBEATS.inc()
+                    tracker.heartbeat(message.get("completion_percentage"), bool(message.get("is_completed")))
+                    if tracker.completion_pending:
+                        await self.flush([tracker], trigger="completed")
+                elif kind == "pause":
+                    tracker.pause()
+                else:
+                    await websocket.send_json({"type": "error", "message": "Expected a heartbeat or pause message"})
+        except WebSocketDisconnect:
+            pass
+        except ValueError:
+            await websocket.close(code=1003)  # Not JSON
+        finally:
+            self._trackers.discard(tracker)
+            metrics.PROGRESS_CONNECTIONS.dec()
+            await self.flush([tracker], trigger="disconnect")
+            if self._pending:
+                self._ensure_flusher()
+
+    def _ensure_flusher(self) -> None:
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._run())
+
+    def _hold(self, update: ProgressUpdate) -> None:
+        key = (update.user_id, update.lesson_id)
+        self._pending[key] = self._pending[key].merge(update) if key in self._pending else update
+
+    async def _run(self) -> None:
+        while self._trackers or self._pending:
+            await asyncio.sleep(self.flush_seconds)
+            await self.flush(list(self._trackers), trigger="interval")
+
+    async def flush(self, trackers: List[ProgressTracker], trigger: str) -> None:
+        """Write the trackers' unsaved progress as one batch and acknowledge it"""
+        async with self._flush_lock:
+            # Held updates of closed connections go out with every batch
+            held, self._pending = list(self._pending.values()), {}
+            batch: Dict[Tuple[str, int], ProgressUpdate] = {(update.user_id, update.lesson_id): update for update in held}
+            taken: List[Tuple[ProgressTracker, ProgressUpdate]] = []
+            for tracker in trackers:
+                update = tracker.take(final=trigger == "disconnect")
+                if update is None:
+                    continue
+                key = (update.user_id, update.lesson_id)
+                batch[key] = batch[key].merge(update) if key in batch else update
+                taken.append((tracker, update))
+            if not batch:
+                return
+
+            try:
+                saved = await run_in_threadpool(persist, list(batch.values()))
+            except Exception as e:
+                for update in held:
+                    self._hold(update)
+                for tracker, update in taken:
+                    if tracker in self._trackers:
+                        tracker.requeue(update)
+                    else:
+                        self._hold(update)  # Its connection is gone; no later flush would see the tracker
+                logger.warning(
+                    "Writing %s progress updates failed, %s from closed connections held for retry: %s",
+                    len(batch), len(self._pending), e
+                )
+                return
+            metrics.PROGRESS_WRITES.inc(len(batch), trigger=trigger)
+
+        for tracker, update in taken:
+            try:
+                await tracker.websocket.send_json({
+                    "type": "saved",
+                    "progress": saved[(update.user_id, update.lesson_id)],
+                    "consistency_token": record_write(update.user_id)
+                })
+            except Exception:
+                pass  # Closed; the progress is stored either way
+
+progress_channel = ProgressChannel()
@@ -0,0 +1,249 @@
+"""
+Per-user and per-IP quotas on AI generation.
+
+Every lesson generation or overview that reaches the model is charged to the
+caller's user id (except ``anonymous``) and to the client IP. Each subject
+has two budgets:
+
+- requests: model calls per ``QUOTA_REQUEST_WINDOW`` seconds (default 60);
+- tokens: prompt plus completion tokens per ``QUOTA_TOKEN_WINDOW`` seconds
+  (default 3600), taken from the ``usage`` OpenRouter returns.
+
+A request is refused with ``429`` and ``Retry-After`` once any budget has run
+out. Token usage is only known after a call, so the token budget is checked
+before a call and charged after it. A single call can therefore overshoot the
+budget, but the call after that is refused.
+
+Windows are sliding-window counters. Each counter keeps the count of the
+current fixed bucket and of the previous one, and weights the previous count
+by how much of it still overlaps the window. A check is a few arithmetic
+operations, whatever the traffic.
+
+Counters are kept in process (``QUOTA_STORE=memory``, default), so each
+worker enforces its own share. With ``QUOTA_STORE=redis`` the buckets are
+kept in Redis at ``QUOTA_REDIS_URL`` and shared by all workers. This needs
+the ``redis`` package. If Redis cannot be reached, requests are admitted
+rather than refused.
+"""
+import logging
+import math
+import os
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+QUOTA_ENABLED = os.getenv("QUOTA_ENABLED", "true").lower() == "true"
+QUOTA_STORE = os.getenv("QUOTA_STORE", "memory").lower()
+QUOTA_REDIS_URL = os.getenv("QUOTA_REDIS_URL", "redis://localhost:6379/0")
+QUOTA_REQUEST_WINDOW = float(os.getenv("QUOTA_REQUEST_WINDOW", "60"))
+QUOTA_TOKEN_WINDOW = float(os.getenv("QUOTA_TOKEN_WINDOW", "3600"))
+# Limits of 0 are not enforced
+QUOTA_USER_REQUESTS = int(os.getenv("QUOTA_USER_REQUESTS", "20"))
+QUOTA_USER_TOKENS = int(os.getenv("QUOTA_USER_TOKENS", "200000"))
+QUOTA_IP_REQUESTS = int(os.getenv("QUOTA_IP_REQUESTS", "60"))
+QUOTA_IP_TOKENS = int(os.getenv("QUOTA_IP_TOKENS", "600000"))
+# Take the client IP from the first X-Forwarded-For entry (only behind a trusted proxy)
+QUOTA_TRUST_FORWARDED_FOR = os.getenv("QUOTA_TRUST_FORWARDED_FOR", "false").lower() == "true"
+
+class Quota(NamedTuple):
+    scope: str  # "user" or "ip"
+    kind: str  # "requests" or "tokens"
+    limit: int
+    window: float
+
+    @property
+    def name(self) -> str:
+        return f"{self.scope}_{self.kind}"
+
+QUOTAS = tuple(quota for quota in (
+    Quota("user", "requests", QUOTA_USER_REQUESTS, QUOTA_REQUEST_WINDOW),
+    Quota("user", "tokens", QUOTA_USER_TOKENS, QUOTA_TOKEN_WINDOW),
+    Quota("ip", "requests", QUOTA_IP_REQUESTS, QUOTA_REQUEST_WINDOW),
+    Quota("ip", "tokens", QUOTA_IP_TOKENS, QUOTA_TOKEN_WINDOW),
+) if quota.limit > 0)
+
+class QuotaExceeded(Exception):
+    def __init__(self, quota: Quota, retry_after: int):
+        self.quota = quota
+        self.retry_after = retry_after
+        unit = "generation requests" if quota.kind == "requests" else "model tokens"
+        super().__init__(
+            f"Quota exceeded: {quota.limit} {unit} per {int(quota.window)} seconds per {quota.scope}. "
+            f"Please retry in {retry_after} seconds."
+        )
+
+def sliding_count(current: float, previous: float, elapsed: float, window: float) -> float:
+    """Estimated count over the last ``window`` seconds, ``elapsed`` seconds into the current bucket"""
+    return previous * (1 - elapsed / window) + current
+
+def retry_after(limit: int, current: float, previous: float, elapsed: float, window: float) -> int:
+    """Seconds until the estimated count leaves room for one more unit"""
+    target = limit - 1
+    wait = 0.0
+    if current <= target:
+        if previous > 0:
+            wait = max(0.0, window * (1 - (target - current) / previous) - elapsed)
+    else:
+        # Only once this bucket becomes the previous one and starts to slide out
+        wait = window - elapsed + window * (1 - target / current)
+    return max(1, math.ceil(wait))
+
+class MemoryStore:
+    """Bucket counters in this process"""
+
+    PRUNE_EVERY = 1024
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (quota name, subject) -> [bucket index, current count, previous count]
+        self._buckets: Dict[Tuple[str, str], List[float]] = {}
+        self._operations = 0
+
+    def _bucket(self, quota: Quota, subject: str, index: int) -> List[float]:
+        bucket = self._buckets.get((quota.name, subject))
+        if bucket is None:
+            bucket = self._buckets[(quota.name, subject)] = [index, 0.0, 0.0]
+        elif bucket[0] != index:
+            # Roll forward; after more than one bucket the old count no longer overlaps
+            bucket[2] = bucket[1] if bucket[0] == index - 1 else 0.0
+            bucket[0], bucket[1] = index, 0.0
+        return bucket
+
+    async def counts(self, quota: Quota, subject: str, index: int) -> Tuple[float, float]:
+        with self._lock:
+            bucket = self._bucket(quota, subject, index)
+            return bucket[1], bucket[2]
+
+    async def add(self, quota: Quota, subject: str, index: int, amount: float) -> None:
+        with self._lock:
+            self._bucket(quota, subject, index)[1] += amount
+            self._operations += 1
+            if self._operations % self.PRUNE_EVERY == 0:
+                self._prune()
+
+    def _prune(self) -> None:
+        now = time.time()
+        windows = {quota.name: quota.window for quota in QUOTAS}
+        for key, bucket in list(self._buckets.items()):
+            window = windows.get(key[0])
+            if window is None or bucket[0] < now // window - 1:
+                del self._buckets[key]
+
+class RedisStore:
+    """Bucket counters in Redis, shared by every worker"""
+
+    def __init__(self, url: str):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("The redis package is required for QUOTA_STORE=redis (pip install redis)")
+        self._client = redis.from_url(url)
+
+    @staticmethod
+    def _key(quota: Quota, subject: str, index: int) -> str:
+        return f"quota:{quota.name}:{subject}:{index}"
+
+    async def counts(self, quota: Quota, subject: str, index: int) -> Tuple[float, float]:
+        current, previous = await self._client.mget(
+            self._key(quota, subject, index), self._key(quota, subject, index - 1)
+        )
+        return float(current or 0), float(previous or 0)
+
+    async def add(self, quota: Quota, subject: str, index: int, amount: float) -> None:
+        key = self._key(quota, subject, index)
+        async with self._client.pipeline(transaction=False) as pipe:
+            pipe.incrbyfloat(key, amount)
+            pipe.expire(key, math.ceil(quota.window * 2))
+            await pipe.execute()
+
+def _build_store():
+    if QUOTA_STORE == "redis":
+        return RedisStore(QUOTA_REDIS_URL)
+    if QUOTA_STORE != "memory":
+        raise ValueError(f"Unknown QUOTA_STORE: {QUOTA_STORE}")
+    return MemoryStore()
+
+class QuotaCharge:
+    """The subjects a generation is charged to; tokens are added once the call returns"""
+
+    def __init__(self, ledger: "QuotaLedger", subjects: Dict[str, str]):
+        self.ledger = ledger
+        self.subjects = subjects
+
+    async def add_tokens(self, usage: Optional[dict]) -> None:
+        tokens = (usage or {}).get("total_tokens") or (
+            ((usage or {}).get("prompt_tokens") or 0) + ((usage or {}).get("completion_tokens") or 0)
+        )
+        if tokens:
+            await self.ledger.add(self.subjects, "tokens", tokens)
+
+class QuotaLedger:
+    def __init__(self, store=None, quotas=QUOTAS):
+        self.store = store or _build_store()
+        self.quotas = quotas
+
+    async def admit(self, user_id: Optional[str], ip: Optional[str]) -> QuotaCharge:
+        """
+        Check every budget of the caller and count one request, raising
+        QuotaExceeded when a budget has run out
+        """
+        subjects = {}
+        if user_id and user_id != "anonymous":
+            subjects["user"] = user_id
+        if ip:
+            subjects["ip"] = ip
+        charge = QuotaCharge(self, subjects)
+        if not QUOTA_ENABLED:
+            return charge
+
+        now = time.time()
+        try:
+            for quota in self.quotas:
+                subject = subjects.get(quota.scope)
+                if subject is None:
+                    continue
+                index = int(now // quota.window)
+                elapsed = now - index * quota.window
+                current, previous = await self.store.counts(quota, subject, index)
+                if sliding_count(current, previous, elapsed, quota.window) > quota.limit - 1:
+                    metrics.QUOTA_REJECTED.inc(scope=quota.scope, kind=quota.kind)
+                    raise QuotaExceeded(
+                        quota, retry_after(quota.limit, current, previous, elapsed, quota.window)
+                    )
+        except QuotaExceeded:
+            raise
+        except Exception as e:
+            logger.warning("Quota check failed, admitting request: %s", e)
+            return charge
+
+        await self.add(subjects, "requests", 1)
+        return charge
+
+    async def add(self, subjects: Dict[str, str], kind: str, amount: float) -> None:
+        if not QUOTA_ENABLED:
+            return
+        now = time.time()
+        try:
+            for quota in self.quotas:
+                subject = subjects.get(quota.scope)
+                if quota.kind == kind and subject is not None:
+                    await self.store.add(quota, subject, int(now // quota.window), amount)
+        except Exception as e:
+            logger.warning("Failed to record %s quota usage: %s", kind, e)
+        if kind == "tokens":
+            for scope in subjects:
+                metrics.QUOTA_TOKENS.inc(amount, scope=scope)
+
+def client_ip(request) -> Optional[str]:
+    """Client address of a Starlette request"""
+    if QUOTA_TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else None
+
+quota_ledger = QuotaLedger()
@@ -0,0 +1,358 @@
+"""
+Next-lesson recommendations from precomputed lesson vectors.
+
+Every active lesson is embedded once as a hashed TF-IDF vector of its title,
+description and learning objectives (``RECOMMENDER_DIM`` buckets, signed
+feature hashing, L2-normalised) and stored as a row of a float32 NumPy
+matrix. Course vectors are the normalised sums of their lessons' rows.
+
+A request does no per-lesson Python work:
+
+1. the learner profile is one weighted sum of their recent lessons' rows
+   (weights from completion and recency),
+2. one matrix-vector product against the course matrix picks the
+   ``COURSE_CANDIDATES`` closest courses (plus the courses in progress),
+3. one product against those courses' lesson rows scores the candidates,
+   with boosts for the next lesson of a course in progress and for lessons
+   already started; completed lessons are masked out.
+
+So the cost depends on the candidate set, not the catalog size. The matrices
+are built on first use and grown in place when lessons are added (checked at
+most every ``RECOMMENDER_REFRESH_SECONDS``); edits to existing lessons
+trigger a rebuild. Checks and rebuilds after the first build run in a
+background thread, and requests keep using the current matrices meanwhile.
+"""
+import logging
+import os
+import threading
+import time
+import zlib
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from ..database.config import SessionLocal
+from ..models import Course, Lesson, UserProgress
+from .search import tokenize
+
+logger = logging.getLogger(__name__)
+
+RECOMMENDER_DIM = int(os.getenv("RECOMMENDER_DIM", "256"))
+RECOMMENDER_REFRESH_SECONDS = float(os.getenv("RECOMMENDER_REFRESH_SECONDS", "60"))
+COURSE_CANDIDATES = 20
+HISTORY_SIZE = 100
+RECENCY_HALF_LIFE_DAYS = 30.0
+NEXT_LESSON_BOOST = 0.5
+IN_PROGRESS_BOOST = 0.3
+
+FIELD_WEIGHTS = {"title": 2.0, "description": 1.0, "learning_objectives": 1.0}
+
+def _bucket(token: str, dim: int):
+    """Stable (bucket, sign) for a token; Python's hash() is salted per process"""
+    digest = zlib.crc32(token.encode())
+    return digest % dim, 1.0 if digest & 0x80000000 else -1.0
+
+class LessonVectors:
+    """Lesson and course matrices plus the row metadata needed to answer queries"""
+
+    def __init__(self, dim: int = RECOMMENDER_DIM):
+        self.dim = dim
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.size = 0
+        self.lesson_ids = np.zeros(0, dtype=np.int64)
+        self.course_of_row = np.zeros(0, dtype=np.int64)
+        self.number_of_row = np.zeros(0, dtype=np.int64)
+        self.titles: List[str] = []
+        self.row_of: Dict[int, int] = {}
+        self.course_rows: Dict[int, List[int]] = {}
+        self.course_titles: Dict[int, str] = {}
+        self.course_ids = np.zeros(0, dtype=np.int64)
+        self.course_sums = np.zeros((0, dim), dtype=np.float32)
+        self.course_vectors = self.course_sums
+        self.course_index: Dict[int, int] = {}
+        self.vocabulary: Dict[str, int] = {}
+        self.token_buckets: List[int] = []
+        self.token_signs: List[float] = []
+        self.document_frequency = np.zeros(0, dtype=np.int64)
+        self.documents = 0
+        self.max_lesson_id = 0
+
+    def _reserve(self, extra: int) -> None:
+        needed = self.size + extra
+        if needed <= len(self.vectors):
+            return
+        capacity = max(needed, 2 * len(self.vectors), 1024)
+        for name, dtype, shape in (
+            ("vectors", np.float32, (capacity, self.dim)),
+            ("lesson_ids", np.int64, (capacity,)),
+            ("course_of_row", np.int64, (capacity,)),
+            ("number_of_row", np.int64, (capacity,)),
+        ):
+            grown = np.zeros(shape, dtype=dtype)
+            grown[:self.size] = getattr(self, name)[:self.size]
+            setattr(self, name, grown)
+
+    def _token_ids(self, tokens: List[str]) -> List[int]:
+        vocabulary = self.vocabulary
+        ids = []
+        for token in tokens:
+            token_id = vocabulary.get(token)
+            if token_id is None:
+                token_id = vocabulary[token] = len(vocabulary)
+                bucket, sign = _bucket(token, self.dim)
+                self.token_buckets.append(bucket)
+                self.token_signs.append(sign)
+            ids.append(token_id)
+        return ids
+
+    def add_lessons(self, lessons: List, course_titles: Dict[int, str]) -> None:
+        """Append rows for new lessons (``id, course_id, lesson_number, title, description, learning_objectives``)"""
+        if not lessons:
+            return
+        # Only tokenising is per lesson; counting and weighting are array operations
+        row_ids, token_ids, field_weights = [], [], []
+        for offset, lesson in enumerate(lessons):
+            for field, weight in FIELD_WEIGHTS.items():
+                ids = self._token_ids(tokenize(getattr(lesson, field)))
+                token_ids.extend(ids)
+                row_ids.extend([offset] * len(ids))
+                field_weights.extend([weight] * len(ids))
+
+        vocabulary_size = len(self.vocabulary)
+        keys = np.asarray(row_ids, dtype=np.int64) * vocabulary_size + np.asarray(token_ids, dtype=np.int64)
+        pairs, inverse = np.unique(keys, return_inverse=True)
+        tf = np.bincount(inverse, weights=np.asarray(field_weights, dtype=np.float64))
+        pair_rows, pair_tokens = pairs // vocabulary_size, pairs % vocabulary_size
+
+        frequency = np.zeros(vocabulary_size, dtype=np.int64)
+        frequency[:len(self.document_frequency)] = self.document_frequency
+        frequency += np.bincount(pair_tokens, minlength=vocabulary_size)
+        self.document_frequency = frequency
+        self.documents += len(lessons)
+        idf = np.log((1 + self.documents) / (1 + frequency)) + 1
+
+        buckets = np.asarray(self.token_buckets, dtype=np.int64)
+        signs = np.asarray(self.token_signs, dtype=np.float32)
+        values = signs[pair_tokens] * (1 + np.log(tf)) * idf[pair_tokens]
+
+        block = np.bincount(
+            pair_rows * self.dim + buckets[pair_tokens], weights=values, minlength=len(lessons) * self.dim
+        ).reshape(len(lessons), self.dim).astype(np.float32)
+        norms = np.linalg.norm(block, axis=1, keepdims=True)
+        block /= np.maximum(norms, 1e-12)
+
+        self._reserve(len(lessons))
+        start, end = self.size, self.size + len(lessons)
+        self.vectors[start:end] = block
+        self.lesson_ids[start:end] = [lesson.id for lesson in lessons]
+        self.course_of_row[start:end] = [lesson.course_id for lesson in lessons]
+        self.number_of_row[start:end] = [lesson.lesson_number for lesson in lessons]
+        self.size = end
+
+        self.course_titles.update(course_titles)
+        new_courses = sorted({lesson.course_id for lesson in lessons} - set(self.course_index))
+        if new_courses:
+            for position, course_id in enumerate(new_courses, start=len(self.course_ids)):
+                self.course_index[course_id] = position
+            self.course_ids = np.concatenate([self.course_ids, np.asarray(new_courses, dtype=np.int64)])
+            self.course_sums = np.concatenate([self.course_sums, np.zeros((len(new_courses), self.dim), dtype=np.float32)])
+        course_positions = np.asarray([self.course_index[lesson.course_id] for lesson in lessons], dtype=np.int64)
+        np.add.at(self.course_sums, course_positions, block)
+
+        for offset, lesson in enumerate(lessons):
+            row = start + offset
+            self.row_of[lesson.id] = row
+            self.course_rows.setdefault(lesson.course_id, []).append(row)
+            self.titles.append(lesson.title)
+            self.max_lesson_id = max(self.max_lesson_id, lesson.id)
+
+        norms = np.linalg.norm(self.course_sums, axis=1, keepdims=True)
+        self.course_vectors = self.course_sums / np.maximum(norms, 1e-12)
+
+
+    def recommend(self, history: List, limit: int) -> List[dict]:
+        """
+        ``history`` rows have ``lesson_id, course_id, completion_percentage,
+        is_completed, last_accessed``; returns up to ``limit`` recommendations
+        """
+        known = [row for row in history if row.lesson_id in self.row_of]
+        if not known:
+            return self._starting_points(limit)
+
+        history_rows = np.fromiter((self.row_of[row.lesson_id] for row in known), dtype=np.int64, count=len(known))
+        completion = np.fromiter((row.completion_percentage or 0 for row in known), dtype=np.float32, count=len(known))
+        completed = np.fromiter((bool(row.is_completed) for row in known), dtype=bool, count=len(known))
+        now = datetime.now()
+        age_days = np.fromiter(
+            ((now - row.last_accessed.replace(tzinfo=None)).total_seconds() / 86400 if row.last_accessed else 0.0
+             for row in known),
+            dtype=np.float32, count=len(known)
+        )
+
+        # 1. Learner profile: one weighted sum over the recent history rows
+        recent = np.argsort(age_days)[:HISTORY_SIZE]
+        weights = (0.5 + completion[recent] / 200) * np.exp2(-age_days[recent] / RECENCY_HALF_LIFE_DAYS)
+        profile = weights @ self.vectors[history_rows[recent]]
+        profile /= max(float(np.linalg.norm(profile)), 1e-12)
+
+        # 2. Candidate courses: closest by centroid plus the ones in progress
+        course_scores = self.course_vectors @ profile
+        top = min(COURSE_CANDIDATES, len(course_scores))
+        closest = self.course_ids[np.argpartition(-course_scores, top - 1)[:top]]
+        active_courses = np.unique(self.course_of_row[history_rows])
+        candidate_courses = np.union1d(closest, active_courses)
+        candidates = np.fromiter(
+            (row for course_id in candidate_courses.tolist() for row in self.course_rows.get(course_id, ())),
+            dtype=np.int64
+        )
+
+        # 3. Score candidates in one product, then boost and mask
+        scores = self.vectors[candidates] @ profile
+        candidate_courses_of_row = self.course_of_row[candidates]
+        candidate_numbers = self.number_of_row[candidates]
+
+        done_numbers = self.number_of_row[history_rows[completed]]
+        done_courses = self.course_of_row[history_rows[completed]]
+        next_number = {}
+        for course_id, number in zip(done_courses.tolist(), done_numbers.tolist()):
+            next_number[course_id] = max(next_number.get(course_id, 0), number + 1)
+        if next_number:
+            keys = np.asarray([course_id * 1_000_000 + number for course_id, number in next_number.items()])
+            is_next = np.isin(candidate_courses_of_row * 1_000_000 + candidate_numbers, keys)
+            scores = scores + NEXT_LESSON_BOOST * is_next
+        else:
+            is_next = np.zeros(len(candidates), dtype=bool)
+
+        started = np.isin(candidates, history_rows[~completed & (completion > 0)])
+        scores = scores + IN_PROGRESS_BOOST * started
+        scores[np.isin(candidates, history_rows[completed])] = -np.inf
+
+        count = min(limit, int(np.isfinite(scores).sum()))
+        if count == 0:
+            return []
+        best = np.argpartition(-scores, count - 1)[:count]
+        best = best[np.argsort(-scores[best])]
+
+        return [
+            self._recommendation(
+                int(candidates[position]),
+                float(scores[position]),
+                "continue" if started[position] else "next_in_course" if is_next[position] else "similar"
+            )
+            for position in best
+        ]
+
+    def _starting_points(self, limit: int) -> List[dict]:
+        """No usable history: the first lesson of each course"""
+        rows = np.flatnonzero(self.number_of_row[:self.size] == 1)[:limit]
+        return [self._recommendation(int(row), 0.0, "start_here") for row in rows]
+
+    def _recommendation(self, row: int, score: float, reason: str) -> dict:
+        course_id = int(self.course_of_row[row])
+        return {
+            "lesson_id": int(self.lesson_ids[row]),
+            "title": self.titles[row],
+            "lesson_number": int(self.number_of_row[row]),
+            "course_id": course_id,
+            "course_title": self.course_titles.get(course_id),
+            "score": round(score, 4),
+            "reason": reason
+        }
+
+_LESSON_COLUMNS = (
+    Lesson.id, Lesson.course_id, Lesson.lesson_number, Lesson.title, Lesson.description, Lesson.learning_objectives
+)
+
+def _lesson_signature(db: Session, max_lesson_id: int) -> tuple:
+    """Count and last edit of the lessons we already have, to tell additions from edits"""
+    return tuple(db.query(func.count(Lesson.id), func.max(Lesson.updated_at)).filter(
+        Lesson.id <= max_lesson_id
+    ).one())
+
+class Recommender:
+    def __init__(self):
+        self.vectors: Optional[LessonVectors] = None
+        self._signature = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()  # Guards growing self.vectors in place while it is read
+        self._refresh_lock = threading.Lock()
+
+    def _course_titles(self, db: Session) -> Dict[int, str]:
+        return dict(db.query(Course.id, Course.title).filter(Course.is_active == True).all())
+
+    def build(self, db: Session) -> None:
+        start = time.perf_counter()
+        vectors = LessonVectors()
+        lessons = db.query(*_LESSON_COLUMNS).join(Course, Course.id == Lesson.course_id).filter(
+            Lesson.is_active == True, Course.is_active == True
+        ).order_by(Lesson.id).all()
+        vectors.add_lessons(lessons, self._course_titles(db))
+        with self._lock:
+            self.vectors = vectors
+        self._signature = _lesson_signature(db, vectors.max_lesson_id)
+        self._checked_at = time.monotonic()
+        logger.info("Recommendation matrix built: %d lessons in %.2fs", vectors.size, time.perf_counter() - start)
+
+    def refresh(self, db: Session) -> None:
+        """Append lessons added since the last check, or rebuild if existing ones changed"""
+        vectors = self.vectors
+        if _lesson_signature(db, vectors.max_lesson_id) != self._signature:
+            self.build(db)
+            return
+        added = db.query(*_LESSON_COLUMNS).join(Course, Course.id == Lesson.course_id).filter(
+            Lesson.id > vectors.max_lesson_id, Lesson.is_active == True, Course.is_active == True
+        ).order_by(Lesson.id).all()
+        if added:
+            course_titles = self._course_titles(db)
+            with self._lock:
+                vectors.add_lessons(added, course_titles)
+            self._signature = _lesson_signature(db, vectors.max_lesson_id)
+            logger.info("Recommendation matrix grew by %d lessons", len(added))
+        self._checked_at = time.monotonic()
+
+    def ensure_current(self, db: Session) -> LessonVectors:
+        """
+        Build the matrices on first use; afterwards refresh them in a background
+        thread and return the current ones
+        """
+        if self.vectors is not None and time.monotonic() - self._checked_at < RECOMMENDER_REFRESH_SECONDS:
+            return self.vectors
+        if self.vectors is None:
+            with self._refresh_lock:
+                if self.vectors is None:
+                    self.build(db)
+        elif self._refresh_lock.acquire(blocking=False):
+            threading.Thread(target=self._refresh_in_background, name="recommender-refresh", daemon=True).start()
+        return self.vectors
+
+    def _refresh_in_background(self) -> None:
+        db = SessionLocal()
+        try:
+            if time.monotonic() - self._checked_at >= RECOMMENDER_REFRESH_SECONDS:
+                self.refresh(db)
+        except Exception as e:
+            logger.warning("Recommendation matrix refresh failed: %s", e)
+        finally:
+            db.close()
+            self._refresh_lock.release()
+
+    def recommend(self, db: Session, user_id: str, limit: int = 10) -> List[dict]:
+        vectors = self.ensure_current(db)
+        history = db.query(
+            UserProgress.lesson_id,
+            UserProgress.course_id,
+            UserProgress.completion_percentage,
+            UserProgress.is_completed,
+            UserProgress.last_accessed
+        ).filter(UserProgress.user_id == user_id).all()
+        with self._lock:
+            return vectors.recommend(history, limit)
+
+    def invalidate(self) -> None:
+        """Check for catalog changes on the next request"""
+        self._checked_at = 0.0
+
+recommender = Recommender()
@@ -0,0 +1,563 @@
+"""
+Full-text search over courses, lessons and generated lesson content.
+
+Two backends share one interface:
+
+* ``MySQLSearchBackend`` - ``MATCH ... AGAINST`` in boolean mode over the
+  FULLTEXT indexes created by migration 7; InnoDB keeps them up to date.
+* ``InMemorySearchIndex`` - an in-process inverted index for SQLite and
+  tests. Postings hold a BM25 term weight per document (title fields count
+  more), queries are AND-ed, the last term (or any ``term*``) matches as a
+  prefix, and the top ``limit`` hits are found with the threshold algorithm
+  over impact-sorted postings, so a query touches only a few hundred
+  postings even when its terms occur in every lesson.
+
+``SEARCH_BACKEND`` is ``auto`` (MySQL FULLTEXT on MySQL, otherwise in
+memory), ``mysql`` or ``memory``. The in-memory index is built on the first
+search, updated by ``index_lesson_content`` when generated content is cached,
+and rebuilt when the catalog changes (checked at most every
+``SEARCH_REFRESH_SECONDS``). Later rebuilds run in a background thread and
+searches keep using the previous index until the new one is swapped in.
+"""
+import bisect
+import heapq
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+
+from ..database.config import SessionLocal, engine
+from ..models import Course, Lesson, LessonContent
+
+logger = logging.getLogger(__name__)
+
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "auto").lower()
+SEARCH_REFRESH_SECONDS = float(os.getenv("SEARCH_REFRESH_SECONDS", "60"))
+# Must match the server's innodb_ft_min_token_size
+MYSQL_FT_MIN_TOKEN_SIZE = int(os.getenv("MYSQL_FT_MIN_TOKEN_SIZE", "3"))
+
+KINDS = ("course", "lesson")
+
+# BM25 parameters and per-field weights (a title match counts three times a body match)
+K1 = 1.2
+B = 0.75
+FIELD_WEIGHTS = {
+    "title": 3.0,
+    "description": 1.0,
+    "overview": 0.5,
+    "learning_objectives": 1.5,
+    "key_concepts": 1.5,
+}
+MAX_PREFIX_EXPANSIONS = 50
+# A prefix expansion ("574" for "57") scores less than the exact token
+PREFIX_EXPANSION_WEIGHT = 0.5
+# Score the rarest term's documents directly when that costs fewer lookups than this
+SCAN_BUDGET = 50000
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from how in is it of on or that the this to with you your".split()
+)
+
+def tokenize(value) -> List[str]:
+    """Lower-cased alphanumeric tokens without stopwords; lists (JSON columns) are joined first"""
+    if not value:
+        return []
+    if isinstance(value, list):
+        value = " ".join(item if isinstance(item, str) else json.dumps(item) for item in value)
+    return [token for token in _TOKEN.findall(value.lower()) if token not in STOPWORDS]
+
+def parse_query(query: str) -> List[Tuple[str, bool]]:
+    """
+    Split a query into (term, is_prefix) pairs. ``term*`` is a prefix term, and
+    so is the last term unless the query ends with whitespace (search as you type).
+    """
+    terms = []
+    raw_terms = query.lower().split()
+    for position, raw in enumerate(raw_terms):
+        is_prefix = raw.endswith("*") or (position == len(raw_terms) - 1 and not query[-1:].isspace())
+        for token in tokenize(raw):
+            terms.append((token, is_prefix))
+    return terms
+
+class SearchHit:
+    __slots__ = ("kind", "id", "title", "course_id", "score")
+
+    def __init__(self, kind: str, id: int, title: str, course_id: int, score: float):
+        self.kind = kind
+        self.id = id
+        self.title = title
+        self.course_id = course_id
+        self.score = score
+
+class _TermGroup:
+    """One query term: an exact token or all tokens sharing a prefix"""
+
+    def __init__(self, index: "InMemorySearchIndex", tokens: Sequence[str], exact: Optional[str] = None):
+        self.index = index
+        self.tokens = list(tokens)
+        self.idf = {
+            token: index.idf(token) * (1.0 if token == exact else PREFIX_EXPANSION_WEIGHT)
+            for token in self.tokens
+        }
+        self.size = sum(len(index.postings[token]) for token in self.tokens)
+        self.last_impact = math.inf
+
+    def docs(self) -> Iterator[int]:
+        for token in self.tokens:
+            yield from self.index.postings[token]
+
+    def impacts(self) -> Iterator[Tuple[float, int]]:
+        """(impact, doc) pairs in decreasing impact order"""
+        streams = [
+            ((weight * self.idf[token], doc) for weight, doc in self.index.sorted_postings(token))
+            for token in self.tokens
+        ]
+        if len(streams) == 1:
+            return streams[0]
+        return heapq.merge(*streams, key=lambda item: -item[0])
+
+    def score(self, doc: int) -> float:
+        best = 0.0
+        for token in self.tokens:
+            weight = self.index.postings[token].get(doc)
+            if weight is not None:
+                best = max(best, weight * self.idf[token])
+        return best
+
+class InMemorySearchIndex:
+    """Incrementally maintained inverted index with BM25 term weights"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.clear()
+
+    def clear(self) -> None:
+        with self._lock:
+            self.postings: Dict[str, Dict[int, float]] = {}
+            self._vocabulary: List[str] = []         # sorted, for prefix lookups
+            self._vocabulary_dirty = False
+            self._sorted: Dict[str, List[Tuple[float, int]]] = {}
+            self.docs: Dict[int, Tuple[str, int, str, int]] = {}   # doc -> (kind, id, title, course_id)
+            self.doc_ids: Dict[Tuple[str, int], int] = {}
+            self.doc_terms: Dict[int, Tuple[str, ...]] = {}
+            self.doc_fields: Dict[int, Dict[str, Optional[str]]] = {}
+            self.total_length = 0.0
+            self.doc_lengths: Dict[int, float] = {}
+            self._next_doc = 0
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    @property
+    def average_length(self) -> float:
+        return self.total_length / len(self.docs) if self.docs else 1.0
+
+    def idf(self, token: str) -> float:
+        df = len(self.postings.get(token, ()))
+        return math.log(1 + (len(self.docs) - df + 0.5) / (df + 0.5))
+
+    def sorted_postings(self, token: str) -> List[Tuple[float, int]]:
+        """Postings of ``token`` by decreasing weight, re-sorted lazily after updates"""
+        cached = self._sorted.get(token)
+        if cached is None:
+            cached = sorted(((weight, doc) for doc, weight in self.postings[token].items()), reverse=True)
+            self._sorted[token] = cached
+        return cached
+
+    @property
+    def vocabulary(self) -> List[str]:
+        """All indexed tokens in sorted order, re-sorted lazily after new tokens appear"""
+        if self._vocabulary_dirty:
+            self._vocabulary = sorted(self.postings)
+            self._vocabulary_dirty = False
+        return self._vocabulary
+
+    def expand(self, prefix: str) -> List[str]:
+        """Vocabulary tokens starting with ``prefix``, most frequent first"""
+        vocabulary = self.vocabulary
+        start = bisect.bisect_left(vocabulary, prefix)
+        end = bisect.bisect_left(vocabulary, prefix + "\uffff")
+        tokens = vocabulary[start:end]
+        if len(tokens) > MAX_PREFIX_EXPANSIONS:
+            tokens = heapq.nlargest(MAX_PREFIX_EXPANSIONS, tokens, key=lambda token: len(self.postings[token]))
+        return tokens
+
+    def add(self, kind: str, id: int, title: str, course_id: int, fields: Dict[str, Optional[str]]) -> None:
+        """Index (or re-index) one course or lesson"""
+        with self._lock:
+            key = (kind, id)
+            doc = self.doc_ids.get(key)
+            if doc is None:
+                doc = self._next_doc
+                self._next_doc += 1
+                self.doc_ids[key] = doc
+            else:
+                self._remove_postings(doc)
+
+            weighted: Counter = Counter()
+            for field, value in fields.items():
+                weight = FIELD_WEIGHTS[field]
+                for token in tokenize(value):
+                    weighted[token] += weight
+            length = sum(weighted.values())
+
+            self.docs[doc] = (kind, id, title, course_id)
+            self.doc_fields[doc] = dict(fields)
+            self.doc_terms[doc] = tuple(weighted)
+            self.doc_lengths[doc] = length
+            self.total_length += length
+
+            # Length normalisation uses the average at indexing time, so stored
+            # weights never change when other documents are added
+            norm = K1 * (1 - B + B * length / max(self.average_length, 1.0))
+            for token, tf in weighted.items():
+                postings = self.postings.get(token)
+                if postings is None:
+                    postings = self.postings[token] = {}
+                    self._vocabulary_dirty = True
+                postings[doc] = tf * (K1 + 1) / (tf + norm)
+                self._sorted.pop(token, None)
+
+    def update_fields(self, kind: str, id: int, **fields: Optional[str]) -> bool:
+        """Replace some fields of an indexed document; False if it is not indexed"""
+        with self._lock:
+            doc = self.doc_ids.get((kind, id))
+            if doc is None:
+                return False
+            merged = {**self.doc_fields[doc], **fields}
+            _, _, title, course_id = self.docs[doc]
+            self.add(kind, id, title, course_id, merged)
+            return True
+
+    def _remove_postings(self, doc: int) -> None:
+        for token in self.doc_terms.pop(doc, ()):
+            postings = self.postings[token]
+            postings.pop(doc, None)
+            self._sorted.pop(token, None)
+            if not postings:
+                del self.postings[token]
+                self._vocabulary_dirty = True
+        self.total_length -= self.doc_lengths.pop(doc, 0.0)
+
+    def search(self, query: str, limit: int = 20) -> List[SearchHit]:
+        """Top ``limit`` documents containing every query term, by summed BM25 impact"""
+        with self._lock:
+            groups = []
+            for term, is_prefix in parse_query(query):
+                tokens = self.expand(term) if is_prefix else ([term] if term in self.postings else [])
+                if not tokens:
+                    return []
+                groups.append(_TermGroup(self, tokens, exact=term))
+            if not groups:
+                return []
+
+            rarest = min(groups, key=lambda group: group.size)
+            scan_cost = rarest.size * sum(len(group.tokens) for group in groups)
+            if len(groups) > 1 and scan_cost <= SCAN_BUDGET:
+                top = self._scan_top_k(rarest, groups, limit)
+            else:
+                top = self._threshold_top_k(groups, limit)
+            return [self._hit(doc, score) for score, doc in top]
+
+    def _scan_top_k(self, rarest: _TermGroup, groups: List[_TermGroup], limit: int) -> List[Tuple[float, int]]:
+        # Every match contains the rarest term, so its postings are the candidates;
+        # each other term then filters and adds to them one whole dict at a time
+        candidates: Dict[int, float] = {}
+        for token in rarest.tokens:
+            idf = rarest.idf[token]
+            for doc, weight in self.postings[token].items():
+                impact = weight * idf
+                if impact > candidates.get(doc, 0.0):
+                    candidates[doc] = impact
+
+        for group in groups:
+            if group is rarest:
+                continue
+            if len(group.tokens) == 1:
+                token = group.tokens[0]
+                postings, idf = self.postings[token], group.idf[token]
+                candidates = {
+                    doc: score + postings[doc] * idf for doc, score in candidates.items() if doc in postings
+                }
+            else:
+                scored = {}
+                for doc, score in candidates.items():
+                    part = group.score(doc)
+                    if part:
+                        scored[doc] = score + part
+                candidates = scored
+        return heapq.nlargest(limit, ((score, doc) for doc, score in candidates.items()))
+
+    def _threshold_top_k(self, groups: List[_TermGroup], limit: int) -> List[Tuple[float, int]]:
+        # Fagin's threshold algorithm: walk every term's postings in impact order
+        # and stop once no unseen document can beat the current k-th score
+        streams = [group.impacts() for group in groups]
+        top: List[Tuple[float, int]] = []
+        seen = set()
+        while True:
+            for group, stream in zip(groups, streams):
+                item = next(stream, None)
+                if item is None:
+                    # Every document containing this term has been seen (AND semantics)
+                    return sorted(top, reverse=True)
+                impact, doc = item
+                group.last_impact = impact
+                if doc in seen:
+                    continue
+                seen.add(doc)
+                score = 0.0
+                for other in groups:
+                    part = other.score(doc)
+                    if part == 0.0:
+                        break
+                    score += part
+                else:
+                    if len(top) < limit:
+                        heapq.heappush(top, (score, doc))
+                    elif score > top[0][0]:
+                        heapq.heapreplace(top, (score, doc))
+            if len(top) >= limit and top[0][0] >= sum(group.last_impact for group in groups):
+                return sorted(top, reverse=True)
+
+    def _hit(self, doc: int, score: float) -> SearchHit:
+        kind, id, title, course_id = self.docs[doc]
+        return SearchHit(kind, id, title, course_id, score)
+
+    def title(self, id: int, kind: str = "course") -> Optional[str]:
+        doc = self.doc_ids.get((kind, id))
+        return self.docs[doc][2] if doc is not None else None
+
+def _catalog_signature(db: Session) -> tuple:
+    """Cheap fingerprint of the indexed tables, used to notice out-of-process changes"""
+    return tuple(
+        db.query(func.count(model.id), func.max(model.id), func.max(model.updated_at)).one()
+        for model in (Course, Lesson, LessonContent)
+    )
+
+class InMemorySearchBackend:
+    """One index per kind, so ``type=course`` never walks lesson postings"""
+
+    name = "memory"
+
+    def __init__(self):
+        self.indexes = {kind: InMemorySearchIndex() for kind in KINDS}
+        self._built = False
+        self._signature = None
+        self._checked_at = 0.0
+        self._stale = True
+        self._build_lock = threading.Lock()
+
+    def build(self, db: Session) -> None:
+        """(Re)build the indexes from the database"""
+        start = time.perf_counter()
+        # Taken first (and the stale flag cleared), so changes made during the build trigger another
+        signature = _catalog_signature(db)
+        self._stale = False
+        courses, lessons = InMemorySearchIndex(), InMemorySearchIndex()
+        key_concepts = dict(db.query(LessonContent.lesson_id, LessonContent.key_concepts).all())
+        for course in db.query(
+            Course.id, Course.title, Course.description, Course.overview
+        ).filter(Course.is_active == True).yield_per(2000):
+            courses.add("course", course.id, course.title, course.id, {
+                "title": course.title, "description": course.description, "overview": course.overview
+            })
+        for lesson in db.query(
+            Lesson.id, Lesson.course_id, Lesson.title, Lesson.description, Lesson.learning_objectives
+        ).filter(Lesson.is_active == True).yield_per(2000):
+            lessons.add("lesson", lesson.id, lesson.title, lesson.course_id, {
+                "title": lesson.title,
+                "description": lesson.description,
+                "learning_objectives": lesson.learning_objectives,
+                "key_concepts": key_concepts.get(lesson.id)
+            })
+        self.indexes = {"course": courses, "lesson": lessons}
+        self._signature = signature
+        self._checked_at = time.monotonic()
+        self._built = True
+        logger.info(
+            "Search index built: %d courses, %d lessons in %.2fs",
+            len(courses), len(lessons), time.perf_counter() - start
+        )
+
+    def ensure_current(self, db: Session) -> None:
+        """
+        Build the indexes on first use; afterwards refresh them in a background
+        thread while searches are served from the current ones
+        """
+        if not self._stale and time.monotonic() - self._checked_at < SEARCH_REFRESH_SECONDS:
+            return
+        if not self._built:
+            with self._build_lock:
+                if not self._built:
+                    self._refresh(db)
+            return
+        if self._build_lock.acquire(blocking=False):
+            threading.Thread(target=self._refresh_in_background, name="search-index-refresh", daemon=True).start()
+
+    def _refresh(self, db: Session) -> None:
+        if not self._stale and _catalog_signature(db) == self._signature:
+            self._checked_at = time.monotonic()
+            return
+        try:
+            self.build(db)
+        except Exception:
+            self._stale = True
+            raise
+
+    def _refresh_in_background(self) -> None:
+        db = SessionLocal()
+        try:
+            self._refresh(db)
+        except Exception as e:
+            logger.warning("Search index rebuild failed: %s", e)
+        finally:
+            db.close()
+            self._build_lock.release()
+
+    def search(self, db: Session, query: str, kind: Optional[str], limit: int) -> List[dict]:
+        self.ensure_current(db)
+        indexes = self.indexes
+        hits = []
+        for index_kind, index in indexes.items():
+            if kind in (None, index_kind):
+                hits.extend(index.search(query, limit))
+        hits = heapq.nlargest(limit, hits, key=lambda hit: hit.score)
+        return [
+            {
+                "type": hit.kind,
+                "id": hit.id,
+                "title": hit.title,
+                "course_id": hit.course_id,
+                "course_title": indexes["course"].title(hit.course_id),
+                "score": round(hit.score, 4)
+            }
+            for hit in hits
+        ]
+
+    def index_lesson_content(self, db: Session, lesson_id: int, key_concepts: Optional[List[str]]) -> None:
+        if self._stale:
+            return  # the next search rebuilds everything anyway
+        self.indexes["lesson"].update_fields("lesson", lesson_id, key_concepts=key_concepts)
+        # Our own write should not look like an out-of-process change
+        self._signature = _catalog_signature(db)
+
+    def invalidate(self) -> None:
+        self._stale = True
+
+# FULLTEXT cannot index JSON columns, so MySQL indexes stored text copies of
+# them: (table, generated column, JSON column)
+FULLTEXT_TEXT_COLUMNS = (
+    ("lessons", "learning_objectives_text", "learning_objectives"),
+    ("lesson_content", "key_concepts_text", "key_concepts"),
+)
+
+# MySQL FULLTEXT indexes, created by migration 7 (migration 4 indexed the columns before they became JSON)
+FULLTEXT_INDEXES = (
+    ("courses", "ft_courses_search", ("title", "description", "overview")),
+    ("lessons", "ft_lessons_search", ("title", "description", "learning_objectives_text")),
+    ("lesson_content", "ft_lesson_content_key_concepts", ("key_concepts_text",)),
+)
+
+# InnoDB's default FULLTEXT stopword list (INFORMATION_SCHEMA.INNODB_FT_DEFAULT_STOPWORD)
+INNODB_STOPWORDS = frozenset(
+    "a about an are as at be by com de en for from how i in is it la of on or that the this to was what "
+    "when where who will with und www".split()
+)
+
+def boolean_mode_query(query: str) -> str:
+    """
+    ``+term`` for every term (AND) and ``+term*`` for prefix terms. Whole terms
+    InnoDB does not index (too short or stopwords) are left out, as a required
+    term that is never indexed would match nothing; prefix terms are kept.
+    """
+    return " ".join(
+        f"+{term}*" if is_prefix else f"+{term}"
+        for term, is_prefix in parse_query(query)
+        if is_prefix or (len(term) >= MYSQL_FT_MIN_TOKEN_SIZE and term not in INNODB_STOPWORDS)
+    )
+
+class MySQLSearchBackend:
+    name = "mysql"
+
+    _COURSES = text("""
+        SELECT 'course' AS type, c.id, c.title, c.id AS course_id, c.title AS course_title,
+               MATCH(c.title, c.description, c.overview) AGAINST (:q IN BOOLEAN MODE) AS score
+        FROM courses c
+        WHERE c.is_active = 1 AND MATCH(c.title, c.description, c.overview) AGAINST (:q IN BOOLEAN MODE)
+        ORDER BY score DESC
+        LIMIT :limit
+    """)
+    # One MATCH per table, so each is answered from its own FULLTEXT index
+    # (an OR across a joined table scans every row), summed per lesson
+    _LESSONS = text("""
+        SELECT 'lesson' AS type, l.id, l.title, l.course_id, c.title AS course_title, hits.score
+        FROM (
+            SELECT matches.lesson_id, SUM(matches.score) AS score
+            FROM (
+                SELECT l.id AS lesson_id,
+                       MATCH(l.title, l.description, l.learning_objectives_text) AGAINST (:q IN BOOLEAN MODE) AS score
+                FROM lessons l
+                WHERE MATCH(l.title, l.description, l.learning_objectives_text) AGAINST (:q IN BOOLEAN MODE)
+                UNION ALL
+                SELECT lc.lesson_id, MATCH(lc.key_concepts_text) AGAINST (:q IN BOOLEAN MODE) AS score
+                FROM lesson_content lc
+                WHERE MATCH(lc.key_concepts_text) AGAINST (:q IN BOOLEAN MODE)
+            ) matches
+            GROUP BY matches.lesson_id
+        ) hits
+        JOIN lessons l ON l.id = hits.lesson_id
+        JOIN courses c ON c.id = l.course_id
+        WHERE l.is_active = 1
+        ORDER BY hits.score DESC
+        LIMIT :limit
+    """)
+
+    def search(self, db: Session, query: str, kind: Optional[str], limit: int) -> List[dict]:
+        boolean_query = boolean_mode_query(query)
+        if not boolean_query:
+            return []
+        params = {"q": boolean_query, "limit": limit}
+        results = []
+        for statement, statement_kind in ((self._COURSES, "course"), (self._LESSONS, "lesson")):
+            if kind in (None, statement_kind):
+                results.extend(dict(row) for row in db.execute(statement, params).mappings())
+        results.sort(key=lambda row: row["score"], reverse=True)
+        return [{**row, "score": round(float(row["score"]), 4)} for row in results[:limit]]
+
+    def index_lesson_content(self, db: Session, lesson_id: int, key_concepts: Optional[List[str]]) -> None:
+        pass  # InnoDB maintains FULLTEXT indexes on write
+
+    def invalidate(self) -> None:
+        pass
+
+def _select_backend():
+    if SEARCH_BACKEND == "mysql" or (SEARCH_BACKEND == "auto" and engine.dialect.name == "mysql"):
+        return MySQLSearchBackend()
+    return InMemorySearchBackend()
+
+backend = _select_backend()
+
+def search(db: Session, query: str, kind: Optional[str] = None, limit: int = 20) -> List[dict]:
+    """Ranked courses and lessons matching every term of ``query``"""
+    return backend.search(db, query, kind, limit)
+
+def index_lesson_content(db: Session, lesson_id: int, key_concepts: Optional[List[str]]) -> None:
+    """Reflect newly cached lesson content (its key concepts) in the index"""
+    try:
+        backend.index_lesson_content(db, lesson_id, key_concepts)
+    except Exception as e:
+        logger.warning("Search index update for lesson %s failed: %s", lesson_id, e)
+        backend.invalidate()
+
+def invalidate() -> None:
+    """Force a rebuild on the next search (e.g. after a catalog import)"""
+    backend.invalidate()
@@ -0,0 +1,346 @@
+"""
+Request tracing with OpenTelemetry-compatible spans.
+
+With ``TRACING_ENABLED=true`` every HTTP request gets a server span, which
+continues the caller's trace when the request carries a W3C ``traceparent``.
+The trace id is returned in ``X-Trace-Id``. Inside the request:
+
+- every SQLAlchemy statement is a client span carrying ``db.system``,
+  ``db.operation.name`` and the statement shape (literals removed);
+- every AIService call is a client span carrying ``gen_ai.*`` attributes
+  (model, operation, token usage, error type);
+- background tasks decorated with ``traced`` (content caching, regeneration,
+  prefetch, progress initialisation) are child spans of the request. The
+  current span lives in a context variable, which BackgroundTasks,
+  ``run_in_threadpool`` and ``asyncio.create_task`` all copy.
+
+A server span ends when the response body is complete, so the spans of its
+background tasks come after it. Statements outside a traced request are not
+recorded. ``TRACE_SAMPLE_RATE`` samples new traces; an incoming
+``traceparent`` keeps its own sampled flag.
+
+Finished spans are exported in batches as OTLP/JSON, selected by
+``TRACE_EXPORTER``:
+
+- ``file`` (default): one ``ExportTraceServiceRequest`` per line in ``TRACE_FILE``,
+  the format of the collector's file exporter;
+- ``otlp``: POSTed to ``OTEL_EXPORTER_OTLP_TRACES_ENDPOINT``, or to
+  ``OTEL_EXPORTER_OTLP_ENDPOINT`` + ``/v1/traces``.
+"""
+import asyncio
+import functools
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+from ..database import query_tracker
+
+logger = logging.getLogger(__name__)
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() == "true"
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "file")
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+TRACE_EXPORT_INTERVAL = float(os.getenv("TRACE_EXPORT_INTERVAL", "2"))
+TRACE_QUEUE_SIZE = int(os.getenv("TRACE_QUEUE_SIZE", "10000"))  # spans beyond this are dropped
+SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "learnanyskills-api")
+OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_TRACES_ENDPOINT") or (
+    os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4318").rstrip("/") + "/v1/traces"
+)
+
+TRACE_ID_HEADER = "X-Trace-Id"
+
+# OTLP SpanKind and StatusCode values
+SPAN_KINDS = {"internal": 1, "server": 2, "client": 3}
+STATUS_OK, STATUS_ERROR = 1, 2
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+class Span:
+    """One timed operation of a trace"""
+
+    def __init__(
+        self,
+        name: str,
+        kind: str = "internal",
+        trace_id: Optional[str] = None,
+        parent_id: Optional[str] = None,
+        attributes: Optional[Dict[str, Any]] = None
+    ):
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id or f"{random.getrandbits(128):032x}"
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.status = 0
+        self.status_message = ""
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+
+    def child(self, name: str, kind: str = "internal", attributes: Optional[Dict[str, Any]] = None) -> "Span":
+        return Span(name, kind, self.trace_id, self.span_id, attributes)
+
+    def set_attributes(self, attributes: Dict[str, Any]) -> None:
+        self.attributes.update({key: value for key, value in attributes.items() if value is not None})
+
+    def set_error(self, message: str) -> None:
+        self.status = STATUS_ERROR
+        self.status_message = message[:500]
+
+    def end(self) -> None:
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            exporter.submit(self)
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": SPAN_KINDS.get(self.kind, 1),
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or time.time_ns()),
+            "attributes": [_otlp_attribute(key, value) for key, value in self.attributes.items()],
+            "status": {"code": self.status, "message": self.status_message} if self.status else {}
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        encoded = {"boolValue": value}
+    elif isinstance(value, int):
+        encoded = {"intValue": str(value)}
+    elif isinstance(value, float):
+        encoded = {"doubleValue": value}
+    else:
+        encoded = {"stringValue": str(value)}
+    return {"key": key, "value": encoded}
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+@contextmanager
+def start_span(name: str, kind: str = "internal", attributes: Optional[Dict[str, Any]] = None) -> Iterator[Optional[Span]]:
+    """
+    Child span of the current one, made current for the block. Yields None
+    (and records nothing) outside a sampled trace.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    span = parent.child(name, kind, attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.set_error(f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end()
+
+def traced(name: str):
+    """Run a sync or async function (e.g. a background task) in a child span"""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with start_span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with start_span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def record_ai_call(operation: str, usage: Optional[dict], error: Optional[str]) -> None:
+    """Token usage and outcome of an AIService call, on its span"""
+    span = _current_span.get()
+    if span is None or span.kind != "client":
+        return
+    usage = usage or {}
+    span.set_attributes({
+        "gen_ai.usage.input_tokens": usage.get("prompt_tokens"),
+        "gen_ai.usage.output_tokens": usage.get("completion_tokens"),
+        "error.type": error
+    })
+    if error:
+        span.set_error(error)
+
+def parse_traceparent(value: Optional[str]):
+    """(trace_id, parent span id, sampled) from a W3C traceparent header, or None"""
+    match = _TRACEPARENT.match((value or "").strip().lower())
+    if not match or match.group(1) == "0" * 32 or match.group(2) == "0" * 16:
+        return None
+    return match.group(1), match.group(2), int(match.group(3), 16) & 1 == 1
+
+class SpanExporter:
+    """Queues finished spans and writes them in batches from a daemon thread"""
+
+    def __init__(self, exporter: str = TRACE_EXPORTER, interval: float = TRACE_EXPORT_INTERVAL):
+        self.exporter = exporter
+        self.interval = interval
+        self._queue: Deque[Span] = deque(maxlen=TRACE_QUEUE_SIZE)
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, span: Span) -> None:
+        self._queue.append(span)
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+                    self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self) -> None:
+        batch: List[Span] = []
+        while self._queue:
+            batch.append(self._queue.popleft())
+        if not batch:
+            return
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", SERVICE_NAME)]},
+                "scopeSpans": [{"scope": {"name": __name__}, "spans": [span.to_otlp() for span in batch]}]
+            }]
+        }
+        try:
+            if self.exporter == "otlp":
+                import httpx
+                httpx.post(OTLP_ENDPOINT, json=payload, timeout=10.0).raise_for_status()
+            else:
+                with open(TRACE_FILE, "a", encoding="utf-8") as output:
+                    output.write(json.dumps(payload, separators=(",", ":")) + "\n")
+        except Exception as e:
+            logger.warning("Exporting %d spans failed: %s", len(batch), e)
+
+exporter = SpanExporter()
+
+def shutdown() -> None:
+    """Export the spans still queued"""
+    exporter.flush()
+
+def instrument_engine(engine) -> None:
+    """Record a client span for each statement executed inside a trace"""
+    from sqlalchemy import event
+
+    system = engine.dialect.name
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        parent = _current_span.get()
+        if parent is None or context is None:
+            return
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "QUERY"
+        context._trace_span = parent.child(operation, "client", {
+            "db.system": system,
+            "db.operation.name": operation,
+            "db.statement": query_tracker.statement_shape(statement)[:2000]
+        })
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        span = getattr(context, "_trace_span", None)
+        if span is not None:
+            if cursor.rowcount is not None and cursor.rowcount >= 0:
+                span.set_attributes({"db.response.returned_rows": cursor.rowcount})
+            span.end()
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        span = getattr(exception_context.execution_context, "_trace_span", None)
+        if span is not None:
+            span.set_error(f"{type(exception_context.original_exception).__name__}: {exception_context.original_exception}")
+            span.end()
+
+class TracingMiddleware:
+    """
+    Pure ASGI middleware that opens the server span of each HTTP request.
+    Add it last so that it wraps the other middleware.
+    """
+
+    def __init__(self, app, sample_rate: float = TRACE_SAMPLE_RATE):
+        self.app = app
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers", []))
+        incoming = parse_traceparent(headers.get(b"traceparent", b"").decode("latin-1"))
+        if incoming is not None:
+            trace_id, parent_id, sampled = incoming
+        else:
+            trace_id, parent_id, sampled = None, None, random.random() < self.sample_rate
+        if not sampled:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope.get("method", "")
+        span = Span(method, "server", trace_id, parent_id, {
+            "http.request.method": method,
+            "url.path": scope.get("path", ""),
+            "url.scheme": scope.get("scheme", "http")
+        })
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                span.set_attributes({"http.response.status_code": message["status"]})
+                if message["status"] >= 500:
+                    span.set_error(f"HTTP {message['status']}")
+                message = {**message, "headers": [
+                    *message.get("headers", []), (TRACE_ID_HEADER.lower().encode(), span.trace_id.encode())
+                ]}
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                # Background tasks run after this and become later child spans
+                _finish(span, scope)
+
+        token = _current_span.set(span)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException as e:
+            span.set_error(f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            _current_span.reset(token)
+            _finish(span, scope)
+
+def _finish(span: Span, scope) -> None:
+    if span.end_ns is not None:
+        return
+    route = getattr(scope.get("route"), "path", None)
+    if route:
+        span.name = f"{span.attributes['http.request.method']} {route}"
+        span.set_attributes({"http.route": route})
+    span.end()
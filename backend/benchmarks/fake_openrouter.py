@@ -0,0 +1,159 @@
+"""
+Local stand-in for the OpenRouter chat completions API used in load tests.
+
+Latency, jitter, error rate and streaming chunk timing are configurable so the
+backend can be exercised under realistic LLM behaviour without spending tokens.
+
+Run it with:
+
+    python -m benchmarks.fake_openrouter --port 8099 --latency-ms 1500 --error-rate 0.02
+
+and point the backend at it:
+
+    OPENROUTER_BASE_URL=http://127.0.0.1:8099/api/v1/chat/completions
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from dataclasses import dataclass
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+@dataclass
+class StubConfig:
+    latency_ms: float = 800.0
+    jitter_ms: float = 200.0
+    error_rate: float = 0.0
+    error_status: int = 502
+    stream_chunks: int = 20
+    completion_tokens: int = 1200
+    batch_drop: bool = False  # Leave the last lesson out of batched responses
+
+config = StubConfig()
+app = FastAPI(title="Fake OpenRouter")
+
+def _lesson_payload(prompt: str) -> str:
+    """Valid lesson JSON in the shape AIService asks the model for"""
+    title = "Generated Lesson"
+    for line in prompt.splitlines():
+        if line.startswith("Lesson:"):
+            title = line.split(":", 1)[1].strip()
+            break
+    return json.dumps({
+        "introduction": f"In this lesson on {title} you will learn the core ideas step by step.",
+        "main_content": [
+            {"section_title": f"Section {index}", "content": "Lorem ipsum dolor sit amet. " * 40}
+            for index in range(1, 5)
+        ],
+        "code_examples": [
+            {"title": "Example", "code": "print('hello world')", "explanation": "Prints a greeting."}
+        ],
+        "key_takeaways": ["First takeaway", "Second takeaway", "Third takeaway"],
+        "practice_exercises": [
+            {"title": "Exercise", "description": "Practice what you learned.", "difficulty": "beginner"}
+        ]
+    })
+
+def _course_batch_payload(prompt: str) -> str:
+    """Batched lesson JSON with one entry per "Lesson key:" in the prompt"""
+    lessons = []
+    for line in prompt.splitlines():
+        if line.startswith("Lesson key:"):
+            lessons.append({"lesson_key": line.split(":", 1)[1].strip()})
+        elif line.startswith("Lesson:") and lessons:
+            lessons[-1].update(json.loads(_lesson_payload(line)))
+    if config.batch_drop and lessons:
+        lessons.pop()
+    return json.dumps({"lessons": lessons})
+
+def _overview_payload(prompt: str) -> str:
+    return "This lesson gets you productive quickly. " * 10
+
+def _sample_latency() -> float:
+    return max(0.0, random.gauss(config.latency_ms, config.jitter_ms)) / 1000
+
+@app.post("/api/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    messages = body.get("messages", [])
+    prompt = messages[-1]["content"] if messages else ""
+    wants_json = any("valid JSON" in message.get("content", "") for message in messages)
+    batch_size = prompt.count("\nLesson key:")
+    if batch_size:
+        content = _course_batch_payload(prompt)
+    else:
+        content = _lesson_payload(prompt) if wants_json else _overview_payload(prompt)
+    usage = {
+        "prompt_tokens": sum(len(message.get("content", "")) for message in messages) // 4,
+        "completion_tokens": (
+            config.completion_tokens * max(1, batch_size) if wants_json else config.completion_tokens // 8
+        )
+    }
+    usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+    if random.random() < config.error_rate:
+        await asyncio.sleep(_sample_latency() / 4)
+        return JSONResponse(
+            status_code=config.error_status,
+            content={"error": {"message": "Injected upstream failure", "code": config.error_status}}
+        )
+
+    completion_id = f"gen-{uuid.uuid4().hex}"
+    if body.get("stream"):
+        async def event_stream():
+            chunk_size = max(1, len(content) // max(1, config.stream_chunks))
+            delay = _sample_latency() / max(1, config.stream_chunks)
+            for offset in range(0, len(content), chunk_size):
+                await asyncio.sleep(delay)
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "choices": [{"index": 0, "delta": {"content": content[offset:offset + chunk_size]}}]
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+            final = {"id": completion_id, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "usage": usage}
+            yield f"data: {json.dumps(final)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+    await asyncio.sleep(_sample_latency())
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": usage
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenRouter server for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency-ms", type=float, default=config.latency_ms)
+    parser.add_argument("--jitter-ms", type=float, default=config.jitter_ms)
+    parser.add_argument("--error-rate", type=float, default=config.error_rate, help="Fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=config.error_status)
+    parser.add_argument("--stream-chunks", type=int, default=config.stream_chunks)
+    parser.add_argument("--completion-tokens", type=int, default=config.completion_tokens)
+    parser.add_argument("--batch-drop", action="store_true", help="Leave one lesson out of batched responses")
+    args = parser.parse_args()
+
+    config.latency_ms = args.latency_ms
+    config.jitter_ms = args.jitter_ms
+    config.error_rate = args.error_rate
+    config.error_status = args.error_status
+    config.stream_chunks = args.stream_chunks
+    config.completion_tokens = args.completion_tokens
+    config.batch_drop = args.batch_drop
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""
+End-to-end load scenarios for every route in ``app/api/courses.py`` and
+``app/api/ai.py``.
+
+Each scenario runs closed-loop against a running backend for a fixed duration
+at a given concurrency; latency percentiles and throughput are written to a
+JSON report that can be compared with a previous run:
+
+    python -m benchmarks.loadtest --base-url http://127.0.0.1:8000 \\
+        --manifest benchmarks/results/seed_manifest.json --duration 30 --concurrency 32 \\
+        --output benchmarks/results/loadtest.json --compare benchmarks/results/baseline.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    build: Callable[[random.Random, dict], Tuple[str, Optional[dict]]]
+    weight: int = 1
+
+def _course_id(rng, manifest):
+    low, high = manifest["course_ids"]
+    return rng.randint(low, high)
+
+def _lesson_id(rng, manifest):
+    low, high = manifest["lesson_ids"]
+    return rng.randint(low, high)
+
+def _cached_lesson_id(rng, manifest):
+    return rng.choice(manifest["lessons_with_content"] or [_lesson_id(rng, manifest)])
+
+def _uncached_lesson_id(rng, manifest):
+    return rng.choice(manifest["lessons_without_content"] or [_lesson_id(rng, manifest)])
+
+def _user_id(rng, manifest):
+    return f"{manifest['user_prefix']}{rng.randrange(manifest['users'])}"
+
+# Mix of common, rare and as-you-type (prefix) queries against seeded titles
+SEARCH_QUERIES = ["lesson", "python course", "practical skills", "lesson 42", "stat", "objective 3 lesson 12", "ex"]
+
+SCENARIOS: Dict[str, Scenario] = {
+    scenario.name: scenario for scenario in [
+        Scenario("list_courses", "GET", lambda rng, m: ("/api/courses", None), weight=2),
+        Scenario("course_details", "GET", lambda rng, m: (f"/api/courses/{_course_id(rng, m)}", None), weight=10),
+        Scenario("course_lessons", "GET", lambda rng, m: (f"/api/courses/{_course_id(rng, m)}/lessons", None), weight=10),
+        Scenario("lesson_details", "GET", lambda rng, m: (f"/api/lessons/{_lesson_id(rng, m)}", None), weight=15),
+        Scenario("user_progress", "GET", lambda rng, m: (f"/api/user/{_user_id(rng, m)}/progress", None), weight=8),
+        Scenario(
+            "search", "GET",
+            lambda rng, m: (f"/api/search?q={rng.choice(SEARCH_QUERIES)}", None),
+            weight=5
+        ),
+        Scenario(
+            "lesson_overview", "POST",
+            lambda rng, m: (f"/api/ai/lessons/{_lesson_id(rng, m)}/overview", {"user_id": _user_id(rng, m)}),
+            weight=1
+        ),
+        Scenario(
+            "generate_content_cached", "POST",
+            lambda rng, m: (f"/api/ai/lessons/{_cached_lesson_id(rng, m)}/generate", {"user_id": _user_id(rng, m)}),
+            weight=5
+        ),
+        Scenario(
+            "generate_content_uncached", "POST",
+            lambda rng, m: (f"/api/ai/lessons/{_uncached_lesson_id(rng, m)}/generate", {"user_id": _user_id(rng, m)}),
+            weight=1
+        ),
+        Scenario(
+            "cached_content", "GET",
+            lambda rng, m: (f"/api/ai/lessons/{_cached_lesson_id(rng, m)}/content", None),
+            weight=15
+        ),
+        Scenario(
+            "update_progress", "POST",
+            lambda rng, m: (
+                f"/api/ai/lessons/{_lesson_id(rng, m)}/progress",
+                {
+                    "user_id": _user_id(rng, m),
+                    "completion_percentage": rng.choice([10, 50, 100]),
+                    "time_spent_minutes": rng.randint(1, 5),
+                    "is_completed": False
+                }
+            ),
+            weight=8
+        )
+    ]
+}
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def summarize(latencies: List[float], errors: int, statuses: Dict[int, int], elapsed: float) -> dict:
+    ordered = sorted(latencies)
+    total = len(latencies) + errors
+    return {
+        "requests": total,
+        "errors": errors + sum(count for status, count in statuses.items() if status >= 500),
+        "status_codes": {str(status): count for status, count in sorted(statuses.items())},
+        "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(ordered, 0.50) * 1000, 2),
+            "p95": round(percentile(ordered, 0.95) * 1000, 2),
+            "p99": round(percentile(ordered, 0.99) * 1000, 2),
+            "max": round(ordered[-1] * 1000, 2) if ordered else 0.0,
+            "mean": round(sum(ordered) / len(ordered) * 1000, 2) if ordered else 0.0
+        }
+    }
+
+async def run_scenarios(
+    client: httpx.AsyncClient,
+    scenarios: List[Scenario],
+    manifest: dict,
+    duration: float,
+    concurrency: int,
+    seed: int
+) -> dict:
+    """Closed-loop run: ``concurrency`` workers pick weighted scenarios until time is up"""
+    results = {scenario.name: {"latencies": [], "errors": 0, "statuses": {}} for scenario in scenarios}
+    weights = [scenario.weight for scenario in scenarios]
+    deadline = time.perf_counter() + duration
+
+    async def worker(worker_id: int):
+        rng = random.Random(seed + worker_id)
+        while time.perf_counter() < deadline:
+            scenario = rng.choices(scenarios, weights)[0]
+            path, body = scenario.build(rng, manifest)
+            bucket = results[scenario.name]
+            start = time.perf_counter()
+            try:
+                response = await client.request(scenario.method, path, json=body)
+            except httpx.HTTPError:
+                bucket["errors"] += 1
+                continue
+            bucket["latencies"].append(time.perf_counter() - start)
+            bucket["statuses"][response.status_code] = bucket["statuses"].get(response.status_code, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(index) for index in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    report = {
+        name: summarize(data["latencies"], data["errors"], data["statuses"], elapsed)
+        for name, data in results.items()
+    }
+    all_latencies = [value for data in results.values() for value in data["latencies"]]
+    all_statuses: Dict[int, int] = {}
+    for data in results.values():
+        for status, count in data["statuses"].items():
+            all_statuses[status] = all_statuses.get(status, 0) + count
+    report["_total"] = summarize(
+        all_latencies, sum(data["errors"] for data in results.values()), all_statuses, elapsed
+    )
+    return report
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return None
+
+def compare(current: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Human-readable p95/throughput deltas; entries over ``tolerance`` are flagged"""
+    lines = []
+    for name, stats in current["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous or not previous["latency_ms"]["p95"]:
+            continue
+        p95_delta = stats["latency_ms"]["p95"] / previous["latency_ms"]["p95"] - 1
+        rps_delta = stats["throughput_rps"] / previous["throughput_rps"] - 1 if previous["throughput_rps"] else 0.0
+        flag = "REGRESSION" if p95_delta > tolerance else "ok"
+        lines.append(
+            f"{name:28s} p95 {previous['latency_ms']['p95']:>9.2f} -> {stats['latency_ms']['p95']:>9.2f} ms "
+            f"({p95_delta:+.1%})  rps {rps_delta:+.1%}  {flag}"
+        )
+    return lines
+
+async def main_async(args) -> int:
+    with open(args.manifest) as handle:
+        manifest = json.load(handle)
+
+    names = args.scenarios.split(",") if args.scenarios else list(SCENARIOS)
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(unknown)}")
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        if args.mixed:
+            print(f"Running mixed workload for {args.duration}s at concurrency {args.concurrency}")
+            scenario_reports = await run_scenarios(
+                client, [SCENARIOS[name] for name in names], manifest, args.duration, args.concurrency, args.seed
+            )
+        else:
+            scenario_reports = {}
+            for name in names:
+                print(f"Running {name} for {args.duration}s at concurrency {args.concurrency}")
+                report = await run_scenarios(
+                    client, [SCENARIOS[name]], manifest, args.duration, args.concurrency, args.seed
+                )
+                scenario_reports[name] = report[name]
+
+    result = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "config": {
+            "base_url": args.base_url,
+            "duration_s": args.duration,
+            "concurrency": args.concurrency,
+            "mixed": args.mixed,
+            "seed": args.seed
+        },
+        "scenarios": scenario_reports
+    }
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as handle:
+        json.dump(result, handle, indent=2)
+
+    for name, stats in scenario_reports.items():
+        latency = stats["latency_ms"]
+        print(
+            f"{name:28s} {stats['throughput_rps']:>9.1f} rps  p50 {latency['p50']:>8.2f}  "
+            f"p95 {latency['p95']:>8.2f}  p99 {latency['p99']:>8.2f} ms  errors {stats['errors']}"
+        )
+    print(f"Report written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as handle:
+            baseline = json.load(handle)
+        lines = compare(result, baseline, args.tolerance)
+        print("\n".join(lines))
+        if any(line.endswith("REGRESSION") for line in lines):
+            return 1
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the LearnAnySkills API")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--manifest", default="benchmarks/results/seed_manifest.json")
+    parser.add_argument("--scenarios", help=f"Comma-separated subset of: {', '.join(SCENARIOS)}")
+    parser.add_argument("--mixed", action="store_true", help="Run all scenarios together using their weights")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--timeout", type=float, default=90.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="benchmarks/results/loadtest.json")
+    parser.add_argument("--compare", help="Previous report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed p95 slowdown before flagging")
+    args = parser.parse_args()
+    raise SystemExit(asyncio.run(main_async(args)))
+
+if __name__ == "__main__":
+    main()
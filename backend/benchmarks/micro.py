@@ -0,0 +1,200 @@
+"""
+Micro-benchmarks for the per-request hot paths, run against in-memory SQLite.
+
+Covers the lesson dict building in ``get_course_details``/``get_course_lessons``,
+the fallback reconstruction in ``parse_lesson_content`` and prompt assembly in
+``AIService``, plus the two course routes end to end.
+
+    python -m benchmarks.micro                                   # run and print
+    python -m benchmarks.micro --save benchmarks/micro_baseline.json
+    python -m benchmarks.micro --baseline benchmarks/micro_baseline.json
+
+With ``--baseline`` the exit code is 1 when any benchmark's median is slower
+than the baseline by more than ``--tolerance``.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict
+
+os.environ.setdefault("OPENROUTER_API_KEY", "benchmark")
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.api.ai import parse_lesson_content
+from app.api.courses import get_course_details, get_course_lessons, serialize_lesson
+from app.models import Course, Lesson, LessonContent
+from app.services.ai_service import AIService
+
+from .seed import seed
+
+LESSONS_PER_COURSE = 50
+
+def _setup_database():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    with contextlib.redirect_stdout(sys.stderr):
+        seed(
+            courses=20, lessons_per_course=LESSONS_PER_COURSE, content_ratio=0.5, users=10,
+            progress_rows=100, bind=engine
+        )
+    return engine, sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def build_benchmarks() -> Dict[str, Callable[[], object]]:
+    engine, Session = _setup_database()
+    session = Session()
+    course = session.query(Course).first()
+    lessons = session.query(Lesson).filter(Lesson.course_id == course.id).order_by(Lesson.lesson_number).all()
+    for lesson in lessons:
+        lesson.lesson_content  # load relationships up front so only dict building is timed
+
+    json_content = session.query(LessonContent).first()
+    fallback_content = LessonContent(
+        lesson_id=0,
+        ai_generated_content="Plain text lesson that the model failed to return as JSON. " * 60,
+        content_summary=json_content.content_summary,
+        key_concepts=json_content.key_concepts,
+        code_examples=json_content.code_examples,
+        exercises=json_content.exercises
+    )
+
+    ai_service = AIService()
+    prompt_args = dict(
+        course_title=course.title,
+        lesson_title=lessons[0].title,
+        lesson_description=lessons[0].description,
+        learning_objectives=lessons[0].objectives,
+        estimated_duration=lessons[0].estimated_duration
+    )
+
+    def course_details_dicts():
+        result = []
+        for lesson in lessons:
+            lesson_data = serialize_lesson(lesson)
+            lesson_data["has_content"] = bool(lesson.lesson_content)
+            result.append(lesson_data)
+        return result
+
+    def course_lessons_dicts():
+        result = []
+        for lesson in lessons:
+            lesson_data = serialize_lesson(lesson)
+            lesson_data["created_at"] = lesson.created_at
+            lesson_data["has_content"] = bool(lesson.lesson_content)
+            result.append(lesson_data)
+        return result
+
+    loop = asyncio.new_event_loop()
+
+    def route(handler, **params):
+        def run():
+            db = Session()
+            try:
+                return loop.run_until_complete(handler(course.id, db=db, **params))
+            finally:
+                db.close()
+        return run
+
+    return {
+        "course_details_lesson_dicts": course_details_dicts,
+        "course_lessons_lesson_dicts": course_lessons_dicts,
+        "cached_content_json": lambda: parse_lesson_content(json_content),
+        "cached_content_fallback": lambda: parse_lesson_content(fallback_content),
+        "lesson_content_prompt": lambda: ai_service.build_lesson_content_request(**prompt_args),
+        "lesson_overview_prompt": lambda: ai_service.build_lesson_overview_request(
+            prompt_args["course_title"], prompt_args["lesson_title"], prompt_args["lesson_description"]
+        ),
+        "route_get_course_details": route(get_course_details),
+        "route_get_course_lessons": route(get_course_lessons, cursor=None, limit=LESSONS_PER_COURSE, fields=None)
+    }
+
+def measure(func: Callable[[], object], min_time: float, repeats: int) -> dict:
+    """Calibrate a loop count that runs for ``min_time`` and time ``repeats`` of it"""
+    func()
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        loops = loops * 10 if elapsed == 0 else max(loops * 2, int(loops * min_time / elapsed) + 1)
+
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        samples.append((time.perf_counter() - start) / loops * 1e6)
+    return {
+        "loops": loops,
+        "repeats": repeats,
+        "median_us": round(statistics.median(samples), 3),
+        "min_us": round(min(samples), 3),
+        "stdev_us": round(statistics.stdev(samples), 3) if len(samples) > 1 else 0.0
+    }
+
+def compare(results: dict, baseline: dict, tolerance: float) -> bool:
+    """Print median deltas against a baseline; True when anything regressed"""
+    regressed = False
+    for name, stats in results["benchmarks"].items():
+        previous = baseline.get("benchmarks", {}).get(name)
+        if not previous:
+            print(f"{name:34s} (new)")
+            continue
+        delta = stats["median_us"] / previous["median_us"] - 1 if previous["median_us"] else 0.0
+        flag = "REGRESSION" if delta > tolerance else "ok"
+        regressed = regressed or delta > tolerance
+        print(f"{name:34s} {previous['median_us']:>12.2f} -> {stats['median_us']:>12.2f} us  ({delta:+.1%})  {flag}")
+    return regressed
+
+def main():
+    parser = argparse.ArgumentParser(description="Run hot-path micro-benchmarks")
+    parser.add_argument("--filter", help="Only run benchmarks whose name contains this string")
+    parser.add_argument("--min-time", type=float, default=0.05, help="Seconds per timing sample")
+    parser.add_argument("--repeats", type=int, default=7)
+    parser.add_argument("--output", help="Write results JSON here (default: stdout)")
+    parser.add_argument("--save", help="Alias for --output, for writing a baseline")
+    parser.add_argument("--baseline", help="Compare against a previous results file")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed median slowdown")
+    args = parser.parse_args()
+
+    benchmarks = build_benchmarks()
+    results = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "benchmarks": {}
+    }
+    for name, func in benchmarks.items():
+        if args.filter and args.filter not in name:
+            continue
+        results["benchmarks"][name] = measure(func, args.min_time, args.repeats)
+        print(f"{name:34s} {results['benchmarks'][name]['median_us']:>12.2f} us", file=sys.stderr)
+
+    output = args.output or args.save
+    if output:
+        with open(output, "w") as handle:
+            json.dump(results, handle, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        with open(args.baseline) as handle:
+            baseline = json.load(handle)
+        if compare(results, baseline, args.tolerance):
+            raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
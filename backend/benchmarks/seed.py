@@ -0,0 +1,201 @@
+"""
+Scalable synthetic dataset for load tests.
+
+Fills ``courses``, ``lessons``, ``lesson_content`` and ``user_progress`` with
+batched Core inserts (no ORM unit of work), so 10k courses and a million
+progress rows load in minutes. A manifest with the generated id ranges is
+written for ``benchmarks.loadtest``.
+
+    DATABASE_URL=sqlite:///./bench.db python -m benchmarks.seed \\
+        --courses 10000 --lessons-per-course 10 --users 50000 --progress-rows 1000000
+"""
+import argparse
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select
+
+from app.database.config import engine
+from app.database.migrations import migrate, reset as reset_schema
+from app.database.rollups import rebuild as rebuild_rollups
+from app.models import Course, Lesson, LessonContent, UserProgress
+
+DIFFICULTIES = ["Beginner", "Beginner to Intermediate", "Intermediate", "Intermediate to Advanced", "Advanced"]
+TOPICS = ["Python", "SQL", "Excel", "Statistics", "Pandas", "Machine Learning", "Visualization", "Spreadsheets"]
+
+def _batched(rows, batch_size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _insert(conn, table, rows, batch_size, label):
+    start = time.perf_counter()
+    total = 0
+    for batch in _batched(rows, batch_size):
+        conn.execute(table.insert(), batch)
+        total += len(batch)
+    print(f"  {label}: {total} rows in {time.perf_counter() - start:.1f}s")
+    return total
+
+def _next_id(conn, model):
+    return (conn.execute(select(func.max(model.id))).scalar() or 0) + 1
+
+def _course_rows(first_id, count, rng):
+    for course_id in range(first_id, first_id + count):
+        topic = rng.choice(TOPICS)
+        yield {
+            "id": course_id,
+            "title": f"{topic} Course {course_id}",
+            "description": f"Learn {topic.lower()} from the ground up with hands-on projects. " * 2,
+            "overview": f"A complete path through {topic.lower()}.\n\nYou'll learn the essentials and more. " * 4,
+            "difficulty_level": rng.choice(DIFFICULTIES),
+            "estimated_duration": f"{rng.randint(2, 10)} weeks",
+            "image_url": f"/images/course-{course_id}.jpg",
+            "is_active": True
+        }
+
+def _lesson_rows(first_lesson_id, first_course_id, courses, per_course, rng):
+    lesson_id = first_lesson_id
+    for course_id in range(first_course_id, first_course_id + courses):
+        for number in range(1, per_course + 1):
+            yield {
+                "id": lesson_id,
+                "course_id": course_id,
+                "title": f"Lesson {number} of course {course_id}",
+                "description": f"Practical skills for lesson {number}, with worked examples and exercises.",
+                "lesson_number": number,
+                "estimated_duration": f"{rng.randint(20, 90)} minutes",
+                "learning_objectives": [f"Objective {index} for lesson {number}" for index in range(1, 5)],
+                "is_active": True
+            }
+            lesson_id += 1
+
+EXERCISE_DIFFICULTIES = ("beginner", "intermediate", "advanced")
+
+def _content_rows(lesson_ids):
+    content = {
+        "introduction": "An engaging introduction to the lesson topic. " * 5,
+        "main_content": [{"section_title": f"Section {index}", "content": "Body text. " * 120} for index in range(1, 5)],
+        "code_examples": [{"title": "Example", "code": "print('hi')", "explanation": "Prints."}],
+        "key_takeaways": ["One", "Two", "Three"],
+        "practice_exercises": [{"title": "Try it", "description": "Practice.", "difficulty": "beginner"}]
+    }
+    raw = json.dumps(content)
+    for lesson_id in lesson_ids:
+        yield {
+            "lesson_id": lesson_id,
+            "ai_generated_content": raw,
+            "content_summary": content["introduction"][:500],
+            "key_concepts": content["key_takeaways"],
+            "code_examples": content["code_examples"],
+            "exercises": [
+                {**exercise, "difficulty": EXERCISE_DIFFICULTIES[lesson_id % len(EXERCISE_DIFFICULTIES)]}
+                for exercise in content["practice_exercises"]
+            ]
+        }
+
+def _progress_rows(lessons, per_course, first_lesson_id, first_course_id, users, total_rows, rng):
+    per_user = max(1, -(-total_rows // users))
+    now = datetime.now()
+    emitted = 0
+    for user_index in range(users):
+        start = rng.randrange(lessons)
+        for offset in range(min(per_user, lessons)):
+            if emitted >= total_rows:
+                return
+            lesson_offset = (start + offset) % lessons
+            completion = rng.choice([0, 10, 25, 50, 75, 100])
+            accessed = now - timedelta(minutes=rng.randint(0, 60 * 24 * 90))
+            minutes = rng.randint(0, 120)
+            yield {
+                "user_id": f"loadtest-user-{user_index}",
+                "lesson_id": first_lesson_id + lesson_offset,
+                "course_id": first_course_id + lesson_offset // per_course,
+                "is_completed": completion == 100,
+                "completion_percentage": completion,
+                "time_spent_minutes": minutes,
+                "time_spent_seconds": minutes * 60,
+                "completed_at": accessed if completion == 100 else None,
+                "last_accessed": accessed
+            }
+            emitted += 1
+
+def seed(
+    courses, lessons_per_course, content_ratio, users, progress_rows,
+    batch_size=5000, reset=False, seed_value=42, bind=None
+):
+    bind = bind if bind is not None else engine
+    rng = random.Random(seed_value)
+    if reset:
+        reset_schema(bind)
+    migrate(bind, seed=False)
+
+    start = time.perf_counter()
+    with bind.begin() as conn:
+        first_course_id = _next_id(conn, Course)
+        first_lesson_id = _next_id(conn, Lesson)
+        lesson_count = courses * lessons_per_course
+
+        print(f"Seeding {courses} courses, {lesson_count} lessons, {progress_rows} progress rows")
+        _insert(conn, Course.__table__, _course_rows(first_course_id, courses, rng), batch_size, "courses")
+        _insert(
+            conn, Lesson.__table__,
+            _lesson_rows(first_lesson_id, first_course_id, courses, lessons_per_course, rng),
+            batch_size, "lessons"
+        )
+        content_ids = sorted(rng.sample(
+            range(first_lesson_id, first_lesson_id + lesson_count), int(lesson_count * content_ratio)
+        ))
+        _insert(conn, LessonContent.__table__, _content_rows(content_ids), batch_size, "lesson_content")
+        _insert(
+            conn, UserProgress.__table__,
+            _progress_rows(lesson_count, lessons_per_course, first_lesson_id, first_course_id, users, progress_rows, rng),
+            batch_size, "user_progress"
+        )
+
+    # Bulk inserts bypass the incremental rollup updates
+    rebuild_rollups(bind)
+    print(f"Seeded in {time.perf_counter() - start:.1f}s")
+    return {
+        "course_ids": [first_course_id, first_course_id + courses - 1],
+        "lesson_ids": [first_lesson_id, first_lesson_id + lesson_count - 1],
+        "lessons_with_content": content_ids[:1000],
+        "lessons_without_content": sorted(
+            set(range(first_lesson_id, first_lesson_id + min(lesson_count, 5000))) - set(content_ids)
+        )[:1000],
+        "users": users,
+        "user_prefix": "loadtest-user-"
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed the database with a synthetic load-test dataset")
+    parser.add_argument("--courses", type=int, default=1000)
+    parser.add_argument("--lessons-per-course", type=int, default=10)
+    parser.add_argument("--content-ratio", type=float, default=0.5, help="Fraction of lessons with cached content")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--progress-rows", type=int, default=100000)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reset", action="store_true", help="Drop and recreate all tables first")
+    parser.add_argument("--manifest", default="benchmarks/results/seed_manifest.json")
+    args = parser.parse_args()
+
+    manifest = seed(
+        args.courses, args.lessons_per_course, args.content_ratio, args.users,
+        args.progress_rows, args.batch_size, args.reset, args.seed
+    )
+    os.makedirs(os.path.dirname(args.manifest) or ".", exist_ok=True)
+    with open(args.manifest, "w") as handle:
+        json.dump(manifest, handle, indent=2)
+    print(f"Manifest written to {args.manifest}")
+
+if __name__ == "__main__":
+    main()
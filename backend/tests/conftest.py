@@ -0,0 +1,36 @@
+"""
+Shared test setup: a migrated and seeded SQLite database in a temporary
+directory. The environment is set before any ``app`` module is imported.
+"""
+import json
+import os
+import tempfile
+
+_db_dir = tempfile.mkdtemp(prefix="learnanyskills-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'test.db')}"
+os.environ["AUTO_MIGRATE"] = "true"
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(app) as client:
+        yield client
+
+def lesson_content(title: str) -> dict:
+    """Generated lesson content as the model returns it"""
+    return {
+        "introduction": f"An introduction to {title}.",
+        "main_content": [{"section_title": title, "content": f"All about {title}. " * 40}],
+        "code_examples": [{"title": "Example", "code": "print('hello')", "explanation": "Prints hello"}],
+        "key_takeaways": [f"{title} matters"],
+        "practice_exercises": [{"question": f"Explain {title}", "difficulty": "easy"}]
+    }
+
+def cache_content(lesson_id: int, title: str) -> None:
+    from app.services.content_versions import cache_lesson_content
+    content = lesson_content(title)
+    assert cache_lesson_content(lesson_id, content, json.dumps(content))
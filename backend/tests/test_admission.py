@@ -0,0 +1,42 @@
+"""
+Admission control: route classes, queueing and shedding.
+"""
+import asyncio
+
+import pytest
+
+from app.services.admission import AdmissionPool, route_class
+
+@pytest.mark.parametrize("path, expected", [
+    ("/api/ai/lessons/7/generate", "ai"),
+    ("/api/ai/lessons/7/overview", "ai"),
+    ("/api/ai/lessons/7/content", "catalog"),
+    ("/api/courses/1/lessons", "catalog"),
+    ("/api/search", "catalog"),
+    ("/api/ai/lessons/7/progress", "default"),
+    ("/api/admin/courses/1/generate", "default"),
+    ("/health", None),
+    ("/metrics", None),
+])
+def test_route_classes(path, expected):
+    assert route_class(path) == expected
+
+def test_full_pool_queues_then_sheds():
+    pool = AdmissionPool("test", concurrency=1, queue=1, queue_timeout=0.2, retry_after=1)
+
+    async def scenario():
+        assert await pool.acquire() is None
+        queued = asyncio.create_task(pool.acquire())
+        await asyncio.sleep(0)
+        assert pool.waiting == 1
+        assert await pool.acquire() == "queue_full"
+
+        pool.release()  # Hands the slot to the queued request
+        assert await queued is None
+        assert pool.active == 1
+
+        assert await pool.acquire() == "queue_timeout"
+        pool.release()
+        assert pool.active == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,44 @@
+"""
+Lesson content fingerprints used to revalidate cached content.
+"""
+import pytest
+
+from app.database.config import SessionLocal
+from app.models import Lesson
+from app.services.ai_service import AIService
+from app.services.content_versions import lesson_fingerprint, lesson_inputs
+
+@pytest.fixture
+def ai_service(monkeypatch):
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test")
+    service = AIService()
+    calls = []
+    fingerprint = service.lesson_content_fingerprint
+
+    def counted(**inputs):
+        calls.append(inputs)
+        return fingerprint(**inputs)
+
+    monkeypatch.setattr(service, "lesson_content_fingerprint", counted)
+    return service, calls
+
+def test_fingerprint_is_memoised_until_the_lesson_changes(client, ai_service):
+    service, calls = ai_service
+    db = SessionLocal()
+    try:
+        lesson = db.query(Lesson).filter(Lesson.course_id == 1).order_by(Lesson.lesson_number).first()
+        first = lesson_fingerprint(service, lesson)
+        assert lesson_fingerprint(service, lesson) == first
+        assert len(calls) == 1
+
+        original_title = lesson.title
+        lesson.title = original_title + " (revised)"
+        db.commit()
+        revised = lesson_fingerprint(service, lesson)
+        assert revised != first
+        assert revised == service.lesson_content_fingerprint(**lesson_inputs(lesson))
+
+        lesson.title = original_title
+        db.commit()
+    finally:
+        db.close()
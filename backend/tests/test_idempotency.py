@@ -0,0 +1,69 @@
+"""
+Idempotency keys: replays, joins and conflicting reuse of a key.
+"""
+import pytest
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.testclient import TestClient
+
+from app.services.idempotency import IdempotencyMiddleware, IdempotencyStore
+
+PATH = "/api/ai/lessons/1/progress"
+
+@pytest.fixture
+def idempotent_client():
+    calls = []
+    app = FastAPI()
+
+    @app.post(PATH)
+    async def record(request: Request):
+        body = await request.json()
+        calls.append(body)
+        if body.get("fail"):
+            raise HTTPException(status_code=500, detail="Database unavailable")
+        return {"success": True, "call": len(calls)}
+
+    app.add_middleware(IdempotencyMiddleware, store=IdempotencyStore())
+    with TestClient(app) as client:
+        yield client, calls
+
+def test_same_key_and_body_is_replayed(idempotent_client):
+    client, calls = idempotent_client
+    first = client.post(PATH, json={"minutes": 5}, headers={"Idempotency-Key": "k1"})
+    second = client.post(PATH, json={"minutes": 5}, headers={"Idempotency-Key": "k1"})
+
+    assert first.status_code == second.status_code == 200
+    assert second.json() == first.json() == {"success": True, "call": 1}
+    assert second.headers["idempotent-replayed"] == "true"
+    assert "idempotent-replayed" not in first.headers
+    assert len(calls) == 1
+
+def test_same_key_with_another_body_is_refused(idempotent_client):
+    client, calls = idempotent_client
+    client.post(PATH, json={"minutes": 5}, headers={"Idempotency-Key": "k2"})
+    response = client.post(PATH, json={"minutes": 6}, headers={"Idempotency-Key": "k2"})
+
+    assert response.status_code == 422
+    assert len(calls) == 1
+
+def test_requests_without_a_key_always_run(idempotent_client):
+    client, calls = idempotent_client
+    client.post(PATH, json={"minutes": 5})
+    client.post(PATH, json={"minutes": 5})
+
+    assert len(calls) == 2
+
+def test_server_errors_are_not_stored(idempotent_client):
+    client, calls = idempotent_client
+    first = client.post(PATH, json={"fail": True}, headers={"Idempotency-Key": "k3"})
+    second = client.post(PATH, json={"fail": True}, headers={"Idempotency-Key": "k3"})
+
+    assert first.status_code == second.status_code == 500
+    assert "idempotent-replayed" not in second.headers
+    assert len(calls) == 2
+
+def test_oversized_key_is_rejected(idempotent_client):
+    client, calls = idempotent_client
+    response = client.post(PATH, json={"minutes": 5}, headers={"Idempotency-Key": "k" * 300})
+
+    assert response.status_code == 400
+    assert not calls
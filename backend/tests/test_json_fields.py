@@ -0,0 +1,20 @@
+"""
+Exercise difficulty counts: the SQL expansion and the Python fallback agree.
+"""
+from app.database.config import SessionLocal
+from app.database.json_fields import _count_exercise_difficulties, exercise_difficulty_counts
+
+from conftest import cache_content
+
+def test_fallback_counts_match_the_sql_expansion(client):
+    lessons = client.get("/api/courses/3").json()["course"]["lessons"]
+    for lesson in lessons[:2]:
+        cache_content(lesson["id"], lesson["title"])
+
+    db = SessionLocal()
+    try:
+        counts = exercise_difficulty_counts(db, 3)
+        assert counts.get("easy", 0) >= 2
+        assert _count_exercise_difficulties(db, 3) == counts
+    finally:
+        db.close()
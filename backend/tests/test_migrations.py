@@ -0,0 +1,57 @@
+"""
+The schema version gate and upgrading an older database.
+"""
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+from app.database.migrations import (
+    SCHEMA_VERSION, SchemaVersionError, check_schema_version, current_version, migrate, schema_version
+)
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'migrations.db'}")
+    yield engine
+    engine.dispose()
+
+def test_unversioned_database_is_refused(engine):
+    assert current_version(engine) == 0
+    with pytest.raises(SchemaVersionError):
+        check_schema_version(engine)
+
+def test_migrate_brings_a_new_database_to_the_current_version(engine):
+    assert migrate(engine, seed=False) == SCHEMA_VERSION
+    assert check_schema_version(engine) == SCHEMA_VERSION
+    assert migrate(engine, seed=False) == SCHEMA_VERSION  # Idempotent
+
+def test_version_7_database_is_refused_then_upgraded(engine):
+    migrate(engine, seed=False)
+    # Roll the database back to how version 7 left it: progress in whole minutes only
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE user_progress DROP COLUMN time_spent_seconds"))
+        conn.execute(schema_version.delete().where(schema_version.c.version == 8))
+        conn.execute(text(
+            "INSERT INTO user_progress (user_id, lesson_id, course_id, completion_percentage, time_spent_minutes, "
+            "is_completed, last_accessed) VALUES ('old-user', 1, 1, 50, 3, 0, CURRENT_TIMESTAMP)"
+        ))
+
+    with pytest.raises(SchemaVersionError):
+        check_schema_version(engine)
+
+    migrate(engine, seed=False)
+
+    assert check_schema_version(engine) == SCHEMA_VERSION
+    assert "time_spent_seconds" in {column["name"] for column in inspect(engine).get_columns("user_progress")}
+    with engine.connect() as conn:
+        seconds = conn.execute(text("SELECT time_spent_seconds FROM user_progress WHERE user_id = 'old-user'")).scalar()
+    assert seconds == 180
+
+def test_newer_database_is_refused(engine):
+    migrate(engine, seed=False)
+    with engine.begin() as conn:
+        conn.execute(schema_version.insert().values(version=SCHEMA_VERSION + 1, description="from the future"))
+
+    with pytest.raises(SchemaVersionError):
+        check_schema_version(engine)
+    with pytest.raises(SchemaVersionError):
+        migrate(engine, seed=False)
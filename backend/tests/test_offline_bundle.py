@@ -0,0 +1,104 @@
+"""
+Offline course bundles: full downloads match their manifest byte for byte.
+"""
+import io
+import json
+import zipfile
+import zlib
+
+import pytest
+
+from app.database.query_tracker import track_queries
+from app.services import offline_bundle
+
+from conftest import cache_content
+
+COURSE_ID = 2
+
+@pytest.fixture(scope="module")
+def course_with_content(client):
+    lessons = client.get(f"/api/courses/{COURSE_ID}").json()["course"]["lessons"]
+    for lesson in lessons:
+        cache_content(lesson["id"], lesson["title"])
+    return lessons
+
+@pytest.mark.parametrize("fmt", ["zip", "ndjson"])
+def test_full_bundle_matches_manifest(client, course_with_content, fmt):
+    manifest = offline_bundle.get_manifest(COURSE_ID, fmt)
+    assert [entry.lesson_id for entry in manifest.entries[1:]] == [lesson["id"] for lesson in course_with_content]
+
+    body = b"".join(offline_bundle.stream_bundle(manifest))
+
+    assert len(body) == manifest.length
+    if fmt == "zip":
+        with zipfile.ZipFile(io.BytesIO(body)) as archive:
+            assert archive.testzip() is None
+            infos = archive.infolist()
+            assert [info.filename for info in infos] == [entry.name for entry in manifest.entries]
+            assert [info.CRC for info in infos] == [entry.crc for entry in manifest.entries]
+    else:
+        lines = body.splitlines(keepends=True)
+        assert [zlib.crc32(line) for line in lines] == [entry.crc for entry in manifest.entries]
+        assert [json.loads(line)["type"] for line in lines] == ["course"] + ["lesson"] * len(course_with_content)
+
+def test_download_route_sends_the_whole_bundle(client, course_with_content):
+    manifest = offline_bundle.get_manifest(COURSE_ID, "zip")
+
+    response = client.get(f"/api/courses/{COURSE_ID}/offline")
+
+    assert response.status_code == 200
+    assert response.headers["etag"] == manifest.etag
+    assert int(response.headers["content-length"]) == manifest.length
+    assert response.content == b"".join(offline_bundle.stream_bundle(manifest))
+
+def test_no_query_while_the_lesson_cursor_is_open(course_with_content):
+    # MySQL streams the lessons through an unbuffered cursor; any other query on
+    # the session before it is exhausted would discard the unread rows
+    manifest = offline_bundle.get_manifest(COURSE_ID, "zip")
+
+    with track_queries() as stats:
+        for _ in offline_bundle.stream_bundle(manifest):
+            pass
+
+    # The lesson content cursor is the last statement, and runs once
+    statements = list(stats.shapes)
+    assert "lesson_content.ai_generated_content" in statements[-1]
+    assert stats.shapes[statements[-1]] == 1
+
+def test_range_request_returns_the_matching_bytes(client, course_with_content):
+    full = client.get(f"/api/courses/{COURSE_ID}/offline").content
+    etag = offline_bundle.get_manifest(COURSE_ID, "zip").etag
+
+    response = client.get(f"/api/courses/{COURSE_ID}/offline", headers={"Range": "bytes=100-1099", "If-Range": etag})
+
+    assert response.status_code == 206
+    assert response.headers["content-range"] == f"bytes 100-1099/{len(full)}"
+    assert response.content == full[100:1100]
+
+def test_resuming_from_any_offset_completes_the_bundle(client, course_with_content):
+    full = client.get(f"/api/courses/{COURSE_ID}/offline").content
+    for offset in (1, len(full) // 3, len(full) - 1):
+        response = client.get(f"/api/courses/{COURSE_ID}/offline", headers={"Range": f"bytes={offset}-"})
+        assert response.status_code == 206
+        assert full[:offset] + response.content == full
+
+    suffix = client.get(f"/api/courses/{COURSE_ID}/offline", headers={"Range": "bytes=-50"})
+    assert suffix.status_code == 206 and suffix.content == full[-50:]
+
+def test_stale_if_range_sends_the_whole_bundle(client, course_with_content):
+    full = client.get(f"/api/courses/{COURSE_ID}/offline").content
+
+    response = client.get(
+        f"/api/courses/{COURSE_ID}/offline", headers={"Range": "bytes=100-199", "If-Range": '"outdated"'}
+    )
+
+    assert response.status_code == 200
+    assert response.content == full
+
+def test_unsatisfiable_range_is_refused(client, course_with_content):
+    length = offline_bundle.get_manifest(COURSE_ID, "zip").length
+
+    response = client.get(f"/api/courses/{COURSE_ID}/offline", headers={"Range": f"bytes={length}-"})
+
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{length}"
@@ -0,0 +1,34 @@
+"""
+Course page cache invalidation.
+"""
+from app.services.page_cache import PageCache
+
+def test_page_built_before_a_progress_write_is_not_served():
+    cache = PageCache(ttl=60)
+    generation = cache.generation(1, "alice")
+    cache.invalidate(1, "alice")  # A progress write lands while the page is built
+
+    cache.put(1, "alice", {"progress": "stale"}, generation)
+
+    assert cache.get(1, "alice") is None
+
+def test_invalidating_one_user_keeps_other_pages():
+    cache = PageCache(ttl=60)
+    cache.put(1, "alice", {"user": "alice"}, cache.generation(1, "alice"))
+    cache.put(1, "bob", {"user": "bob"}, cache.generation(1, "bob"))
+
+    cache.invalidate(1, "alice")
+
+    assert cache.get(1, "alice") is None
+    assert cache.get(1, "bob") is not None
+
+def test_dropped_user_generations_still_reject_older_pages():
+    cache = PageCache(ttl=60, max_entries=2)
+    generation = cache.generation(1, "alice")
+    cache.invalidate(1, "alice")
+    cache.invalidate(1, "bob")
+    cache.invalidate(1, "carol")  # Drops alice's generation from the table
+
+    cache.put(1, "alice", {"progress": "stale"}, generation)
+
+    assert cache.get(1, "alice") is None
@@ -0,0 +1,45 @@
+"""
+Keyset pagination of the lesson listing.
+"""
+from app.database.pagination import encode_cursor
+
+def all_lesson_ids(client, course_id):
+    return [lesson["id"] for lesson in client.get(f"/api/courses/{course_id}").json()["course"]["lessons"]]
+
+def test_paging_visits_every_lesson_once(client):
+    expected = all_lesson_ids(client, 1)
+    seen, cursor, pages = [], None, 0
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        page = client.get("/api/courses/1/lessons", params=params).json()
+        seen += [lesson["id"] for lesson in page["lessons"]]
+        pages += 1
+        cursor = page["next_cursor"]
+        assert page["has_more"] == (cursor is not None)
+        if cursor is None:
+            break
+
+    assert seen == expected
+    assert pages == (len(expected) + 1) // 2
+
+def test_page_that_exactly_fills_the_limit_is_the_last(client):
+    count = len(all_lesson_ids(client, 1))
+    page = client.get("/api/courses/1/lessons", params={"limit": count}).json()
+
+    assert len(page["lessons"]) == count
+    assert page["next_cursor"] is None and page["has_more"] is False
+
+def test_cursor_past_the_last_lesson_gives_an_empty_page(client):
+    page = client.get("/api/courses/1/lessons", params={"cursor": encode_cursor([10**6, 10**6])}).json()
+
+    assert page["lessons"] == [] and page["next_cursor"] is None
+
+def test_sparse_fieldset_keeps_the_id(client):
+    page = client.get("/api/courses/1/lessons", params={"limit": 1, "fields": "title"}).json()
+
+    assert set(page["lessons"][0]) == {"id", "title"}
+
+def test_malformed_or_foreign_cursors_are_rejected(client):
+    assert client.get("/api/courses/1/lessons", params={"cursor": "not-a-cursor!"}).status_code == 400
+    assert client.get("/api/courses/1/lessons", params={"cursor": encode_cursor([1])}).status_code == 400
+    assert client.get("/api/courses/1/lessons", params={"fields": "secret"}).status_code == 400
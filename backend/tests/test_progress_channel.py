@@ -0,0 +1,52 @@
+"""
+Progress channel flushes: a failed final write is retried, not lost.
+"""
+import asyncio
+
+from app.database.config import SessionLocal
+from app.models import UserProgress
+from app.services import progress_channel as channel_module
+from app.services.progress_channel import ProgressChannel, ProgressTracker
+
+USER_ID = "channel-test-user"
+
+class ClosedWebSocket:
+    async def send_json(self, message):
+        raise RuntimeError("closed")
+
+def stored_seconds(lesson_id: int):
+    db = SessionLocal()
+    try:
+        progress = db.query(UserProgress).filter(
+            UserProgress.user_id == USER_ID, UserProgress.lesson_id == lesson_id
+        ).first()
+        return progress.time_spent_seconds if progress else None
+    finally:
+        db.close()
+
+def test_failed_disconnect_flush_is_retried_by_the_next_flush(client, monkeypatch):
+    lesson = client.get("/api/courses/3").json()["course"]["lessons"][0]
+    channel = ProgressChannel()
+    tracker = ProgressTracker(ClosedWebSocket(), USER_ID, lesson["id"], 3)
+    tracker.pending_seconds = 42
+    tracker.heartbeat(completion_percentage=60)
+
+    persist = channel_module.persist
+
+    def failing_persist(updates):
+        raise RuntimeError("database unavailable")
+
+    async def scenario():
+        # The connection has closed (it is no longer tracked) and its final write fails
+        monkeypatch.setattr(channel_module, "persist", failing_persist)
+        await channel.flush([tracker], trigger="disconnect")
+        assert stored_seconds(lesson["id"]) is None
+        assert len(channel._pending) == 1
+
+        monkeypatch.setattr(channel_module, "persist", persist)
+        await channel.flush([], trigger="interval")
+
+    asyncio.run(scenario())
+
+    assert stored_seconds(lesson["id"]) == 42
+    assert not channel._pending
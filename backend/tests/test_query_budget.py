@@ -0,0 +1,22 @@
+"""
+Query budgets of the catalog routes, run against a seeded SQLite database.
+
+Run from backend/ with ``python -m pytest``.
+"""
+from app.database.query_tracker import assert_max_queries
+
+from conftest import cache_content
+
+def test_course_details_query_budget(client):
+    lessons = client.get("/api/courses/1").json()["course"]["lessons"]
+    assert len(lessons) > 1
+    cache_content(lessons[0]["id"], lessons[0]["title"])
+
+    # The course and its lessons, whatever the lesson count: no lazy load per lesson
+    with assert_max_queries(2, allow_repeated=False):
+        response = client.get("/api/courses/1")
+
+    assert response.status_code == 200
+    has_content = {lesson["id"]: lesson["has_content"] for lesson in response.json()["course"]["lessons"]}
+    assert has_content[lessons[0]["id"]] is True
+    assert not any(has_content[lesson["id"]] for lesson in lessons[1:])
@@ -0,0 +1,68 @@
+"""
+Sliding-window generation quotas.
+"""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import quotas
+from app.services.quotas import MemoryStore, Quota, QuotaExceeded, QuotaLedger, retry_after, sliding_count
+
+NOW = 1_000_000.0 * 60 + 30  # Halfway through a 60-second bucket
+
+@pytest.fixture(autouse=True)
+def frozen_time(monkeypatch):
+    monkeypatch.setattr(quotas, "QUOTA_ENABLED", True)
+    monkeypatch.setattr(quotas, "time", SimpleNamespace(time=lambda: NOW))
+
+def test_sliding_count_weights_the_previous_bucket_by_its_overlap():
+    assert sliding_count(current=2, previous=10, elapsed=15, window=60) == pytest.approx(9.5)
+    assert sliding_count(current=2, previous=10, elapsed=60, window=60) == pytest.approx(2)
+
+def test_retry_after_waits_for_the_previous_bucket_to_slide_out():
+    # 10 requests last bucket, none this one, limit 5, 30s in: wait until 4/10 of it overlaps
+    assert retry_after(5, current=0, previous=10, elapsed=30, window=60) == 6
+    assert retry_after(5, current=1, previous=0, elapsed=30, window=60) == 1
+
+def test_request_quota_refuses_once_spent_per_user():
+    ledger = QuotaLedger(store=MemoryStore(), quotas=(Quota("user", "requests", 2, 60),))
+
+    async def scenario():
+        await ledger.admit("alice", "10.0.0.1")
+        await ledger.admit("alice", "10.0.0.1")
+        with pytest.raises(QuotaExceeded) as refused:
+            await ledger.admit("alice", "10.0.0.1")
+        assert refused.value.retry_after >= 1
+        await ledger.admit("bob", "10.0.0.1")  # Another user has their own budget
+        await ledger.admit("anonymous", "10.0.0.1")  # Not charged to a user
+
+    asyncio.run(scenario())
+
+def test_token_quota_is_charged_after_the_call():
+    ledger = QuotaLedger(store=MemoryStore(), quotas=(Quota("ip", "tokens", 100, 3600),))
+
+    async def scenario():
+        charge = await ledger.admit(None, "10.0.0.2")
+        await charge.add_tokens({"prompt_tokens": 90, "completion_tokens": 60})
+        with pytest.raises(QuotaExceeded):
+            await ledger.admit(None, "10.0.0.2")
+        await ledger.admit(None, "10.0.0.3")
+
+    asyncio.run(scenario())
+
+def test_store_failures_admit_the_request():
+    class BrokenStore:
+        async def counts(self, quota, subject, index):
+            raise ConnectionError("redis is down")
+
+        async def add(self, quota, subject, index, amount):
+            raise ConnectionError("redis is down")
+
+    ledger = QuotaLedger(store=BrokenStore(), quotas=(Quota("user", "requests", 1, 60),))
+
+    async def scenario():
+        await ledger.admit("alice", None)
+        await ledger.admit("alice", None)
+
+    asyncio.run(scenario())
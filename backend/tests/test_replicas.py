@@ -0,0 +1,19 @@
+"""
+Falling back to the primary when a replica read fails.
+"""
+from sqlalchemy import func, select
+
+from app.database.replicas import Replica
+from app.models import Course
+
+def test_failed_replica_read_is_rerun_on_the_primary(client, tmp_path):
+    # A replica whose database cannot be opened fails every connection with OperationalError
+    replica = Replica(f"sqlite:///{tmp_path / 'missing' / 'replica.db'}")
+    db = replica.SessionLocal()
+    try:
+        assert db.query(Course).count() == 3
+        assert replica.healthy is False
+        assert db.scalar(select(func.count()).select_from(Course)) == 3  # Stays on the primary
+    finally:
+        db.close()
+        replica.engine.dispose()
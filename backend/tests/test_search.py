@@ -0,0 +1,21 @@
+"""
+Search query parsing and the in-memory BM25 index.
+"""
+from app.services.search import InMemorySearchIndex, boolean_mode_query
+
+def test_boolean_query_drops_terms_innodb_does_not_index():
+    # "py" is too short and "what" is an InnoDB stopword; either would zero the result
+    assert boolean_mode_query("what py data ") == "+data"
+    assert boolean_mode_query("pandas da") == "+pandas +da*"
+    assert boolean_mode_query("is to ") == ""
+
+def test_in_memory_index_ranks_title_matches_first():
+    index = InMemorySearchIndex()
+    index.add("lesson", 1, "Cleaning data", 1, {"title": "Cleaning data", "description": "Handle pandas frames"})
+    index.add("lesson", 2, "Pandas basics", 1, {"title": "Pandas basics", "description": "Series and frames"})
+    index.add("lesson", 3, "Plotting", 1, {"title": "Plotting", "description": "Charts"})
+
+    hits = index.search("pandas frames ", 10)
+
+    assert [hit.id for hit in hits] == [2, 1]
+    assert [hit.id for hit in index.search("plot", 10)] == [3]
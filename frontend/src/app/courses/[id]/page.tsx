@@ -2,12 +2,12 @@
 
 import { useState, useEffect } from 'react';
 import { motion } from 'framer-motion';
-import { BookOpen, Clock, Users, ChevronLeft, Play, CheckCircle } from 'lucide-react';
+import { BookOpen, Clock, Users, ChevronLeft, Play, CheckCircle, Download } from 'lucide-react';
 import Link from 'next/link';
 import { useParams } from 'next/navigation';
 
-import { courseApi } from '@/lib/api';
-import type { Course } from '@/types';
+import { courseApi, apiUtils } from '@/lib/api';
+import type { Course, CourseBundleResponse } from '@/types';
 import { cn, formatDuration, getDifficultyColor } from '@/lib/utils';
 
 export default function CourseDetailPage() {
@@ -15,6 +15,7 @@ export default function CourseDetailPage() {
   const courseId = parseInt(params?.id as string);
   
   const [course, setCourse] = useState<Course | null>(null);
+  const [progress, setProgress] = useState<CourseBundleResponse['progress']>(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
 
@@ -27,8 +28,9 @@ export default function CourseDetailPage() {
       }
 
       try {
-        const response = await courseApi.getCourse(courseId);
+        const response = await courseApi.getCourseBundle(courseId, apiUtils.getUserId());
         setCourse(response.course);
+        setProgress(response.progress);
       } catch (err) {
         setError('Failed to load course. Please try again later.');
         console.error('Error fetching course:', err);
@@ -117,6 +119,21 @@ export default function CourseDetailPage() {
                 <Users className="w-5 h-5" />
                 <span>{Math.floor(Math.random() * 1000) + 200}+ students enrolled</span>
               </div>
+
+              {progress && progress.completion_percentage > 0 && (
+                <div className="mb-8">
+                  <div className="flex items-center justify-between text-sm text-neutral-600 mb-2">
+                    <span>{progress.completed_lessons} of {progress.total_lessons} lessons completed</span>
+                    <span>{Math.round(progress.completion_percentage)}%</span>
+                  </div>
+                  <div className="w-full h-2 bg-neutral-200 rounded-full overflow-hidden">
+                    <div
+                      className="h-full bg-primary-600 rounded-full"
+                      style={{ width: `${progress.completion_percentage}%` }}
+                    />
+                  </div>
+                </div>
+              )}
               
               <div className="flex flex-col sm:flex-row gap-4">
                 {course.lessons && course.lessons.length > 0 && (
@@ -128,6 +145,14 @@ export default function CourseDetailPage() {
                     <span>Start Learning</span>
                   </Link>
                 )}
+                <a
+                  href={courseApi.offlineBundleUrl(course.id)}
+                  download
+                  className="btn-outline flex items-center space-x-2"
+                >
+                  <Download className="w-5 h-5" />
+                  <span>Download for Offline</span>
+                </a>
                 <button className="btn-outline">
                   Save for Later
                 </button>
@@ -197,8 +222,11 @@ export default function CourseDetailPage() {
                       </div>
                       
                       <div className="flex items-center space-x-2">
-                        {lesson.has_content && (
-                          <CheckCircle className="w-5 h-5 text-accent-600" />
+                        {(lesson.progress?.is_completed || lesson.has_content) && (
+                          <CheckCircle className={cn(
+                            "w-5 h-5",
+                            lesson.progress?.is_completed ? "text-primary-600" : "text-accent-600"
+                          )} />
                         )}
                         <Play className="w-5 h-5 text-neutral-400 group-hover:text-primary-600 transition-colors" />
                       </div>
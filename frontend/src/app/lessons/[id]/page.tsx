@@ -1,12 +1,12 @@
 'use client';
 
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { motion } from 'framer-motion';
 import { ChevronLeft, Brain, Clock, CheckCircle, Play, Loader2 } from 'lucide-react';
 import Link from 'next/link';
 import { useParams } from 'next/navigation';
 
-import { courseApi, aiApi, apiUtils } from '@/lib/api';
+import { courseApi, aiApi, apiUtils, progressChannel } from '@/lib/api';
 import type { Lesson, LessonContent } from '@/types';
 import { formatDuration } from '@/lib/utils';
 
@@ -60,6 +60,27 @@ export default function LessonPage() {
     fetchLesson();
   }, [lessonId]);
 
+  // Report reading time and how far the lesson has been scrolled
+  const hasContent = useRef(false);
+  hasContent.current = content !== null;
+
+  useEffect(() => {
+    if (!lesson) return;
+
+    const channel = progressChannel.open(lesson.id, apiUtils.getUserId());
+    const onScroll = () => {
+      const scrollable = document.documentElement.scrollHeight - window.innerHeight;
+      const percentage = scrollable > 0 ? (window.scrollY / scrollable) * 100 : 100;
+      channel.report(percentage, hasContent.current && percentage >= 99);
+    };
+
+    window.addEventListener('scroll', onScroll, { passive: true });
+    return () => {
+      window.removeEventListener('scroll', onScroll);
+      channel.close();
+    };
+  }, [lesson]);
+
   const generateContent = async () => {
     if (!lesson) return;
 
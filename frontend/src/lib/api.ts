@@ -2,11 +2,14 @@ import axios from 'axios';
 import type {
   CoursesResponse,
   CourseResponse,
+  CourseBundleResponse,
   LessonsResponse,
   LessonResponse,
   LessonOverviewResponse,
   LessonContentResponse,
   ProgressResponse,
+  ProgressSavedMessage,
+  PageParams,
   GenerateLessonRequest,
   UpdateProgressRequest,
 } from '@/types';
@@ -20,10 +23,17 @@ const api = axios.create({
   },
 });
 
+// Latest X-Consistency-Token from a write; echoing it back keeps our own
+// reads on the primary database until the read replicas have caught up
+let consistencyToken: string | null = null;
+
 // Request interceptor for logging
 api.interceptors.request.use(
   (config) => {
     console.log(`API Request: ${config.method?.toUpperCase()} ${config.url}`);
+    if (consistencyToken) {
+      config.headers['X-Consistency-Token'] = consistencyToken;
+    }
     return config;
   },
   (error) => {
@@ -35,6 +45,10 @@ api.interceptors.request.use(
 // Response interceptor for error handling
 api.interceptors.response.use(
   (response) => {
+    const token = response.headers['x-consistency-token'];
+    if (token) {
+      consistencyToken = token;
+    }
     return response;
   },
   (error) => {
@@ -45,6 +59,20 @@ api.interceptors.response.use(
       throw new Error('Resource not found');
     } else if (error.response?.status === 500) {
       throw new Error('Server error occurred');
+    } else if (error.response?.status === 429) {
+      const retryAfter = error.response.headers?.['retry-after'];
+      throw new Error(
+        retryAfter
+          ? `You have reached your lesson generation limit - please try again in ${retryAfter} seconds`
+          : 'You have reached your lesson generation limit - please try again later'
+      );
+    } else if (error.response?.status === 503) {
+      const retryAfter = error.response.headers?.['retry-after'];
+      throw new Error(
+        retryAfter
+          ? `The server is busy - please try again in ${retryAfter} seconds`
+          : 'The server is busy - please try again shortly'
+      );
     } else if (error.code === 'ECONNABORTED') {
       throw new Error('Request timeout - the operation took too long');
     } else if (!error.response) {
@@ -58,8 +86,8 @@ api.interceptors.response.use(
 // Course API functions
 export const courseApi = {
   // Get all courses
-  async getAllCourses(): Promise<CoursesResponse> {
-    const response = await api.get('/api/courses');
+  async getAllCourses(params: PageParams = {}): Promise<CoursesResponse> {
+    const response = await api.get('/api/courses', { params });
     return response.data;
   },
 
@@ -69,9 +97,23 @@ export const courseApi = {
     return response.data;
   },
 
+  // Get everything the course page shows (course, lessons, the user's progress) in one request
+  async getCourseBundle(courseId: number, userId?: string): Promise<CourseBundleResponse> {
+    const response = await api.get(`/api/courses/${courseId}/bundle`, {
+      params: userId ? { user_id: userId } : {},
+    });
+    return response.data;
+  },
+
+  // URL of the course and all of its lesson content as one download; the browser
+  // can resume it with Range requests if the connection drops
+  offlineBundleUrl(courseId: number, format: 'zip' | 'ndjson' = 'zip'): string {
+    return `${api.defaults.baseURL}/api/courses/${courseId}/offline?format=${format}`;
+  },
+
   // Get lessons for a course
-  async getCourseLessons(courseId: number): Promise<LessonsResponse> {
-    const response = await api.get(`/api/courses/${courseId}/lessons`);
+  async getCourseLessons(courseId: number, params: PageParams = {}): Promise<LessonsResponse> {
+    const response = await api.get(`/api/courses/${courseId}/lessons`, { params });
     return response.data;
   },
 
@@ -82,6 +124,32 @@ export const courseApi = {
   },
 };
 
+// Idempotency-Key of each logical POST. The key is kept until an attempt
+// succeeds, so retrying the same request after a timeout or an error reuses it.
+// The server then replays the original result instead of redoing the work.
+// Responses that mean "not carried out" (5xx, 429) are not stored by the server,
+// so those retries run again.
+const pendingIdempotencyKeys = new Map<string, string>();
+
+function newIdempotencyKey(): string {
+  if (typeof crypto !== 'undefined' && typeof crypto.randomUUID === 'function') {
+    return crypto.randomUUID();
+  }
+  return `${Date.now().toString(36)}-${Math.random().toString(36).substring(2)}${Math.random().toString(36).substring(2)}`;
+}
+
+async function idempotentPost<T>(url: string, body: object): Promise<T> {
+  const operation = `${url} ${JSON.stringify(body)}`;
+  let key = pendingIdempotencyKeys.get(operation);
+  if (!key) {
+    key = newIdempotencyKey();
+    pendingIdempotencyKeys.set(operation, key);
+  }
+  const response = await api.post(url, body, { headers: { 'Idempotency-Key': key } });
+  pendingIdempotencyKeys.delete(operation);
+  return response.data;
+}
+
 // AI API functions
 export const aiApi = {
   // Generate lesson overview
@@ -89,8 +157,7 @@ export const aiApi = {
     lessonId: number,
     request: GenerateLessonRequest = {}
   ): Promise<LessonOverviewResponse> {
-    const response = await api.post(`/api/ai/lessons/${lessonId}/overview`, request);
-    return response.data;
+    return idempotentPost(`/api/ai/lessons/${lessonId}/overview`, request);
   },
 
   // Generate full lesson content
@@ -98,8 +165,7 @@ export const aiApi = {
     lessonId: number,
     request: GenerateLessonRequest = {}
   ): Promise<LessonContentResponse> {
-    const response = await api.post(`/api/ai/lessons/${lessonId}/generate`, request);
-    return response.data;
+    return idempotentPost(`/api/ai/lessons/${lessonId}/generate`, request);
   },
 
   // Get cached lesson content
@@ -113,20 +179,110 @@ export const aiApi = {
     lessonId: number,
     request: UpdateProgressRequest
   ): Promise<{ success: boolean; message: string }> {
-    const response = await api.post(`/api/ai/lessons/${lessonId}/progress`, request);
-    return response.data;
+    return idempotentPost(`/api/ai/lessons/${lessonId}/progress`, request);
   },
 };
 
 // User progress API functions
 export const progressApi = {
   // Get user progress
-  async getUserProgress(userId: string): Promise<ProgressResponse> {
-    const response = await api.get(`/api/user/${userId}/progress`);
+  async getUserProgress(userId: string, params: PageParams = {}): Promise<ProgressResponse> {
+    const response = await api.get(`/api/user/${userId}/progress`, { params });
     return response.data;
   },
 };
 
+// Heartbeat interval of the lesson progress WebSocket (PROGRESS_HEARTBEAT_SECONDS on the server)
+const PROGRESS_HEARTBEAT_MS = 15000;
+
+export interface ProgressChannel {
+  report(completionPercentage: number, isCompleted?: boolean): void;
+  close(): void;
+}
+
+// Time on a lesson over one WebSocket instead of progress POSTs: heartbeats
+// while the page is visible, a pause while it is hidden. The server measures
+// the time and saves progress in batches, acknowledging each save.
+export const progressChannel = {
+  open(
+    lessonId: number,
+    userId: string,
+    onSaved?: (message: ProgressSavedMessage) => void
+  ): ProgressChannel {
+    const base = (api.defaults.baseURL || window.location.origin).replace(/^http/, 'ws');
+    const url = `${base}/api/ai/lessons/${lessonId}/progress/ws?user_id=${encodeURIComponent(userId)}`;
+    let socket: WebSocket | null = null;
+    let closed = false;
+    let retryDelay = 1000;
+    let completion = 0;
+    let completed = false;
+
+    const send = (message: object) => {
+      if (socket?.readyState === WebSocket.OPEN) {
+        socket.send(JSON.stringify(message));
+      }
+    };
+
+    const heartbeat = () => {
+      if (document.visibilityState === 'visible') {
+        send({ type: 'heartbeat', completion_percentage: completion, is_completed: completed });
+      }
+    };
+
+    const onVisibilityChange = () => {
+      if (document.visibilityState === 'visible') {
+        heartbeat();
+      } else {
+        send({ type: 'pause' });
+      }
+    };
+
+    const connect = () => {
+      if (closed) return;
+      socket = new WebSocket(url);
+      socket.onopen = () => {
+        retryDelay = 1000;
+        heartbeat();
+      };
+      socket.onmessage = (event) => {
+        const message = JSON.parse(event.data);
+        if (message.type === 'saved') {
+          consistencyToken = message.consistency_token;
+          onSaved?.(message);
+        }
+      };
+      socket.onclose = (event) => {
+        socket = null;
+        // 4404: the lesson does not exist, so reconnecting will not help
+        if (!closed && event.code !== 4404) {
+          setTimeout(connect, retryDelay);
+          retryDelay = Math.min(retryDelay * 2, 60000);
+        }
+      };
+    };
+
+    connect();
+    const timer = setInterval(heartbeat, PROGRESS_HEARTBEAT_MS);
+    document.addEventListener('visibilitychange', onVisibilityChange);
+
+    return {
+      report(completionPercentage: number, isCompleted = false) {
+        completion = Math.max(completion, Math.round(completionPercentage));
+        if (isCompleted && !completed) {
+          completed = true;
+          heartbeat(); // Completions are saved right away
+        }
+      },
+      close() {
+        closed = true;
+        clearInterval(timer);
+        document.removeEventListener('visibilitychange', onVisibilityChange);
+        socket?.close();
+      },
+    };
+  },
+};
+
 // Health check
 export const healthApi = {
   async checkHealth(): Promise<{ status: string; service: string; version: string }> {
@@ -27,6 +27,15 @@ export interface Lesson {
     id: number;
     title: string;
   };
+  progress?: LessonProgress | null;
+}
+
+export interface LessonProgress {
+  is_completed: boolean;
+  completion_percentage: number;
+  time_spent_minutes: number;
+  time_spent_seconds: number;
+  last_accessed: string;
 }
 
 export interface LessonContent {
@@ -54,6 +63,7 @@ export interface UserProgress {
   is_completed: boolean;
   completion_percentage: number;
   time_spent_minutes: number;
+  time_spent_seconds: number;
   last_accessed: string;
 }
 
@@ -72,7 +82,19 @@ export interface ApiResponse<T> {
   error?: string;
 }
 
-export interface CoursesResponse extends ApiResponse<Course[]> {
+// Keyset pagination: pass next_cursor back as `cursor` to get the next page
+export interface PageParams {
+  cursor?: string;
+  limit?: number;
+  fields?: string;
+}
+
+export interface Paginated {
+  next_cursor: string | null;
+  has_more: boolean;
+}
+
+export interface CoursesResponse extends ApiResponse<Course[]>, Paginated {
   courses: Course[];
 }
 
@@ -80,7 +102,20 @@ export interface CourseResponse extends ApiResponse<Course> {
   course: Course;
 }
 
-export interface LessonsResponse extends ApiResponse<Lesson[]> {
+// Course page in one request: course, ordered lessons and the user's progress
+export interface CourseBundleResponse extends ApiResponse<Course> {
+  course: Course;
+  progress: {
+    user_id: string;
+    completed_lessons: number;
+    total_lessons: number;
+    completion_percentage: number;
+    time_spent_minutes: number;
+    time_spent_seconds: number;
+  } | null;
+}
+
+export interface LessonsResponse extends ApiResponse<Lesson[]>, Paginated {
   course_title: string;
   lessons: Lesson[];
 }
@@ -111,10 +146,12 @@ export interface LessonContentResponse extends ApiResponse<LessonContent> {
   content: LessonContent;
   cached: boolean;
   has_content?: boolean;
+  version?: number;
+  stale?: boolean; // Out of date; a newer version is being generated
   generated_at: string;
 }
 
-export interface ProgressResponse extends ApiResponse<CourseProgress[]> {
+export interface ProgressResponse extends ApiResponse<CourseProgress[]>, Paginated {
   user_id: string;
   progress: CourseProgress[];
 }
@@ -166,6 +203,18 @@ export interface GenerateLessonRequest {
   user_id?: string;
 }
 
+// Acknowledgement of a batched write on the progress WebSocket
+export interface ProgressSavedMessage {
+  type: 'saved';
+  progress: {
+    lesson_id: number;
+    completion_percentage: number;
+    time_spent_seconds: number;
+    is_completed: boolean;
+  };
+  consistency_token: string;
+}
+
 export interface UpdateProgressRequest {
   user_id: string;
   completion_percentage?: number;
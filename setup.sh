@@ -99,6 +99,9 @@ else
     source venv/bin/activate
 fi
 
+# Apply schema migrations and load the default catalog (idempotent)
+python -m app.database.migrations
+
 # Start FastAPI server
 uvicorn app.main:app --reload --host 0.0.0.0 --port 8000
 EOF
@@ -139,6 +142,7 @@ else
     source venv/bin/activate
 fi
 
+python -m app.database.migrations
 uvicorn app.main:app --reload --host 0.0.0.0 --port 8000 &
 BACKEND_PID=$!
 